@@ -0,0 +1,34 @@
+import { API_BASE_URL } from './client';
+
+/**
+ * Поток изменений маршрутов пользователя (SSE, /api/events/)
+ */
+export const eventsApi = {
+  /**
+   * Подписаться на события route.*, point.*, image.* и resync
+   * @param {Function} onEvent - Вызывается с { type, data } на каждое событие
+   * @param {Function} onStatus - Вызывается с true при открытии потока и false при обрыве
+   * @returns {Function} Отписка (закрывает соединение)
+   */
+  subscribe: (onEvent, onStatus = () => {}) => {
+    if (typeof EventSource === 'undefined') {
+      onStatus(false);
+      return () => {};
+    }
+
+    // После обрыва EventSource переподключается сам и присылает Last-Event-ID
+    const source = new EventSource(`${API_BASE_URL}/api/events/`, { withCredentials: true });
+
+    source.onopen = () => onStatus(true);
+    source.onerror = () => onStatus(false);
+    source.onmessage = (message) => {
+      try {
+        onEvent(JSON.parse(message.data));
+      } catch (error) {
+        console.error('Error parsing route event:', error);
+      }
+    };
+
+    return () => source.close();
+  },
+};
@@ -11,6 +11,7 @@ export { authApi } from './auth';
 // Экспортируем API модули
 export { routesApi } from './routes';
 export { pointsApi } from './points';
+export { eventsApi } from './events';
 
 // Объединенный API объект для удобства
 export const api = {
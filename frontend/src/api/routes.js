@@ -32,6 +32,36 @@ export const routesApi = {
     }
   },
 
+  /**
+   * Получить краткие данные всех маршрутов (без точек)
+   * Маршруты загружаются постранично по курсору
+   * @param {number} pageSize - Размер страницы
+   * @returns {Promise} Массив маршрутов с points_count и images_count
+   */
+  getSummaries: async (pageSize = 50) => {
+    try {
+      const summaries = [];
+      let cursor = null;
+
+      do {
+        const params = { view: 'summary', page_size: pageSize };
+        if (cursor) {
+          params.cursor = cursor;
+        }
+        const response = await apiClient.get('routes/', { params });
+        summaries.push(...response.data.results);
+        cursor = response.data.next
+          ? new URL(response.data.next).searchParams.get('cursor')
+          : null;
+      } while (cursor);
+
+      return summaries;
+    } catch (error) {
+      console.error('Error fetching route summaries:', error);
+      throw error;
+    }
+  },
+
   /**
    * Получить маршрут по ID
    * @param {number} routeId - ID маршрута
@@ -110,5 +140,22 @@ export const routesApi = {
       console.error(`Error deleting route ${routeId}:`, error);
       throw error;
     }
+  },
+
+  /**
+   * Оптимизировать порядок точек маршрута (минимальная длина пути)
+   * @param {number} routeId - ID маршрута
+   * @param {Object} options - { pin_start, pin_end, time_budget_ms }
+   * @returns {Promise} { length_before, length_after, route }
+   */
+  optimize: async (routeId, options = {}) => {
+    try {
+      const response = await apiClient.post(`routes/${routeId}/optimize/`, options);
+      console.log(`✅ Route ${routeId} optimized:`, response.data.length_before, '→', response.data.length_after);
+      return response.data;
+    } catch (error) {
+      console.error(`Error optimizing route ${routeId}:`, error);
+      throw error;
+    }
   }
 };
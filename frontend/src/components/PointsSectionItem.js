@@ -11,7 +11,7 @@ const PointsSectionItem = React.memo(({ point, index, onEditPoint }) => {
     const processedImages = useMemo(() => {
         console.log(' PointsSectionItem processing images for:', point.name);
         console.log(' Raw images:', point.images);
-        const processed = processImages(point.images || []);
+        const processed = processImages(point.images || [], { preferThumbnail: true });
         console.log(' Processed images:', processed);
         return processed;
     }, [point.images, point.name]);
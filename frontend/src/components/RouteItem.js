@@ -1,13 +1,14 @@
 import React, { useState, useContext, useMemo } from 'react';
 import { RouteContext } from '../contexts/RouteContext';
 import { processImages } from '../utils/imageHelpers';
+import { formatDistance } from '../utils/formatters';
 import EditIcon from './SvgIcons/EditIcon';
 import DeleteIcon from './SvgIcons/DeleteIcon';
 import PhotoIcon from './SvgIcons/PhotoIcon';
 import ArrowDownIcon from './SvgIcons/ArrowDownIcon';
 
 const RouteItem = ({ route, onMouseEnter, onMouseLeave }) => {
-    const { startEditRoute, handleDeleteRoute, startViewRoute } = useContext(RouteContext);
+    const { startEditRoute, handleDeleteRoute, startViewRoute, loadRouteDetails } = useContext(RouteContext);
     const [showPoints, setShowPoints] = useState(false);
 
     // Обработка изображений для всех точек
@@ -15,7 +16,7 @@ const RouteItem = ({ route, onMouseEnter, onMouseLeave }) => {
         console.log('🖼️ RouteItem processing points for route:', route.name);
         return (route.points || []).map(point => {
             console.log('   Processing point:', point.name, 'with images:', point.images);
-            const processed = processImages(point.images || []);
+            const processed = processImages(point.images || [], { preferThumbnail: true });
             console.log('   Processed images:', processed);
             return {
                 ...point,
@@ -24,8 +25,14 @@ const RouteItem = ({ route, onMouseEnter, onMouseLeave }) => {
         });
     }, [route.points, route.name]);
 
+    // Краткие данные маршрута (без точек) содержат только счётчики
+    const isSummary = !route.points;
+    const pointsCount = isSummary ? (route.points_count || 0) : processedPoints.length;
+
     // Проверяем есть ли хоть одно изображение в маршруте
-    const hasAnyImages = processedPoints.some(point => point.processedImages && point.processedImages.length > 0);
+    const hasAnyImages = isSummary
+        ? route.images_count > 0
+        : processedPoints.some(point => point.processedImages && point.processedImages.length > 0);
 
     const handleEdit = (e) => {
         e.stopPropagation();
@@ -47,6 +54,9 @@ const RouteItem = ({ route, onMouseEnter, onMouseLeave }) => {
 
     const togglePoints = (e) => {
         e.stopPropagation();
+        if (isSummary && !showPoints) {
+            loadRouteDetails(route.id);
+        }
         setShowPoints(!showPoints);
     };
 
@@ -78,10 +88,13 @@ const RouteItem = ({ route, onMouseEnter, onMouseLeave }) => {
                 )}
 
                 {/* Точки маршрута (сворачиваемые) */}
-                {processedPoints.length > 0 && (
+                {pointsCount > 0 && (
                     <div className="route-points-wrapper" onClick={togglePoints}>
                         <ArrowDownIcon className={showPoints ? 'active' : ''} />
-                        <span>{processedPoints.length} точки</span>
+                        <span>
+                            {pointsCount} точки
+                            {route.length > 0 && ` · ${formatDistance(route.length)}`}
+                        </span>
                     </div>
                 )}
 
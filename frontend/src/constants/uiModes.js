@@ -41,4 +41,8 @@ export const ACTION_TYPES = {
     ADD_ROUTE: 'ADD_ROUTE',
     UPDATE_ROUTE: 'UPDATE_ROUTE',
     DELETE_ROUTE: 'DELETE_ROUTE',
+
+    // События потока /api/events/
+    UPSERT_ROUTE: 'UPSERT_ROUTE',
+    APPLY_ROUTE_EVENT: 'APPLY_ROUTE_EVENT',
 };
@@ -1,5 +1,5 @@
-import { useCallback } from 'react';
-import { routesApi, pointsApi } from '../api';
+import { useCallback, useEffect, useRef } from 'react';
+import { routesApi, pointsApi, eventsApi } from '../api';
 import { LIMITS, LIMIT_MESSAGES } from '../constants/limits';
 import { ACTION_TYPES, UI_MODE } from '../constants/uiModes';
 import { useAuth } from '../contexts/AuthContext';
@@ -23,7 +23,8 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
 
         try {
             dispatch({ type: ACTION_TYPES.SET_LOADING, payload: true });
-            const data = await routesApi.getAll();
+            // Для списка нужны только метаданные, точки загружаются по требованию
+            const data = await routesApi.getSummaries();
             dispatch({ type: ACTION_TYPES.FETCH_ROUTES_SUCCESS, payload: data });
         } catch (error) {
             console.error('Error fetching routes:', error);
@@ -33,6 +34,55 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
         }
     }, [isAuthenticated, dispatch]);
 
+    // Открыт ли поток событий: пока да, после записи список не перезагружается
+    const eventsLive = useRef(false);
+
+    useEffect(() => {
+        if (!isAuthenticated) {
+            return undefined;
+        }
+        // События, записанные между загрузкой списка и открытием потока, в него
+        // не попадут: после первого открытия список загружается заново. Дальше
+        // пропущенное при переподключении досылается по Last-Event-ID
+        let opened = false;
+        const unsubscribe = eventsApi.subscribe(
+            (event) => {
+                if (event.type === 'resync') {
+                    fetchRoutes();
+                } else {
+                    dispatch({ type: ACTION_TYPES.APPLY_ROUTE_EVENT, payload: event });
+                }
+            },
+            (live) => {
+                eventsLive.current = live;
+                if (live && !opened) {
+                    opened = true;
+                    fetchRoutes();
+                }
+            }
+        );
+        return () => {
+            eventsLive.current = false;
+            unsubscribe();
+        };
+    }, [isAuthenticated, dispatch, fetchRoutes]);
+
+    const loadRouteDetails = useCallback(async (routeId) => {
+        const route = routes.find(r => r.id === routeId);
+        if (!route || route.points || !isAuthenticated) {
+            return route;
+        }
+
+        try {
+            const fullRoute = await routesApi.getById(routeId);
+            dispatch({ type: ACTION_TYPES.UPDATE_ROUTE, payload: fullRoute });
+            return fullRoute;
+        } catch (error) {
+            console.error(`Error loading route ${routeId}:`, error);
+            return route;
+        }
+    }, [routes, isAuthenticated, dispatch]);
+
     const startCreateRoute = useCallback(() => {
         let maxRoutes;
         if (isAuthenticated && profile) {
@@ -57,23 +107,23 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
         dispatch({ type: ACTION_TYPES.SET_UI_MODE, payload: UI_MODE.CREATE_ROUTE });
     }, [routes.length, isAuthenticated, profile, dispatch]);
 
-    const startEditRoute = useCallback((routeId) => {
-        const routeToEdit = routes.find(r => r.id === routeId);
+    const startEditRoute = useCallback(async (routeId) => {
+        const routeToEdit = await loadRouteDetails(routeId);
         if (routeToEdit) {
             const clonedRoute = structuredClone(routeToEdit);
             dispatch({ type: ACTION_TYPES.SET_CURRENT_ROUTE, payload: clonedRoute });
             dispatch({ type: ACTION_TYPES.SET_UI_MODE, payload: UI_MODE.EDIT_ROUTE });
         }
-    }, [routes, dispatch]);
+    }, [loadRouteDetails, dispatch]);
 
-    const startViewRoute = useCallback((routeId) => {
-        const routeToView = routes.find(r => r.id === routeId);
+    const startViewRoute = useCallback(async (routeId) => {
+        const routeToView = await loadRouteDetails(routeId);
         if (routeToView) {
             const clonedRoute = structuredClone(routeToView);
             dispatch({ type: ACTION_TYPES.SET_CURRENT_ROUTE, payload: clonedRoute });
             dispatch({ type: ACTION_TYPES.SET_UI_MODE, payload: UI_MODE.VIEW_ROUTE_DETAILS });
         }
-    }, [routes, dispatch]);
+    }, [loadRouteDetails, dispatch]);
 
     const handleSaveRoute = useCallback(async (routeData) => {
         console.log('💾 Starting route save process...');
@@ -142,7 +192,12 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
             }
 
             console.log('✅ All images processed');
-            await fetchRoutes();
+            if (eventsLive.current) {
+                // Изменения других полей и изображений придут событиями
+                dispatch({ type: ACTION_TYPES.UPSERT_ROUTE, payload: savedRoute });
+            } else {
+                await fetchRoutes();
+            }
             dispatch({ type: ACTION_TYPES.CLEAR_CURRENT_ROUTE });
             dispatch({ type: ACTION_TYPES.SET_UI_MODE, payload: UI_MODE.MAIN_LIST });
         } catch (error) {
@@ -178,7 +233,11 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
             dispatch({ type: ACTION_TYPES.SET_LOADING, payload: true });
             await routesApi.delete(routeId);
             console.log(`✅ Route ${routeId} deleted successfully`);
-            await fetchRoutes();
+            if (eventsLive.current) {
+                dispatch({ type: ACTION_TYPES.DELETE_ROUTE, payload: routeId });
+            } else {
+                await fetchRoutes();
+            }
         } catch (error) {
             console.error('Error deleting route:', error);
             alert('Ошибка при удалении маршрута.');
@@ -196,12 +255,12 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
         dispatch({ type: ACTION_TYPES.SET_QUICK_CREATE_MODE, payload: false });
     }, [dispatch]);
 
-    const handleRouteHoverStart = useCallback((routeId) => {
-        const route = routes.find(r => r.id === routeId);
+    const handleRouteHoverStart = useCallback(async (routeId) => {
+        const route = await loadRouteDetails(routeId);
         if (route) {
             dispatch({ type: ACTION_TYPES.SET_PREVIEW_ROUTE, payload: route });
         }
-    }, [routes, dispatch]);
+    }, [loadRouteDetails, dispatch]);
 
     const handleRouteHoverEnd = useCallback(() => {
         dispatch({ type: ACTION_TYPES.CLEAR_PREVIEW_ROUTE });
@@ -209,6 +268,7 @@ export const useRoutes = (state, dispatch, isAuthenticated) => {
 
     return {
         fetchRoutes,
+        loadRouteDetails,
         startCreateRoute,
         startEditRoute,
         startViewRoute,
@@ -16,6 +16,75 @@ export const initialState = {
     quickCreateMode: false,
 };
 
+/**
+ * Замена или добавление элемента массива по id
+ */
+const upsertById = (items, item, merge = (previous, next) => next) => {
+    const index = items.findIndex(existing => existing.id === item.id);
+    if (index === -1) {
+        return [...items, item];
+    }
+    const result = [...items];
+    result[index] = merge(items[index], item);
+    return result;
+};
+
+/**
+ * Изменение точек маршрута; точки ещё не загруженного маршрута не трогаем
+ */
+const updateRoutePoints = (routes, routeId, update) => routes.map(route =>
+    route.id === routeId && route.points ? { ...route, points: update(route.points) } : route
+);
+
+/**
+ * Применение события потока /api/events/ к списку маршрутов
+ * @param {Array} routes - Маршруты состояния
+ * @param {Object} event - { type, data }, см. map/route_events.py
+ * @returns {Array} Новый список маршрутов
+ */
+const applyRouteEvent = (routes, { type, data }) => {
+    switch (type) {
+        case 'route.created':
+        case 'route.updated':
+            // В событии только поля маршрута: уже загруженные точки сохраняем
+            return upsertById(routes, data, (previous, next) => ({ ...previous, ...next }));
+
+        case 'route.deleted':
+            return routes.filter(route => route.id !== data.id);
+
+        case 'point.created':
+        case 'point.updated': {
+            const { route: routeId, ...point } = data;
+            return updateRoutePoints(routes, routeId, points => upsertById(
+                points,
+                { ...point, images: [] },
+                (previous, next) => ({ ...previous, ...next, images: previous.images })
+            ).sort((a, b) => a.order - b.order));
+        }
+
+        case 'point.deleted':
+            return updateRoutePoints(routes, data.route, points => points.filter(point => point.id !== data.id));
+
+        case 'image.created':
+        case 'image.updated': {
+            const { point: pointId, route: routeId, ...image } = data;
+            return updateRoutePoints(routes, routeId, points => points.map(point =>
+                point.id === pointId ? { ...point, images: upsertById(point.images || [], image) } : point
+            ));
+        }
+
+        case 'image.deleted':
+            return updateRoutePoints(routes, data.route, points => points.map(point =>
+                point.id === data.point
+                    ? { ...point, images: (point.images || []).filter(image => image.id !== data.id) }
+                    : point
+            ));
+
+        default:
+            return routes;
+    }
+};
+
 export function appReducer(state, action) {
     switch (action.type) {
         // Загрузка и ошибки
@@ -96,6 +165,13 @@ export function appReducer(state, action) {
         case ACTION_TYPES.DELETE_ROUTE:
             return { ...state, routes: state.routes.filter(route => route.id !== action.payload) };
 
+        // События потока /api/events/
+        case ACTION_TYPES.UPSERT_ROUTE:
+            return { ...state, routes: upsertById(state.routes, action.payload) };
+
+        case ACTION_TYPES.APPLY_ROUTE_EVENT:
+            return { ...state, routes: applyRouteEvent(state.routes, action.payload) };
+
         default:
             return state;
     }
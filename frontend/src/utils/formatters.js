@@ -39,3 +39,16 @@ export const truncateText = (text, maxLength) => {
     }
     return text.substring(0, maxLength) + '...';
 };
+
+/**
+ * Форматирует длину маршрута (м или км)
+ * @param {number} meters - Длина в метрах
+ * @returns {string} - Отформатированная длина
+ */
+export const formatDistance = (meters) => {
+    const value = Number(meters) || 0;
+    if (value < 1000) {
+        return `${Math.round(value)} м`;
+    }
+    return `${(value / 1000).toFixed(value < 10000 ? 2 : 1)} км`;
+};
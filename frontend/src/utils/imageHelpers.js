@@ -3,9 +3,11 @@
  * Преобразует различные форматы изображений в единый массив URL строк
  *
  * @param {Array} images - Массив изображений в различных форматах
+ * @param {Object} options - Параметры
+ * @param {boolean} options.preferThumbnail - Использовать уменьшенную копию (для превью)
  * @returns {Array<string>} Массив URL строк изображений
  */
-export const processImages = (images) => {
+export const processImages = (images, { preferThumbnail = false } = {}) => {
     console.log('🖼️ processImages called with:', images);
 
     if (!images || !Array.isArray(images)) {
@@ -20,7 +22,7 @@ export const processImages = (images) => {
 
         // Объект с полем image (из Django API)
         if (img && typeof img === 'object' && img.image) {
-            let imageUrl = img.image;
+            let imageUrl = preferThumbnail && img.thumbnail ? img.thumbnail : img.image;
 
             // Если URL относительный, добавляем базовый URL
             if (imageUrl.startsWith('/media/')) {
@@ -18,7 +18,7 @@ class PointImageInline(admin.TabularInline):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-width: 100px; max-height: 100px;" />',
-                obj.image.url
+                obj.image.storage.url(obj.get_thumbnail_name())
             )
         return "Нет изображения"
 
@@ -59,7 +59,7 @@ class RouteAdmin(admin.ModelAdmin):
 
     def points_count(self, obj):
         """Количество точек в маршруте"""
-        return obj.points.count()
+        return obj.points_count
 
     points_count.short_description = 'Количество точек'
 
@@ -148,7 +148,7 @@ class PointImageAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-width: 200px; max-height: 200px; border-radius: 8px;" />',
-                obj.image.url
+                obj.image.storage.url(obj.get_thumbnail_name())
             )
         return "Нет изображения"
 
@@ -3,31 +3,335 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+import hashlib
 import logging
+import os
+import time
 
+from . import counters, route_cache, route_events, route_reader
 from .subscription_limits import get_max_routes, get_max_points_per_route
-from .serializers import RouteSerializer, PointSerializer, PointImageSerializer
-from .models import Route, Point, PointImage
+from .serializers import (
+    RouteSerializer,
+    RouteSummarySerializer,
+    PointSerializer,
+    PointImageSerializer,
+    ImageUploadJobSerializer,
+)
+from .pagination import RouteCursorPagination
+from .models import Route, Point, PointImage, ImageUploadJob
 from .image_validation import validate_image_file
+from .thumbnails import generate_derivatives
+from .image_jobs import enqueue_upload, pending_files_count, MAX_IMAGES_PER_POINT
+from .upload_handlers import ImageUploadHandler, get_upload_errors
+from .spatial import parse_bbox, filter_points_in_bbox
+from .clustering import get_clusters, MIN_ZOOM, MAX_ZOOM
+from .asgi import is_asgi_request, iterate_in_thread
+from .exporters import EXPORT_FORMATS
+from .importers import TrackImportError, detect_format, import_tracks
+from .route_stats import refresh_route_stats, save_route_stats
+from .route_optimization import optimize_order, DEFAULT_TIME_BUDGET_MS, MAX_TIME_BUDGET_MS
+from .signals import suppress_point_signals
+from .polyline import DEFAULT_PRECISION, MIN_PRECISION, MAX_PRECISION
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
 
+def get_bbox_param(request):
+    """
+    Разбор параметра ?bbox=minLon,minLat,maxLon,maxLat из запроса
+
+    Здесь и в get_polyline_precision request.GET, а не query_params: функции
+    используются и асинхронными представлениями с обычным HttpRequest.
+    """
+    try:
+        return parse_bbox(request.GET.get('bbox'))
+    except ValueError as e:
+        raise ValidationError({'bbox': str(e)})
+
+
+def get_polyline_precision(request):
+    """
+    Точность polyline для ?geometry=polyline[&precision=N] или None,
+    если координаты отдаются как обычно
+    """
+    geometry = request.GET.get('geometry')
+    if not geometry:
+        return None
+    if geometry != 'polyline':
+        raise ValidationError({'geometry': 'Поддерживается только geometry=polyline'})
+    try:
+        precision = int(request.GET.get('precision', DEFAULT_PRECISION))
+    except ValueError:
+        precision = None
+    if precision is None or not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValidationError({'precision': f'precision должен быть целым числом от {MIN_PRECISION} до {MAX_PRECISION}'})
+    return precision
+
+
+def log_upload_summary(point_id, status_code, started, files=0, saved=0, reason=None, job=None):
+    """Одна итоговая запись INFO на запрос загрузки изображений"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    data = {'point': point_id, 'status': status_code, 'files': files, 'saved': saved,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1)}
+    if reason:
+        data['reason'] = reason
+    if job:
+        data['job'] = job
+    logger.info("📤 Image upload", extra={'data': data})
+
+
 class RouteViewSet(viewsets.ModelViewSet):
     queryset = Route.objects.prefetch_related('points__images').all()
     permission_classes = [IsAuthenticated]
     serializer_class = RouteSerializer
+    pagination_class = RouteCursorPagination
+
+    def is_summary_view(self):
+        """?view=summary — только метаданные маршрутов и количество точек/изображений"""
+        return self.action == 'list' and self.request.query_params.get('view') == 'summary'
+
+    def get_serializer_class(self):
+        if self.is_summary_view():
+            return RouteSummarySerializer
+        return super().get_serializer_class()
 
     def get_serializer_context(self):
         """Передаём request в контекст сериализатора для валидации"""
         context = super().get_serializer_context()
         context['request'] = self.request
+        if self.action in ('list', 'retrieve'):
+            context['polyline_precision'] = get_polyline_precision(self.request)
         return context
 
+    def uses_fast_read(self):
+        """list/retrieve с точками собираются route_reader без ModelSerializer"""
+        return self.action in ('list', 'retrieve') and not self.is_summary_view() and route_reader.is_enabled()
+
     def get_queryset(self):
-        return Route.objects.filter(user=self.request.user).prefetch_related('points__images')
+        queryset = Route.objects.filter(user=self.request.user)
+        if not self.is_summary_view() and not self.uses_fast_read():
+            # В кратком виде количество точек и изображений берётся из счётчиков маршрута
+            queryset = queryset.prefetch_related('points__images')
+        bbox = get_bbox_param(self.request) if self.action == 'list' else None
+        if bbox:
+            # Маршруты, у которых хотя бы одна точка попадает в видимую область
+            visible_points = filter_points_in_bbox(Point.objects.all(), bbox)
+            queryset = queryset.filter(id__in=visible_points.values('route_id'))
+        return queryset
+
+    def get_cache_validators(self):
+        """
+        ETag и Last-Modified для list/retrieve по Route.updated_at (изменения точек
+        и изображений сдвигают updated_at маршрута, см. counters.py)
+
+        Считаются агрегатом по маршрутам без загрузки точек, поэтому 304 отдаётся
+        до сериализации.
+
+        Returns:
+            tuple: (etag, last_modified) или (None, None), если маршрут не найден
+        """
+        queryset = Route.objects.filter(user=self.request.user)
+        if self.action == 'retrieve':
+            try:
+                queryset = queryset.filter(pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            except (TypeError, ValueError):
+                return None, None
+        else:
+            bbox = get_bbox_param(self.request)
+            if bbox:
+                visible_points = filter_points_in_bbox(Point.objects.all(), bbox)
+                queryset = queryset.filter(id__in=visible_points.values('route_id'))
+        state = queryset.aggregate(count=Count('id'), last_id=Max('id'), last_modified=Max('updated_at'))
+        if self.action == 'retrieve' and not state['count']:
+            return None, None
+
+        last_modified = state['last_modified']
+        fingerprint = '|'.join(str(part) for part in (
+            self.action, self.request.user.pk, state['count'], state['last_id'],
+            last_modified.isoformat() if last_modified else '',
+            self.request.get_full_path(), self.request.get_host(), self.request.accepted_media_type,
+        ))
+        etag = quote_etag(hashlib.sha256(fingerprint.encode()).hexdigest()[:32])
+        return etag, int(last_modified.timestamp()) if last_modified else None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Ответ 304 по If-None-Match/If-Modified-Since, иначе обычный ответ с валидаторами"""
+        etag, last_modified = self.get_cache_validators()
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.cached_response(handler, etag, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Браузер хранит ответ, но перепроверяет его при каждом запросе
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def cached_response(self, handler, etag, request, *args, **kwargs):
+        """
+        Данные ответа из кэша маршрутов пользователя (см. route_cache.py)
+
+        Отпечаток запроса — ETag (состояние маршрутов, путь, хост, формат) и
+        схема, от которой зависят абсолютные URL изображений.
+        """
+        if not route_cache.is_enabled():
+            return handler(request, *args, **kwargs)
+        key = route_cache.response_key(request.user.pk, f'{etag}|{request.scheme}')
+        data = route_cache.get_data(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            route_cache.set_data(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        handler = self.fast_list if self.uses_fast_read() else super().list
+        return self.conditional_response(handler, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        handler = self.fast_retrieve if self.uses_fast_read() else super().retrieve
+        return self.conditional_response(handler, request, *args, **kwargs)
+
+    def fast_list(self, request, *args, **kwargs):
+        precision = get_polyline_precision(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            data = route_reader.build_routes([route_reader.route_row(route) for route in page], request, precision)
+            return self.get_paginated_response(data)
+        routes = queryset.values(*route_reader.ROUTE_READ_FIELDS)
+        return Response(route_reader.build_routes(routes, request, precision))
+
+    def fast_retrieve(self, request, *args, **kwargs):
+        precision = get_polyline_precision(request)
+        route = self.get_object()
+        return Response(route_reader.build_routes([route_reader.route_row(route)], request, precision)[0])
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Потоковая выгрузка маршрутов: ?fmt=geojson|gpx|kml
+
+        Необязательные параметры: route=<id> — один маршрут, bbox — видимая
+        область, all=1 — все маршруты базы (только для администраторов),
+        geometry=polyline[&precision=N] — компактный GeoJSON с polyline.
+        """
+        fmt = request.query_params.get('fmt', 'geojson').lower()
+        if fmt not in EXPORT_FORMATS:
+            raise ValidationError({'fmt': f'Поддерживаемые форматы: {", ".join(EXPORT_FORMATS)}'})
+        precision = get_polyline_precision(request)
+        if precision is not None and fmt != 'geojson':
+            raise ValidationError({'geometry': 'geometry=polyline поддерживается только для fmt=geojson'})
+
+        if request.query_params.get('all') in ('1', 'true') and request.user.is_staff:
+            routes = Route.objects.all()
+        else:
+            routes = Route.objects.filter(user=request.user)
+        route_id = request.query_params.get('route')
+        if route_id:
+            if not route_id.isdigit():
+                raise ValidationError({'route': 'id маршрута должен быть числом'})
+            routes = routes.filter(id=int(route_id))
+        bbox = get_bbox_param(request)
+        if bbox:
+            visible_points = filter_points_in_bbox(Point.objects.all(), bbox)
+            routes = routes.filter(id__in=visible_points.values('route_id'))
+
+        stream, content_type, extension = EXPORT_FORMATS[fmt]
+        chunks = stream(routes, polyline_precision=precision) if precision is not None else stream(routes)
+        if is_asgi_request(request):
+            # Синхронный итератор Django под ASGI собрал бы в память целиком
+            chunks = iterate_in_thread(chunks)
+        response = StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="routes.{extension}"'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def optimize(self, request, pk=None):
+        """
+        Переупорядочивание точек маршрута для минимальной длины пути
+
+        Параметры тела: pin_start (по умолчанию true), pin_end (false),
+        time_budget_ms (по умолчанию 50, максимум 500).
+        """
+        route = self.get_object()
+        pin_start = self.parse_flag(request.data.get('pin_start'), default=True)
+        pin_end = self.parse_flag(request.data.get('pin_end'), default=False)
+        try:
+            time_budget_ms = float(request.data.get('time_budget_ms', DEFAULT_TIME_BUDGET_MS))
+        except (TypeError, ValueError):
+            raise ValidationError({'time_budget_ms': 'Должно быть числом'})
+        time_budget_ms = min(max(time_budget_ms, 1), MAX_TIME_BUDGET_MS)
+
+        points = list(Point.objects.filter(route=route).order_by('order', 'id'))
+        order, length_before, length_after = optimize_order(
+            [float(point.lat) for point in points], [float(point.lon) for point in points],
+            pin_start=pin_start, pin_end=pin_end, time_budget_ms=time_budget_ms,
+        )
+
+        reordered = [points[index] for index in order]
+        moved_ids = [point.id for position, point in enumerate(reordered) if point.order != position]
+        if moved_ids:
+            with transaction.atomic():
+                for position, point in enumerate(reordered):
+                    point.order = position
+                # Координаты не меняются — кластеры пересчитывать не нужно
+                with suppress_point_signals():
+                    Point.objects.bulk_update(reordered, ['order'])
+                save_route_stats(route, [(point.lat, point.lon) for point in reordered])
+                counters.adjust_route_counters(route.id)
+                # bulk_update не отправляет сигналы
+                route_cache.schedule_invalidation(user_ids=[route.user_id])
+                route_events.schedule_changes('point', 'updated', moved_ids)
+            logger.info("🧭 Route %s optimized: %.0f m -> %.0f m", route.id, length_before, length_after)
+
+        route = self.get_queryset().get(pk=route.pk)
+        return Response({
+            'length_before': round(length_before, 2),
+            'length_after': round(length_after, 2),
+            'route': RouteSerializer(route, context=self.get_serializer_context()).data,
+        })
+
+    @staticmethod
+    def parse_flag(value, default):
+        if value is None:
+            return default
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() in ('1', 'true', 'yes')
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_tracks(self, request):
+        """
+        Импорт треков из файла: поле file (GPX, GeoJSON или CSV), необязательное fmt
+
+        Каждый трек становится маршрутом; плотные треки упрощаются до лимита
+        точек тарифа.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Файл не передан'})
+        try:
+            fmt = detect_format(upload.name, request.data.get('fmt'))
+            created = import_tracks(upload, fmt, request.user, default_name=os.path.splitext(upload.name)[0])
+        except TrackImportError as e:
+            raise ValidationError({'file': str(e)})
+        logger.info("📥 Imported %d route(s) from %s for user %s", len(created), upload.name, request.user.id)
+        return Response({'routes': created}, status=status.HTTP_201_CREATED)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -35,13 +339,16 @@ class RouteViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         user = self.request.user
         profile = user.profile
-        current_routes_count = user.routes.count()
         max_routes = get_max_routes(profile.get_subscription_status())
-        if current_routes_count >= max_routes:
-            from rest_framework.exceptions import ValidationError
-            raise ValidationError(
-                {'detail': f'Максимальное количество маршрутов ({max_routes}) достигнуто. Обновите подписку.'})
-        serializer.save(user=user)
+        error = {'detail': f'Максимальное количество маршрутов ({max_routes}) достигнуто. Обновите подписку.'}
+        if profile.routes_count >= max_routes:
+            raise ValidationError(error)
+        with transaction.atomic():
+            # Счётчик увеличивается в той же транзакции (сигнал post_save); UPDATE строки профиля
+            # сериализует параллельные создания, поэтому повторная проверка после него не допускает гонки
+            serializer.save(user=user)
+            if counters.current_routes_count(user.id) > max_routes:
+                raise ValidationError(error)
 
     def update(self, request, *args, **kwargs):
         # При обновлении маршрута проверяем количество точек
@@ -59,6 +366,43 @@ class PointViewSet(viewsets.ModelViewSet):
     queryset = Point.objects.prefetch_related('images').all()
     serializer_class = PointSerializer
 
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action == 'upload_image':
+            # Потоковая проверка файлов до буферизации тела запроса;
+            # обработчики нужно заменить до первого чтения request.data (в т.ч. проверкой CSRF)
+            request.upload_handlers.insert(0, ImageUploadHandler(request, max_files=MAX_IMAGES_PER_POINT))
+        return drf_request
+
+    def perform_update(self, serializer):
+        point = serializer.save()
+        refresh_route_stats([point.route_id])
+
+    def perform_destroy(self, instance):
+        route_id = instance.route_id
+        instance.delete()
+        refresh_route_stats([route_id])
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        bbox = get_bbox_param(self.request) if self.action == 'list' else None
+        if bbox:
+            queryset = filter_points_in_bbox(queryset, bbox)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Кластеры точек для масштаба и видимой области карты:
+        ?zoom=<0..21>&bbox=minLon,minLat,maxLon,maxLat
+        """
+        try:
+            zoom = int(request.query_params.get('zoom', ''))
+        except ValueError:
+            raise ValidationError({'zoom': f'zoom должен быть целым числом от {MIN_ZOOM} до {MAX_ZOOM}'})
+        bbox = get_bbox_param(request) or (-180.0, -90.0, 180.0, 90.0)
+        return Response(get_clusters(bbox, zoom, request.user.id))
+
     def get_serializer_context(self):
         """Передаём request в контекст сериализатора для валидации"""
         context = super().get_serializer_context()
@@ -69,46 +413,60 @@ class PointViewSet(viewsets.ModelViewSet):
     def upload_image(self, request, pk=None):
         """
         Загрузка изображений для точки с комплексной проверкой
+
+        С параметром ?async=1 файлы только сохраняются и ставятся в очередь
+        на обработку: ответ 202 содержит id задачи и URL для проверки статуса.
+
+        На уровне INFO запрос оставляет одну итоговую запись (log_upload_summary),
+        подробности — на уровне DEBUG.
         """
-        logger.info(f"\n{'#' * 80}")
-        logger.info(f"📤 UPLOAD IMAGE REQUEST RECEIVED")
-        logger.info(f"{'#' * 80}")
-        logger.info(f"Point ID: {pk}")
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Content-Type: {request.content_type}")
-        logger.info(f"FILES keys: {list(request.FILES.keys())}")
+        started = time.perf_counter()
+        logger.debug("📤 Upload request: point=%s content_type=%s files=%s",
+                     pk, request.content_type, list(request.FILES.keys()))
 
         try:
             point = self.get_object()
-            logger.info(f"✅ Point found: {point.name} (ID: {point.id})")
         except Point.DoesNotExist:
-            logger.error(f"❌ Point with ID {pk} not found")
+            log_upload_summary(pk, status.HTTP_404_NOT_FOUND, started, reason='point not found')
             return Response({'error': 'Point not found'}, status=status.HTTP_404_NOT_FOUND)
 
         images_data = request.FILES.getlist('images')
-        logger.info(f"📦 Received {len(images_data)} file(s)")
+        logger.debug("📦 Point %s: received %d file(s)", point.id, len(images_data))
+
+        upload_errors = get_upload_errors(request)
+        if upload_errors:
+            logger.debug("❌ Upload rejected while streaming: %s", upload_errors)
+            log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                               reason='rejected while streaming')
+            return Response(
+                {'error': 'Ошибки валидации файлов', 'details': upload_errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         if not images_data:
-            logger.error("❌ No images provided in request")
+            log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, reason='no images')
             return Response({'error': 'No images provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Проверка на количество существующих изображений
-        current_images_count = point.images.count()
-        MAX_IMAGES = 4
-        logger.info(f"📊 Current images: {current_images_count}/{MAX_IMAGES}")
+        async_mode = request.query_params.get('async') in ('1', 'true')
+
+        # Проверка на количество существующих изображений (включая ожидающие обработки)
+        current_images_count = point.images.count() + pending_files_count(point)
+        MAX_IMAGES = MAX_IMAGES_PER_POINT
+        logger.debug("📊 Point %s: %d/%d images", point.id, current_images_count, MAX_IMAGES)
 
         if current_images_count >= MAX_IMAGES:
-            logger.error(f"❌ Maximum images limit reached")
+            log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                               reason='images limit reached')
             return Response(
                 {'error': f'Maximum {MAX_IMAGES} images per point'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         available_slots = MAX_IMAGES - current_images_count
-        logger.info(f"📊 Available slots: {available_slots}")
 
         if len(images_data) > available_slots:
-            logger.error(f"❌ Too many images: {len(images_data)} > {available_slots}")
+            log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                               reason='too many images')
             return Response(
                 {'error': f'Can only upload {available_slots} more images (max {MAX_IMAGES} per point)'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -116,40 +474,67 @@ class PointViewSet(viewsets.ModelViewSet):
 
         # Валидация всех файлов ПЕРЕД сохранением
         all_errors = []
-        for i, img_file in enumerate(images_data, 1):
-            logger.info(f"\n--- Validating file {i}/{len(images_data)} ---")
+        for img_file in images_data:
             file_errors = validate_image_file(img_file)
             if file_errors:
                 all_errors.extend(file_errors)
 
         if all_errors:
-            logger.error(f"\n❌ VALIDATION FAILED: {len(all_errors)} error(s)")
-            logger.error(f"{'#' * 80}\n")
+            log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                               reason=f'{len(all_errors)} validation error(s)')
             return Response(
                 {'error': 'Ошибки валидации файлов', 'details': all_errors},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        if async_mode:
+            job = enqueue_upload(point, images_data, user=request.user if request.user.is_authenticated else None)
+            log_upload_summary(point.id, status.HTTP_202_ACCEPTED, started, files=job.total_files, job=job.id)
+            return Response(
+                {
+                    'job_id': str(job.id),
+                    'status': job.status,
+                    'status_url': request.build_absolute_uri(reverse('image-job-detail', args=[job.id])),
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
+
         # Если все проверки пройдены, сохраняем изображения
         created_images = []
         try:
-            logger.info(f"\n💾 Saving {len(images_data)} image(s)...")
             with transaction.atomic():
-                for i, img_file in enumerate(images_data, 1):
-                    logger.info(f"   Saving image {i}/{len(images_data)}: {img_file.name}")
+                for img_file in images_data:
                     created_image = PointImage.objects.create(point=point, image=img_file)
                     created_images.append(created_image)
-                    logger.info(f"   ✅ Image {i} saved with ID: {created_image.id}")
+                    logger.debug("✅ Saved %s as image %s", img_file.name, created_image.id)
 
         except Exception as e:
-            logger.error(f"\n❌ ERROR SAVING IMAGES: {str(e)}")
-            logger.error(f"{'#' * 80}\n")
+            logger.exception("❌ Error saving images for point %s", point.id)
+            log_upload_summary(point.id, status.HTTP_500_INTERNAL_SERVER_ERROR, started, files=len(images_data),
+                               reason='save failed')
             return Response(
                 {'error': f'Error saving images: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        # Уменьшенные копии для превью; ошибка генерации не отменяет загрузку
+        for created_image in created_images:
+            try:
+                generate_derivatives(created_image)
+                logger.debug("🖼️ Derivatives generated for image %s", created_image.id)
+            except Exception:
+                logger.exception("❌ Failed to generate derivatives for image %s", created_image.id)
+
         serializer = PointImageSerializer(created_images, many=True)
-        logger.info(f"\n✅ SUCCESS: {len(created_images)} image(s) uploaded")
-        logger.info(f"{'#' * 80}\n")
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        log_upload_summary(point.id, status.HTTP_201_CREATED, started, files=len(images_data),
+                           saved=len(created_images))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ImageUploadJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Статус фоновых загрузок изображений текущего пользователя"""
+    serializer_class = ImageUploadJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ImageUploadJob.objects.filter(user=self.request.user)
@@ -0,0 +1,119 @@
+"""
+Обработчик ASGI, принимающий тело запроса без блокировки цикла событий
+
+Стандартный ASGIHandler пишет каждый фрагмент тела в SpooledTemporaryFile
+прямо в цикле событий, а порог перехода на диск у него —
+FILE_UPLOAD_MAX_MEMORY_SIZE (30 МБ): несколько параллельных загрузок
+держат тела целиком в памяти, а запись большого тела на диск
+останавливает все остальные соединения воркера.
+
+StreamingBodyASGIHandler держит в памяти не больше ASGI_BODY_MEMORY_SIZE
+на запрос; фрагменты копятся в буфер и после перехода на диск
+записываются в пуле потоков. Медленный клиент при этом занимает только
+корутину, а не поток, как под WSGI.
+
+С ответами та же проблема в обратную сторону: StreamingHttpResponse с
+синхронным итератором Django под ASGI читает целиком через
+sync_to_async(list) и только потом отправляет. Синхронные представления,
+которым нужен потоковый ответ, оборачивают итератор в iterate_in_thread.
+"""
+
+import asyncio
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
+
+DEFAULT_BODY_MEMORY_SIZE = 256 * 1024
+
+# Фрагменты тела объединяются до этого размера перед записью на диск
+WRITE_BUFFER_SIZE = 256 * 1024
+
+# Сколько символов ответа забирать из синхронного итератора за один переход в поток
+STREAM_BATCH_SIZE = 64 * 1024
+
+
+def body_memory_size():
+    return getattr(settings, 'ASGI_BODY_MEMORY_SIZE', DEFAULT_BODY_MEMORY_SIZE)
+
+
+class StreamingBodyASGIHandler(ASGIHandler):
+    """ASGIHandler с ограниченным буфером тела в памяти и записью на диск вне цикла событий"""
+
+    async def read_body(self, receive):
+        body_file = tempfile.SpooledTemporaryFile(max_size=body_memory_size(), mode='w+b')
+        buffer = bytearray()
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise RequestAborted()
+                buffer += message.get('body', b'')
+                more_body = message.get('more_body', False)
+                if len(buffer) >= WRITE_BUFFER_SIZE or not more_body:
+                    await self._write(body_file, bytes(buffer))
+                    buffer.clear()
+                if not more_body:
+                    break
+        except BaseException:
+            body_file.close()
+            raise
+        body_file.seek(0)
+        return body_file
+
+    @staticmethod
+    async def _write(body_file, data):
+        if not data:
+            return
+        # Пока файл в памяти (и запись его не переполнит), запись — копирование байтов
+        if not body_file._rolled and body_file.tell() + len(data) <= body_file._max_size:
+            body_file.write(data)
+        else:
+            await asyncio.to_thread(body_file.write, data)
+
+
+def is_asgi_request(request):
+    """Запрос пришёл через ASGI (для DRF Request — по исходному HttpRequest)"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def _next_batch(iterator, batch_size):
+    parts, size = [], 0
+    for chunk in iterator:
+        parts.append(chunk)
+        size += len(chunk)
+        if size >= batch_size:
+            break
+    return parts[0][:0].join(parts) if parts else None
+
+
+async def iterate_in_thread(chunks, batch_size=STREAM_BATCH_SIZE):
+    """
+    Асинхронный итератор по синхронному генератору потокового ответа
+
+    Фрагменты забираются пачками до batch_size в потоке sync_to_async
+    (thread_sensitive: всегда в потоке запроса, где открыты курсоры БД
+    генератора), поэтому в памяти — одна пачка, а не весь ответ.
+    """
+    iterator = iter(chunks)
+    next_batch = sync_to_async(_next_batch)
+    try:
+        while True:
+            batch = await next_batch(iterator, batch_size)
+            if batch is None:
+                return
+            yield batch
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def get_asgi_application():
+    """Аналог django.core.asgi.get_asgi_application с StreamingBodyASGIHandler"""
+    import django
+
+    django.setup(set_prefix=False)
+    return StreamingBodyASGIHandler()
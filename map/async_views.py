@@ -0,0 +1,258 @@
+"""
+Асинхронные версии чтения маршрутов и точек и загрузки изображений (ASGI)
+
+DRF синхронный, поэтому это обычные async-представления Django:
+пользователь — из сессии через request.auser(), данные — через async ORM и
+route_reader.abuild_routes, ответ — FastJSONRenderer. Формат ответов и
+ошибок тот же, что у RouteViewSet/PointViewSet:
+
+* GET  /api/async/routes/ — как /api/routes/ (bbox, view=summary,
+  geometry=polyline, page_size/cursor);
+* GET  /api/async/routes/<id>/;
+* GET  /api/async/points/ — как /api/points/ (bbox);
+* GET  /api/async/points/<id>/;
+* POST /api/async/points/<id>/upload_image/ — как upload_image?async=1:
+  файлы проверяются и ставятся в очередь, ответ 202 с id задачи;
+* GET  /api/events/ — поток SSE изменений маршрутов пользователя
+  (route_events.py); работает только под ASGI.
+
+Разбор multipart, проверка изображений и копирование файлов выполняются в
+пуле потоков, цикл событий не блокируется. Тело запроса к этому моменту
+уже принято обработчиком ASGI (map/asgi.py) во временный файл, поэтому
+медленный клиент не занимает поток. Кэш ответов маршрутов и ETag здесь не
+используются: ответ всегда строится из БД.
+
+Под WSGI представления тоже работают (Django вызывает их через
+async_to_sync), но выигрыш по числу соединений даёт только ASGI.
+"""
+
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotAuthenticated, NotFound
+from rest_framework.fields import DateTimeField
+from rest_framework.permissions import SAFE_METHODS
+
+from . import route_events, route_reader
+from .api_views import get_bbox_param, get_polyline_precision, log_upload_summary
+from .image_jobs import MAX_IMAGES_PER_POINT, aenqueue_upload, apending_files_count
+from .image_validation import validate_image_file
+from .models import Point, Route
+from .pagination import RouteCursorPagination
+from .renderers import FastJSONRenderer
+from .spatial import filter_points_in_bbox
+from .upload_handlers import ImageUploadHandler, get_upload_errors
+
+_renderer = FastJSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        _renderer.render(data, 'application/json', {}), status=status_code, content_type='application/json',
+    )
+
+
+def error_response(exc, status_code=None):
+    """Ответ об ошибке в формате exception_handler DRF"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status_code or exc.status_code)
+
+
+def not_found(model):
+    # Текст как у get_object_or_404 в DRF
+    return NotFound(f'No {model._meta.object_name} matches the given query.')
+
+
+def async_api_view(methods, upload_handler=None):
+    """
+    Проверка метода, аутентификации и CSRF; представление получает (request, user, ...)
+
+    Как в DRF: без сессии — 403, CSRF проверяется после аутентификации (и
+    после установки upload_handler, поэтому представление само исключено из
+    CsrfViewMiddleware — тот разобрал бы тело раньше). APIException
+    превращается в ответ с её статусом.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return error_response(MethodNotAllowed(request.method))
+            user = await request.auser()
+            if not user.is_authenticated:
+                return error_response(NotAuthenticated(), status.HTTP_403_FORBIDDEN)
+            try:
+                if upload_handler is not None:
+                    request.upload_handlers.insert(0, upload_handler(request))
+                if request.method not in SAFE_METHODS:
+                    # Проверка читает request.POST, т.е. разбирает тело запроса — в пуле потоков
+                    await sync_to_async(SessionAuthentication().enforce_csrf, thread_sensitive=False)(request)
+                return await view(request, user, *args, **kwargs)
+            except APIException as exc:
+                return error_response(exc)
+        return wrapper
+    return decorator
+
+
+@async_api_view(['GET'])
+async def route_list(request, user):
+    summary = request.GET.get('view') == 'summary'
+    precision = None if summary else get_polyline_precision(request)
+    queryset = Route.objects.filter(user=user)
+    bbox = get_bbox_param(request)
+    if bbox:
+        visible_points = filter_points_in_bbox(Point.objects.all(), bbox)
+        queryset = queryset.filter(id__in=visible_points.values('route_id'))
+
+    if summary:
+        datetime_field = DateTimeField()
+        queryset = queryset.values(*route_reader.SUMMARY_READ_FIELDS)
+        return json_response([route_reader.summary_data(row, datetime_field) async for row in queryset])
+
+    paginator = RouteCursorPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    if page is not None:
+        routes = [route_reader.route_row(route) for route in page]
+        data = await route_reader.abuild_routes(routes, request, precision)
+        return json_response(paginator.get_paginated_data(data))
+    routes = queryset.values(*route_reader.ROUTE_READ_FIELDS)
+    return json_response(await route_reader.abuild_routes(routes, request, precision))
+
+
+@async_api_view(['GET'])
+async def route_detail(request, user, pk):
+    precision = get_polyline_precision(request)
+    route = await Route.objects.filter(user=user, pk=pk).values(*route_reader.ROUTE_READ_FIELDS).afirst()
+    if route is None:
+        raise not_found(Route)
+    return json_response((await route_reader.abuild_routes([route], request, precision))[0])
+
+
+async def build_points(points, request):
+    """Точки в формате PointSerializer: points — QuerySet точек в нужном порядке"""
+    rows = [row async for row in points.values_list(*route_reader.POINT_READ_FIELDS)]
+    if not rows:
+        return []
+    image_rows = route_reader.image_rows(points=points.values('id'))
+    images = route_reader.group_images([row async for row in image_rows], route_reader.url_builder(request))
+    return [route_reader.point_data(row, images) for row in rows]
+
+
+@async_api_view(['GET'])
+async def point_list(request, user):
+    points = Point.objects.all()
+    bbox = get_bbox_param(request)
+    if bbox:
+        points = filter_points_in_bbox(points, bbox)
+    return json_response(await build_points(points, request))
+
+
+@async_api_view(['GET'])
+async def point_detail(request, user, pk):
+    data = await build_points(Point.objects.filter(pk=pk), request)
+    if not data:
+        raise not_found(Point)
+    return json_response(data[0])
+
+
+def image_upload_handler(request):
+    # Потоковая проверка файлов при разборе тела запроса
+    return ImageUploadHandler(request, max_files=MAX_IMAGES_PER_POINT)
+
+
+@async_api_view(['POST'], upload_handler=image_upload_handler)
+async def point_upload_image(request, user, pk):
+    """
+    Загрузка изображений точки в очередь обработки (как upload_image?async=1)
+
+    Проверки те же, что у PointViewSet.upload_image; итоговая запись в лог —
+    log_upload_summary.
+    """
+    started = time.perf_counter()
+
+    point = await Point.objects.filter(pk=pk).afirst()
+    if point is None:
+        log_upload_summary(pk, status.HTTP_404_NOT_FOUND, started, reason='point not found')
+        return json_response({'error': 'Point not found'}, status.HTTP_404_NOT_FOUND)
+
+    # Обычно тело уже разобрано проверкой CSRF; без неё (тестовый клиент) разбор — тоже в пуле потоков
+    images_data = await sync_to_async(lambda: request.FILES.getlist('images'), thread_sensitive=False)()
+
+    upload_errors = get_upload_errors(request)
+    if upload_errors:
+        log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                           reason='rejected while streaming')
+        return json_response(
+            {'error': 'Ошибки валидации файлов', 'details': upload_errors}, status.HTTP_400_BAD_REQUEST,
+        )
+
+    if not images_data:
+        log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, reason='no images')
+        return json_response({'error': 'No images provided'}, status.HTTP_400_BAD_REQUEST)
+
+    current_images_count = await point.images.acount() + await apending_files_count(point)
+    if current_images_count >= MAX_IMAGES_PER_POINT:
+        log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                           reason='images limit reached')
+        return json_response(
+            {'error': f'Maximum {MAX_IMAGES_PER_POINT} images per point'}, status.HTTP_400_BAD_REQUEST,
+        )
+
+    available_slots = MAX_IMAGES_PER_POINT - current_images_count
+    if len(images_data) > available_slots:
+        log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                           reason='too many images')
+        return json_response(
+            {'error': f'Can only upload {available_slots} more images (max {MAX_IMAGES_PER_POINT} per point)'},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def validate_all():
+        return [error for image in images_data for error in validate_image_file(image)]
+
+    all_errors = await sync_to_async(validate_all, thread_sensitive=False)()
+    if all_errors:
+        log_upload_summary(point.id, status.HTTP_400_BAD_REQUEST, started, files=len(images_data),
+                           reason=f'{len(all_errors)} validation error(s)')
+        return json_response(
+            {'error': 'Ошибки валидации файлов', 'details': all_errors}, status.HTTP_400_BAD_REQUEST,
+        )
+
+    job = await aenqueue_upload(point, images_data, user=user)
+    log_upload_summary(point.id, status.HTTP_202_ACCEPTED, started, files=job.total_files, job=job.id)
+    return json_response(
+        {
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': request.build_absolute_uri(reverse('image-job-detail', args=[job.id])),
+        },
+        status.HTTP_202_ACCEPTED,
+    )
+
+
+@async_api_view(['GET'])
+async def events_stream(request, user):
+    """
+    Поток событий изменений маршрутов, точек и изображений пользователя
+
+    После переподключения EventSource присылает Last-Event-ID — пропущенные
+    события досылаются, а если это невозможно, приходит resync.
+    """
+    if not hasattr(request, 'scope'):
+        # Под WSGI бесконечный поток занял бы поток сервера навсегда
+        return json_response(
+            {'detail': 'Поток событий доступен только при запуске под ASGI'}, status.HTTP_501_NOT_IMPLEMENTED,
+        )
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    stream = route_events.event_stream(user.id, last_event_id, route_reader.url_builder(request))
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Без буферизации в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,230 @@
+"""
+Набор замеров API карты: время ответа и число SQL-запросов по эндпоинтам
+
+Замеры выполняются на данных seed_maps внутри транзакции, которая
+откатывается; каждый прогон сценария — в своей точке сохранения, поэтому
+изменяющие запросы (create/update/upload) повторяются на одинаковых данных.
+Результаты сравниваются с сохранённой базовой линией (benchmarks_baseline.json):
+рост числа запросов — регрессия всегда, рост медианного времени — если он
+больше допуска.
+"""
+
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from .models import Route
+from .seeding import seed_image, seed_maps
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmarks_baseline.json')
+
+# Набор данных по умолчанию: пользователи × маршруты × точки × изображения
+DEFAULT_DATASET = {'users': 2, 'routes': 50, 'points': 20, 'images': 1}
+
+# Допустимый рост медианы времени (доля) и минимальная разница, которую считаем значимой
+DEFAULT_TIME_TOLERANCE = 0.5
+MIN_TIME_DELTA_MS = 5.0
+
+
+class Rollback(Exception):
+    """Откат изменений сценария или всего набора данных"""
+
+
+class BenchmarkContext:
+    """Клиент и объекты, к которым обращаются сценарии"""
+
+    def __init__(self, user, creator):
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.creator_client = APIClient()
+        self.creator_client.force_authenticate(creator)
+        routes = Route.objects.filter(user=user).order_by('id')
+        self.route = routes.first()
+        self.points = list(self.route.points.order_by('order').values('id', 'name', 'description', 'lat', 'lon'))
+        self.image = seed_image()
+
+
+def route_payload(points_count, offset=0.0):
+    return {
+        'name': 'Замер',
+        'description': 'Маршрут для замера',
+        'points': [
+            {'name': f'Точка {idx}', 'lat': f'{55 + idx / 100 + offset:.6f}', 'lon': f'{37 + idx / 100:.6f}'}
+            for idx in range(points_count)
+        ],
+    }
+
+
+def bench_routes_list(ctx):
+    return ctx.client.get('/api/routes/')
+
+
+def bench_routes_list_summary(ctx):
+    return ctx.client.get('/api/routes/?view=summary')
+
+
+def bench_routes_list_page(ctx):
+    return ctx.client.get('/api/routes/?page_size=20')
+
+
+def bench_routes_list_polyline(ctx):
+    return ctx.client.get('/api/routes/?geometry=polyline')
+
+
+def bench_route_retrieve(ctx):
+    return ctx.client.get(f'/api/routes/{ctx.route.id}/')
+
+
+def bench_routes_list_cached(ctx):
+    # Первый прогон заполняет кэш, остальные — попадания
+    with override_settings(ROUTES_RESPONSE_CACHE=True):
+        return ctx.client.get('/api/routes/')
+
+
+def bench_route_retrieve_cached(ctx):
+    with override_settings(ROUTES_RESPONSE_CACHE=True):
+        return ctx.client.get(f'/api/routes/{ctx.route.id}/')
+
+
+def bench_route_create(ctx):
+    return ctx.creator_client.post('/api/routes/', route_payload(20), format='json')
+
+
+def bench_route_update(ctx):
+    # Сдвигаем половину точек, удаляем последнюю и добавляем новую
+    points = [
+        {**point, 'lat': str(point['lat'] + 1) if idx % 2 else str(point['lat'])}
+        for idx, point in enumerate(ctx.points[:-1])
+    ]
+    points.append({'name': 'Новая', 'lat': '10.5', 'lon': '20.5'})
+    return ctx.client.put(
+        f'/api/routes/{ctx.route.id}/', {'name': 'Изменён', 'description': '', 'points': points}, format='json',
+    )
+
+
+def bench_point_upload(ctx):
+    image = SimpleUploadedFile('photo.png', ctx.image, content_type='image/png')
+    return ctx.client.post(
+        f'/api/points/{ctx.points[0]["id"]}/upload_image/', {'images': [image]}, format='multipart',
+    )
+
+
+def bench_clusters(ctx):
+    return ctx.client.get('/api/points/clusters/?zoom=6')
+
+
+# Сценарий -> (функция, ожидаемый статус ответа)
+SCENARIOS = {
+    'routes_list': (bench_routes_list, 200),
+    'routes_list_summary': (bench_routes_list_summary, 200),
+    'routes_list_page': (bench_routes_list_page, 200),
+    'routes_list_polyline': (bench_routes_list_polyline, 200),
+    'route_retrieve': (bench_route_retrieve, 200),
+    'routes_list_cached': (bench_routes_list_cached, 200),
+    'route_retrieve_cached': (bench_route_retrieve_cached, 200),
+    'route_create': (bench_route_create, 201),
+    'route_update': (bench_route_update, 200),
+    'point_upload': (bench_point_upload, 201),
+    'clusters': (bench_clusters, 200),
+}
+
+
+def run_scenario(ctx, name, repeat):
+    """
+    Прогон сценария repeat раз, каждый — с откатом изменений
+
+    Returns:
+        dict: {'queries': максимум запросов за прогон, 'median_ms': медиана времени}
+    """
+    func, expected_status = SCENARIOS[name]
+    timings, queries = [], 0
+    for _ in range(repeat):
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = func(ctx)
+                    elapsed = time.perf_counter() - started
+                if response.status_code != expected_status:
+                    raise AssertionError(
+                        f'{name}: статус {response.status_code}, ожидался {expected_status}: {response.content[:500]!r}'
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        timings.append(elapsed * 1000)
+        queries = max(queries, len(captured))
+    return {'queries': queries, 'median_ms': round(statistics.median(timings), 2)}
+
+
+def run_benchmarks(dataset=None, repeat=5, scenarios=None):
+    """
+    Замеры всех (или выбранных) сценариев на свежем наборе данных
+
+    Данные и загруженные файлы не сохраняются: транзакция откатывается,
+    файлы пишутся во временный MEDIA_ROOT. Кэш ответов маршрутов включают
+    только сценарии *_cached, остальные замеряют построение ответа.
+
+    Returns:
+        dict: {'dataset': параметры набора данных, 'scenarios': {имя: результат}}
+    """
+    dataset = {**DEFAULT_DATASET, **(dataset or {})}
+    results = {}
+    with tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'], ROUTES_RESPONSE_CACHE=False):
+        try:
+            with transaction.atomic():
+                users, _ = seed_maps(prefix='bench', **dataset)
+                creators, _ = seed_maps(users=1, routes=0, points=0, images=0, prefix='bench_creator')
+                ctx = BenchmarkContext(users[0], creators[0])
+                for name in scenarios or SCENARIOS:
+                    results[name] = run_scenario(ctx, name, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+    return {'dataset': dataset, 'scenarios': results}
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def find_regressions(results, baseline, time_tolerance=DEFAULT_TIME_TOLERANCE, check_timings=True):
+    """
+    Сравнение с базовой линией
+
+    Время сравнивается, только если набор данных совпадает с базовым.
+
+    Returns:
+        list: Описания регрессий (пустой — всё в порядке)
+    """
+    regressions = []
+    compare_timings = check_timings and results['dataset'] == baseline.get('dataset')
+    for name, result in results['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{name}: запросов {result["queries"]} вместо {expected["queries"]}')
+        limit = expected['median_ms'] * (1 + time_tolerance)
+        if compare_timings and result['median_ms'] > max(limit, expected['median_ms'] + MIN_TIME_DELTA_MS):
+            regressions.append(
+                f'{name}: медиана {result["median_ms"]:.1f} мс при базовой {expected["median_ms"]:.1f} мс'
+            )
+    return regressions
@@ -0,0 +1,137 @@
+"""
+Контентно-адресуемое хранение изображений точек
+
+В режиме ``POINT_IMAGE_CONTENT_ADDRESSED`` файл сохраняется под именем,
+производным от SHA-256 его содержимого: point_images/blobs/ab/<hash>.<ext>.
+Одна и та же фотография, прикреплённая к нескольким точкам, хранится
+один раз. Запись ImageBlob считает ссылки из PointImage; файл и его
+уменьшенные копии удаляются, когда уходит последняя ссылка.
+
+Режим выключен по умолчанию. Переход на существующей установке:
+
+1. ``manage.py dedupe_point_images --dry-run`` — сколько места освободится;
+2. включить POINT_IMAGE_CONTENT_ADDRESSED=1 и перезапустить процессы
+   (включая process_image_jobs): новые загрузки идут в blobs;
+3. ``manage.py dedupe_point_images`` — прежние файлы point_images/<id>/
+   переносятся в blobs, дубликаты удаляются.
+
+Выключить режим можно в любой момент: новые файлы снова пишутся в
+point_images/<id>/, а записи с blob продолжают считать ссылки.
+"""
+
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ImageBlob
+from .thumbnails import DERIVATIVE_FORMATS, DERIVATIVE_WIDTHS, derivative_name
+
+BLOBS_DIR = os.path.join('point_images', 'blobs')
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def is_content_addressed():
+    return getattr(settings, 'POINT_IMAGE_CONTENT_ADDRESSED', False)
+
+
+def blob_name(digest, extension):
+    """Пример: ab12...ef, 'png' -> point_images/blobs/ab/ab12...ef.png"""
+    extension = extension.lower().lstrip('.')
+    return os.path.join(BLOBS_DIR, digest[:2], f'{digest}.{extension}')
+
+
+def hash_file(file):
+    """
+    SHA-256 и размер файла (читается блоками, позиция возвращается в начало)
+
+    Returns:
+        tuple: (hex-дайджест, размер в байтах)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    while True:
+        chunk = file.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+def acquire_blob(digest, name, size, references=1):
+    """
+    Добавление ссылок на blob (запись создаётся при первой ссылке)
+
+    Returns:
+        ImageBlob
+    """
+    with transaction.atomic():
+        if ImageBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + references):
+            return ImageBlob.objects.get(sha256=digest)
+        try:
+            with transaction.atomic():
+                return ImageBlob.objects.create(sha256=digest, name=name, size=size, ref_count=references)
+        except IntegrityError:
+            # Запись успел создать параллельный запрос
+            ImageBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + references)
+            return ImageBlob.objects.get(sha256=digest)
+
+
+def store_blob(file, extension, storage=None):
+    """
+    Сохранение загруженного файла как blob с добавлением ссылки
+
+    Если такое содержимое уже есть в хранилище, файл не записывается повторно.
+
+    Args:
+        file: Django File / UploadedFile
+        extension (str): Расширение исходного файла
+        storage: Хранилище (по умолчанию default_storage)
+
+    Returns:
+        ImageBlob
+    """
+    storage = storage or default_storage
+    digest, size = hash_file(file)
+    blob = acquire_blob(digest, blob_name(digest, extension), size)
+    if not storage.exists(blob.name):
+        storage.save(blob.name, file)
+    return blob
+
+
+def blob_derivative_names(name):
+    """Все возможные имена уменьшенных копий blob"""
+    return [derivative_name(name, width, fmt) for width in DERIVATIVE_WIDTHS for fmt in DERIVATIVE_FORMATS]
+
+
+def delete_blob_files(name, derivatives=(), storage=None):
+    """Удаление файла blob и его копий, если на содержимое снова никто не сослался"""
+    storage = storage or default_storage
+    if ImageBlob.objects.filter(name=name).exists():
+        return
+    names = {name, *blob_derivative_names(name), *(d['name'] for d in derivatives)}
+    for file_name in names:
+        if storage.exists(file_name):
+            storage.delete(file_name)
+
+
+def release_blob(blob_id, derivatives=()):
+    """
+    Снятие ссылки на blob; при последней ссылке запись удаляется,
+    а файлы — после фиксации транзакции
+    """
+    with transaction.atomic():
+        ImageBlob.objects.filter(id=blob_id).update(ref_count=F('ref_count') - 1)
+        blob = ImageBlob.objects.filter(id=blob_id, ref_count__lte=0).first()
+        if blob is None:
+            return
+        blob.delete()
+    derivatives = list(derivatives)
+    transaction.on_commit(lambda: delete_blob_files(blob.name, derivatives))
@@ -0,0 +1,373 @@
+"""
+Серверная кластеризация точек по уровням масштаба
+
+Для каждой точности geohash из CLUSTER_PRECISIONS хранится таблица
+кластеров (модель PointCluster): количество точек, суммы координат для
+центроида и охватывающий прямоугольник. Таблица поддерживается
+инкрементально при создании, перемещении и удалении точек, поэтому
+запрос кластеров читает только ячейки видимой области.
+
+Кластеры считаются отдельно для каждого пользователя (PointCluster.user):
+ответ /api/points/clusters/ строится только по точкам его маршрутов.
+Точки маршрутов без владельца в кластеры не входят.
+
+Если удалённая точка лежала на границе кластера, его прямоугольник мог
+сжаться: кластер помечается dirty, при чтении точные значения считаются
+на лету, а сохраняет их manage.py rebuild_clusters --dirty.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Avg, Count, Max, Min, Q
+
+from .spatial import (
+    encode_geohash,
+    geohash_prefix_upper_bound,
+    geohash_range_condition,
+)
+
+# Точности geohash, для которых поддерживаются кластеры (от ~5000 км до ~40 м)
+CLUSTER_PRECISIONS = range(1, 9)
+MIN_ZOOM = 0
+MAX_ZOOM = 21
+
+_local = threading.local()
+
+
+def precision_for_zoom(zoom):
+    """
+    Точность geohash для масштаба карты
+
+    Ячейка подбирается так, чтобы на экране она занимала не меньше ~64 пикселей
+    при тайлах 256x256 (как у Яндекс.Карт).
+    """
+    zoom = min(max(int(zoom), MIN_ZOOM), MAX_ZOOM)
+    precision = CLUSTER_PRECISIONS[0]
+    for candidate in CLUSTER_PRECISIONS:
+        lon_bits = (candidate * 5 + 1) // 2
+        if lon_bits > zoom + 2:
+            break
+        precision = candidate
+    return precision
+
+
+def _empty_delta():
+    return {
+        'count': 0, 'sum_lat': 0.0, 'sum_lon': 0.0,
+        'min_lat': None, 'max_lat': None, 'min_lon': None, 'max_lon': None,
+        'removed': [],
+    }
+
+
+def _collect_deltas(added, removed):
+    """Группировка изменений по ячейкам всех уровней"""
+    deltas = defaultdict(_empty_delta)
+    for sign, coords_list in ((1, added), (-1, removed)):
+        for lat, lon in coords_list:
+            lat, lon = float(lat), float(lon)
+            geohash = encode_geohash(lat, lon, max(CLUSTER_PRECISIONS))
+            for precision in CLUSTER_PRECISIONS:
+                delta = deltas[(precision, geohash[:precision])]
+                delta['count'] += sign
+                delta['sum_lat'] += sign * lat
+                delta['sum_lon'] += sign * lon
+                if sign > 0:
+                    delta['min_lat'] = lat if delta['min_lat'] is None else min(delta['min_lat'], lat)
+                    delta['max_lat'] = lat if delta['max_lat'] is None else max(delta['max_lat'], lat)
+                    delta['min_lon'] = lon if delta['min_lon'] is None else min(delta['min_lon'], lon)
+                    delta['max_lon'] = lon if delta['max_lon'] is None else max(delta['max_lon'], lon)
+                else:
+                    delta['removed'].append((lat, lon))
+    return deltas
+
+
+def apply_point_changes(user_id, added=(), removed=()):
+    """
+    Инкрементальное обновление кластеров пользователя
+
+    Все изменения группируются по ячейкам и применяются фиксированным числом
+    запросов (чтение, обновление, bulk_create, удаление пустых ячеек),
+    независимо от количества точек. Количество, суммы и границы меняются
+    выражениями над текущими значениями строки (count = count + d,
+    min_lat = MIN(min_lat, x)), поэтому параллельные записи не теряют
+    обновлений друг друга.
+
+    Чтение и запись идут в одной транзакции. Внутри транзакции вызывающего
+    в профиле SQLITE_PROFILE=concurrent блокировка записи взята с BEGIN
+    IMMEDIATE, и новую ячейку параллельно никто не создаст. Вне транзакции
+    (одиночные изменения через сигналы) такая гонка возможна: тогда пакет
+    повторяется, и ячейка обновляется как существующая.
+
+    Args:
+        user_id: Владелец маршрута точек (None — маршрут без владельца, кластеров нет)
+        added: Координаты (lat, lon) добавленных точек
+        removed: Координаты (lat, lon) удалённых точек
+    """
+    if user_id is None or (not added and not removed):
+        return
+    deltas = _collect_deltas(added, removed)
+    if transaction.get_connection().in_atomic_block:
+        _apply_deltas(user_id, deltas)
+        return
+    try:
+        with transaction.atomic():
+            _apply_deltas(user_id, deltas)
+    except IntegrityError:
+        with transaction.atomic():
+            _apply_deltas(user_id, deltas)
+
+
+def _apply_deltas(user_id, deltas):
+    from .models import PointCluster
+
+    keys_by_precision = defaultdict(list)
+    for precision, cell in deltas:
+        keys_by_precision[precision].append(cell)
+    lookup = Q()
+    for precision, cells in keys_by_precision.items():
+        lookup |= Q(precision=precision, cell__in=cells)
+    lookup &= Q(user_id=user_id)
+    existing = {(c.precision, c.cell): c for c in PointCluster.objects.filter(lookup)}
+
+    to_create, to_update = [], []
+    for key, delta in deltas.items():
+        cluster = existing.get(key)
+        if cluster is None:
+            if delta['count'] <= 0 or delta['min_lat'] is None:
+                continue
+            to_create.append(PointCluster(
+                user_id=user_id, precision=key[0], cell=key[1], count=delta['count'],
+                sum_lat=delta['sum_lat'], sum_lon=delta['sum_lon'],
+                min_lat=delta['min_lat'], max_lat=delta['max_lat'],
+                min_lon=delta['min_lon'], max_lon=delta['max_lon'],
+            ))
+            continue
+
+        # Удалённая точка на границе: прямоугольник мог сжаться, пересчёт при чтении
+        on_border = any(
+            lat in (cluster.min_lat, cluster.max_lat) or lon in (cluster.min_lon, cluster.max_lon)
+            for lat, lon in delta['removed']
+        )
+        to_update.append((
+            cluster.id, delta['count'], delta['sum_lat'], delta['sum_lon'],
+            delta['min_lat'], delta['max_lat'], delta['min_lon'], delta['max_lon'], on_border,
+        ))
+
+    if to_update:
+        _update_clusters(PointCluster._meta.db_table, to_update)
+        if any(delta['count'] < 0 for delta in deltas.values()):
+            PointCluster.objects.filter(lookup, count__lte=0).delete()
+    if to_create:
+        PointCluster.objects.bulk_create(to_create, batch_size=500)
+
+
+def _update_clusters(table, rows):
+    """
+    Прибавление дельт к существующим кластерам: один UPDATE ... FROM (VALUES ...) на пачку
+
+    bulk_update с выражениями над полями строит CASE WHEN на каждое поле
+    каждой строки, и на десятках ячеек построение запроса в Django занимает
+    больше времени, чем сам запрос.
+
+    Args:
+        table: Таблица PointCluster
+        rows: (id, count, sum_lat, sum_lon, min_lat, max_lat, min_lon, max_lon, dirty);
+            границы None, если точек не добавлялось
+    """
+    quote = connection.ops.quote_name
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    # Столбцы VALUES называются column1, column2, ... и в SQLite, и в PostgreSQL
+    assignments = [
+        f'{quote(name)} = {quote(table)}.{quote(name)} + delta.column{index}'
+        for index, name in ((2, 'count'), (3, 'sum_lat'), (4, 'sum_lon'))
+    ] + [
+        f'{quote(name)} = {func}({quote(table)}.{quote(name)}, COALESCE(delta.column{index}, {quote(table)}.{quote(name)}))'
+        for index, name, func in ((5, 'min_lat', least), (6, 'max_lat', greatest), (7, 'min_lon', least), (8, 'max_lon', greatest))
+    ] + [f'{quote("dirty")} = {quote(table)}.{quote("dirty")} OR delta.column9']
+
+    batch_size = connection.ops.bulk_batch_size([None] * len(rows[0]), rows)
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        values = ', '.join(['(' + ', '.join(['%s'] * len(row)) + ')' for row in batch])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote(table)} SET {", ".join(assignments)} '
+                f'FROM (VALUES {values}) AS delta WHERE {quote(table)}.{quote("id")} = delta.column1',
+                [value for row in batch for value in row],
+            )
+
+
+def cluster_stats(cell, user_id):
+    """
+    Точные количество, суммы координат и границы кластера пользователя по индексу geohash точек
+
+    Returns:
+        dict | None: Поля PointCluster или None, если точек в ячейке нет
+    """
+    from .models import Point
+
+    stats = Point.objects.filter(
+        geohash__gte=cell,
+        geohash__lt=geohash_prefix_upper_bound(cell),
+        route__user_id=user_id,
+    ).aggregate(
+        count=Count('id'), avg_lat=Avg('lat'), avg_lon=Avg('lon'),
+        min_lat=Min('lat'), max_lat=Max('lat'), min_lon=Min('lon'), max_lon=Max('lon'),
+    )
+    if not stats['count']:
+        return None
+    return {
+        'count': stats['count'],
+        'sum_lat': float(stats['avg_lat']) * stats['count'],
+        'sum_lon': float(stats['avg_lon']) * stats['count'],
+        'min_lat': float(stats['min_lat']), 'max_lat': float(stats['max_lat']),
+        'min_lon': float(stats['min_lon']), 'max_lon': float(stats['max_lon']),
+    }
+
+
+def refresh_dirty_clusters():
+    """
+    Пересчёт кластеров, отмеченных dirty (manage.py rebuild_clusters --dirty)
+
+    Returns:
+        int: Количество пересчитанных кластеров
+    """
+    from .models import PointCluster
+
+    refreshed = 0
+    for cluster in PointCluster.objects.filter(dirty=True).iterator():
+        stats = cluster_stats(cluster.cell, cluster.user_id)
+        if stats is None:
+            cluster.delete()
+        else:
+            PointCluster.objects.filter(id=cluster.id).update(dirty=False, **stats)
+        refreshed += 1
+    return refreshed
+
+
+def rebuild_clusters():
+    """
+    Полное перестроение таблицы кластеров по точкам маршрутов всех пользователей
+
+    Returns:
+        int: Количество созданных кластеров
+    """
+    from .models import Point, PointCluster
+
+    cells = {}
+    points = Point.objects.filter(route__user__isnull=False).values_list('route__user_id', 'lat', 'lon')
+    for user_id, lat, lon in points.iterator(chunk_size=2000):
+        lat, lon = float(lat), float(lon)
+        geohash = encode_geohash(lat, lon, max(CLUSTER_PRECISIONS))
+        for precision in CLUSTER_PRECISIONS:
+            key = (user_id, precision, geohash[:precision])
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, lat, lon, lat, lat, lon, lon]
+            else:
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lon
+                cell[3] = min(cell[3], lat)
+                cell[4] = max(cell[4], lat)
+                cell[5] = min(cell[5], lon)
+                cell[6] = max(cell[6], lon)
+
+    PointCluster.objects.all().delete()
+    PointCluster.objects.bulk_create(
+        [
+            PointCluster(
+                user_id=user_id, precision=precision, cell=cell, count=count, sum_lat=sum_lat, sum_lon=sum_lon,
+                min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+            )
+            for (user_id, precision, cell), (count, sum_lat, sum_lon, min_lat, max_lat, min_lon, max_lon)
+            in cells.items()
+        ],
+        batch_size=500,
+    )
+    return len(cells)
+
+
+def _intersects(cluster, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if cluster.max_lat < min_lat or cluster.min_lat > max_lat:
+        return False
+    if min_lon <= max_lon:
+        return not (cluster.max_lon < min_lon or cluster.min_lon > max_lon)
+    return cluster.max_lon >= min_lon or cluster.min_lon <= max_lon
+
+
+def get_clusters(bbox, zoom, user_id):
+    """
+    Кластеры точек пользователя в видимой области для масштаба карты
+
+    Args:
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat)
+        zoom (int): Масштаб карты
+        user_id: Владелец маршрутов
+
+    Returns:
+        list: Кластеры с количеством точек, центроидом и охватывающим прямоугольником
+    """
+    from .models import PointCluster
+
+    precision = precision_for_zoom(zoom)
+    clusters = PointCluster.objects.filter(
+        geohash_range_condition(bbox, 'cell', max_precision=precision),
+        user_id=user_id,
+        precision=precision,
+    ).order_by('cell')
+
+    result = []
+    for cluster in clusters:
+        if cluster.dirty:
+            # Чтение таблицу не меняет: точные значения считаются на лету,
+            # сохраняет их rebuild_clusters --dirty
+            stats = cluster_stats(cluster.cell, user_id)
+            if stats is None:
+                continue
+            for field, value in stats.items():
+                setattr(cluster, field, value)
+        if not _intersects(cluster, bbox):
+            continue
+        result.append({
+            'cell': cluster.cell,
+            'count': cluster.count,
+            'lat': cluster.sum_lat / cluster.count,
+            'lon': cluster.sum_lon / cluster.count,
+            'bbox': [cluster.min_lon, cluster.min_lat, cluster.max_lon, cluster.max_lat],
+        })
+    return result
+
+
+# --- Поддержка таблицы при удалении маршрутов целиком ---
+
+def _deleting_routes():
+    """Удаляемые маршруты: id маршрута -> id его точек"""
+    routes = getattr(_local, 'deleting_routes', None)
+    if routes is None:
+        routes = _local.deleting_routes = {}
+    return routes
+
+
+def start_route_deletion(route_id, user_id):
+    """Снятие всех точек маршрута с кластеров владельца одним пакетом перед каскадным удалением"""
+    from .models import Point
+
+    points = list(Point.objects.filter(route_id=route_id).values_list('id', 'lat', 'lon'))
+    apply_point_changes(user_id, removed=[(lat, lon) for _, lat, lon in points])
+    _deleting_routes()[route_id] = {point_id for point_id, _, _ in points}
+
+
+def finish_route_deletion(route_id):
+    _deleting_routes().pop(route_id, None)
+
+
+def is_route_being_deleted(route_id):
+    return route_id in _deleting_routes()
+
+
+def is_point_being_deleted_with_route(point_id):
+    return any(point_id in point_ids for point_ids in _deleting_routes().values())
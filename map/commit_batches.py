@@ -0,0 +1,51 @@
+"""
+Пакеты изменений одной транзакции, обрабатываемые после её фиксации
+
+Сброс кэша (route_cache.py) и события (route_events.py) копят изменения
+транзакции в один пакет и регистрируют его в transaction.on_commit один раз.
+Пакет текущей транзакции хранится в thread-local через слабую ссылку на
+зарегистрированный вызов: на сам вызов ссылается только Django. После
+фиксации вызов выполняется и освобождается, после отката транзакции (или
+точки сохранения, в которой пакет начат) Django его отбрасывает — ссылка
+обнуляется, и следующее изменение начинает новый пакет.
+"""
+
+import weakref
+
+from django.db import connection, transaction
+
+
+class _Callback:
+    """Отложенный вызов пакета для transaction.on_commit"""
+
+    __slots__ = ('batch', '__weakref__')
+
+    def __init__(self, batch):
+        self.batch = batch
+
+    def __call__(self):
+        # Выполненный пакет больше не пополняется, даже пока вызов ещё где-то хранится
+        batch, self.batch = self.batch, None
+        if batch is not None:
+            batch()
+
+
+def pending_batch(local):
+    """Пакет, уже зарегистрированный в текущей транзакции, или None"""
+    ref = getattr(local, 'batch_ref', None)
+    callback = ref() if ref is not None else None
+    if callback is None or not connection.in_atomic_block:
+        return None
+    return callback.batch
+
+
+def register_batch(local, batch):
+    """
+    Выполнение batch после фиксации текущей транзакции (вне транзакции — сразу)
+
+    Изменения нужно добавить в пакет до регистрации: вне транзакции он
+    вызывается немедленно.
+    """
+    callback = _Callback(batch)
+    local.batch_ref = weakref.ref(callback)
+    transaction.on_commit(callback)
@@ -0,0 +1,93 @@
+"""
+Денормализованные счётчики: маршруты пользователя, точки и изображения маршрута
+
+Счётчики меняются атомарными UPDATE с F-выражениями в той же транзакции,
+что и создание/удаление объектов (см. signals.py), поэтому проверка лимитов
+тарифа — это чтение одного поля. Массовые операции, выполняемые с
+отключёнными сигналами, пересчитывают счётчики через refresh_* функции.
+
+Тем же UPDATE сдвигается Route.updated_at: изменение точки или изображения
+меняет представление маршрута, а от updated_at зависят ETag/Last-Modified.
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Point, PointImage, Route, UserProfile
+
+
+def adjust_routes_count(user_id, delta):
+    UserProfile.objects.filter(user_id=user_id).update(routes_count=F('routes_count') + delta)
+
+
+def adjust_route_counters(route_id, points=0, images=0):
+    """Изменение счётчиков маршрута с отметкой времени изменения (без дельт — только отметка)"""
+    changes = {'updated_at': timezone.now()}
+    if points:
+        changes['points_count'] = F('points_count') + points
+    if images:
+        changes['images_count'] = F('images_count') + images
+    Route.objects.filter(id=route_id).update(**changes)
+
+
+def adjust_images_count_for_point(point_id, delta=0):
+    """Изменение счётчика изображений маршрута, которому принадлежит точка"""
+    route_id = Point.objects.filter(id=point_id).values('route_id')
+    changes = {'updated_at': timezone.now()}
+    if delta:
+        changes['images_count'] = F('images_count') + delta
+    Route.objects.filter(id=Subquery(route_id)).update(**changes)
+
+
+def touch_routes_of_images(image_ids):
+    """
+    Отметка времени изменения маршрутов с этими изображениями
+
+    Для массовых операций без сигналов (bulk_update файлов и копий): иначе
+    ETag/Last-Modified не меняются и клиент получает 304 со старыми URL.
+    """
+    return Route.objects.filter(points__images__id__in=image_ids).update(updated_at=timezone.now())
+
+
+def _count_subquery(queryset, group_field):
+    counts = queryset.order_by().values(group_field).annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def refresh_route_counters(route_ids=None):
+    """
+    Пересчёт points_count/images_count одним UPDATE с подзапросами
+
+    Args:
+        route_ids: Маршруты для пересчёта (None — все)
+
+    Returns:
+        int: Количество обновлённых маршрутов
+    """
+    queryset = Route.objects.all()
+    if route_ids is not None:
+        queryset = queryset.filter(id__in=route_ids)
+    return queryset.update(
+        points_count=_count_subquery(Point.objects.filter(route_id=OuterRef('pk')), 'route_id'),
+        images_count=_count_subquery(PointImage.objects.filter(point__route_id=OuterRef('pk')), 'point__route_id'),
+    )
+
+
+def refresh_routes_counts(user_ids=None):
+    """
+    Пересчёт UserProfile.routes_count одним UPDATE с подзапросом
+
+    Returns:
+        int: Количество обновлённых профилей
+    """
+    queryset = UserProfile.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return queryset.update(
+        routes_count=_count_subquery(Route.objects.filter(user_id=OuterRef('user_id')), 'user_id'),
+    )
+
+
+def current_routes_count(user_id):
+    return UserProfile.objects.filter(user_id=user_id).values_list('routes_count', flat=True).first() or 0
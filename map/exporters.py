@@ -0,0 +1,180 @@
+"""
+Потоковая выгрузка маршрутов в GeoJSON, GPX и KML
+
+Маршруты и точки читаются двумя курсорами (QuerySet.iterator) в порядке
+id маршрута и сливаются на лету, поэтому в памяти одновременно находится
+только текущий маршрут с его точками — независимо от размера выгрузки.
+"""
+
+import json
+from itertools import groupby
+from xml.sax.saxutils import escape, quoteattr
+
+from .models import Point
+from .polyline import encode_polyline
+
+EXPORT_CHUNK_SIZE = 2000
+
+ROUTE_EXPORT_FIELDS = ('id', 'name', 'description', 'created_at', 'updated_at')
+POINT_EXPORT_FIELDS = ('route_id', 'name', 'description', 'lat', 'lon', 'order')
+
+
+def iter_routes_with_points(routes, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Маршруты с их точками, слиянием двух упорядоченных потоков
+
+    Args:
+        routes: QuerySet маршрутов для выгрузки
+        chunk_size: Размер блока, читаемого из курсора
+
+    Yields:
+        tuple: (словарь полей маршрута, список словарей точек по порядку)
+    """
+    route_rows = routes.order_by('id').values(*ROUTE_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    point_rows = (
+        Point.objects.filter(route__in=routes.values('id'))
+        .order_by('route_id', 'order', 'id')
+        .values(*POINT_EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    point_groups = groupby(point_rows, key=lambda row: row['route_id'])
+    pending = next(point_groups, None)
+
+    for route in route_rows:
+        # Точки удалённых за время выгрузки маршрутов пропускаем
+        while pending is not None and pending[0] < route['id']:
+            pending = next(point_groups, None)
+        if pending is not None and pending[0] == route['id']:
+            points = list(pending[1])
+            pending = next(point_groups, None)
+        else:
+            points = []
+        yield route, points
+
+
+def _coordinate(value):
+    return repr(float(value))
+
+
+def _datetime(value):
+    return value.isoformat() if value else None
+
+
+# --- GeoJSON ---
+
+def _geojson_features(route, points):
+    coordinates = [[float(point['lon']), float(point['lat'])] for point in points]
+    properties = {
+        'route_id': route['id'],
+        'name': route['name'],
+        'description': route['description'],
+        'created_at': _datetime(route['created_at']),
+        'updated_at': _datetime(route['updated_at']),
+        'points_count': len(points),
+    }
+    geometry = {'type': 'LineString', 'coordinates': coordinates} if len(coordinates) > 1 else None
+    yield {'type': 'Feature', 'geometry': geometry, 'properties': properties}
+
+    for point, coordinate in zip(points, coordinates):
+        yield {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': coordinate},
+            'properties': {
+                'route_id': route['id'],
+                'name': point['name'],
+                'description': point['description'],
+                'order': point['order'],
+            },
+        }
+
+
+def _geojson_polyline_feature(route, points, precision):
+    """Компактный вариант: геометрия маршрута — строка polyline в свойствах, точки — без координат"""
+    yield {
+        'type': 'Feature',
+        'geometry': None,
+        'properties': {
+            'route_id': route['id'],
+            'name': route['name'],
+            'description': route['description'],
+            'created_at': _datetime(route['created_at']),
+            'updated_at': _datetime(route['updated_at']),
+            'points_count': len(points),
+            'polyline': encode_polyline(((point['lat'], point['lon']) for point in points), precision),
+            'polyline_precision': precision,
+            'points': [
+                {'name': point['name'], 'description': point['description'], 'order': point['order']}
+                for point in points
+            ],
+        },
+    }
+
+
+def stream_geojson(routes, polyline_precision=None):
+    yield '{"type": "FeatureCollection", "features": [\n'
+    first = True
+    for route, points in iter_routes_with_points(routes):
+        if polyline_precision is not None:
+            features = _geojson_polyline_feature(route, points, polyline_precision)
+        else:
+            features = _geojson_features(route, points)
+        for feature in features:
+            yield ('' if first else ',\n') + json.dumps(feature, ensure_ascii=False)
+            first = False
+    yield '\n]}\n'
+
+
+# --- GPX ---
+
+def _xml_text(tag, value):
+    return f'<{tag}>{escape(value)}</{tag}>' if value else ''
+
+
+def stream_gpx(routes):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<gpx version="1.1" creator="Map-with-cords" xmlns="http://www.topografix.com/GPX/1/1">\n'
+    for route, points in iter_routes_with_points(routes):
+        parts = ['<rte>', _xml_text('name', route['name']), _xml_text('desc', route['description'])]
+        for point in points:
+            parts.append(
+                f'<rtept lat={quoteattr(_coordinate(point["lat"]))} lon={quoteattr(_coordinate(point["lon"]))}>'
+                f'{_xml_text("name", point["name"])}{_xml_text("desc", point["description"])}</rtept>'
+            )
+        parts.append('</rte>\n')
+        yield ''.join(parts)
+    yield '</gpx>\n'
+
+
+# --- KML ---
+
+def stream_kml(routes):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+    for route, points in iter_routes_with_points(routes):
+        coordinates = [f'{_coordinate(point["lon"])},{_coordinate(point["lat"])}' for point in points]
+        parts = [
+            '<Folder>',
+            _xml_text('name', route['name'] or f'Route {route["id"]}'),
+            _xml_text('description', route['description']),
+        ]
+        if len(coordinates) > 1:
+            parts.append(
+                f'<Placemark>{_xml_text("name", route["name"])}'
+                f'<LineString><coordinates>{" ".join(coordinates)}</coordinates></LineString></Placemark>'
+            )
+        for point, coordinate in zip(points, coordinates):
+            parts.append(
+                f'<Placemark>{_xml_text("name", point["name"])}{_xml_text("description", point["description"])}'
+                f'<Point><coordinates>{coordinate}</coordinates></Point></Placemark>'
+            )
+        parts.append('</Folder>\n')
+        yield ''.join(parts)
+    yield '</Document></kml>\n'
+
+
+# Формат -> (генератор, MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    'geojson': (stream_geojson, 'application/geo+json', 'geojson'),
+    'gpx': (stream_gpx, 'application/gpx+xml', 'gpx'),
+    'kml': (stream_kml, 'application/vnd.google-earth.kml+xml', 'kml'),
+}
@@ -0,0 +1,127 @@
+"""
+Геометрия маршрутов: длина, отрезки (расстояние и азимут) и bbox
+
+Расчёт векторизован на NumPy: для пачки маршрутов координаты всех точек
+склеиваются в один массив, формула гаверсинусов применяется к нему целиком,
+а суммы и экстремумы по маршрутам считаются через ufunc.reduceat.
+"""
+
+import numpy as np
+
+# Средний радиус Земли (IUGG), м
+EARTH_RADIUS_M = 6371008.8
+
+# Точность хранения: расстояния — до сантиметра, азимуты — до сотой градуса
+DISTANCE_DECIMALS = 2
+BEARING_DECIMALS = 2
+
+
+def empty_stats():
+    return {'length': 0.0, 'legs': [], 'bbox': None}
+
+
+def haversine_legs(lats, lons):
+    """
+    Расстояния (м) и начальные азимуты (градусы от севера по часовой) между
+    соседними точками
+
+    Args:
+        lats, lons: Массивы координат в градусах одинаковой длины n
+
+    Returns:
+        tuple: (расстояния, азимуты) — массивы длины n - 1
+    """
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lons, dtype=np.float64))
+    phi1, phi2 = phi[:-1], phi[1:]
+    delta_lam = lam[1:] - lam[:-1]
+    delta_phi = phi2 - phi1
+
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lam / 2) ** 2
+    distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    y = np.sin(delta_lam) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(delta_lam)
+    bearings = (np.degrees(np.arctan2(y, x)) + 360.0) % 360.0
+    return distances, bearings
+
+
+def haversine_matrix(lats, lons):
+    """
+    Матрица попарных расстояний (м) между точками
+
+    Args:
+        lats, lons: Массивы координат в градусах длины n
+
+    Returns:
+        numpy.ndarray: Симметричная матрица n x n
+    """
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lons, dtype=np.float64))
+    delta_phi = phi[:, None] - phi[None, :]
+    delta_lam = lam[:, None] - lam[None, :]
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi)[:, None] * np.cos(phi)[None, :] * np.sin(delta_lam / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def route_stats_batch(route_ids, lats, lons):
+    """
+    Статистика сразу для нескольких маршрутов
+
+    Args:
+        route_ids: id маршрута для каждой точки; точки одного маршрута идут
+            подряд в порядке следования
+        lats, lons: Координаты точек в градусах
+
+    Returns:
+        dict: id маршрута -> {'length', 'legs', 'bbox'}
+    """
+    route_ids = np.asarray(route_ids)
+    if route_ids.size == 0:
+        return {}
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    starts = np.flatnonzero(np.r_[True, route_ids[1:] != route_ids[:-1]])
+    distances, bearings = haversine_legs(lats, lons)
+    # Отрезок между последней точкой одного маршрута и первой следующего не считаем
+    same_route = route_ids[1:] == route_ids[:-1]
+    distances = np.where(same_route, distances, 0.0)
+
+    # reduceat по отрезкам: у маршрута из k точек k - 1 отрезок, начиная с индекса его первой точки
+    padded = np.r_[distances, 0.0]
+    lengths = np.add.reduceat(padded, starts)
+    min_lats, max_lats = np.minimum.reduceat(lats, starts), np.maximum.reduceat(lats, starts)
+    min_lons, max_lons = np.minimum.reduceat(lons, starts), np.maximum.reduceat(lons, starts)
+
+    distances = np.round(distances, DISTANCE_DECIMALS).tolist()
+    bearings = np.round(bearings, BEARING_DECIMALS).tolist()
+    ends = np.r_[starts[1:], route_ids.size].tolist()
+
+    stats = {}
+    for index, (start, end) in enumerate(zip(starts.tolist(), ends)):
+        stats[route_ids[start].item()] = {
+            'length': round(float(lengths[index]), DISTANCE_DECIMALS),
+            'legs': [
+                {'distance': distances[leg], 'bearing': bearings[leg]}
+                for leg in range(start, end - 1)
+            ],
+            'bbox': [float(min_lons[index]), float(min_lats[index]), float(max_lons[index]), float(max_lats[index])],
+        }
+    return stats
+
+
+def route_stats(coordinates):
+    """
+    Статистика одного маршрута
+
+    Args:
+        coordinates: Последовательность (lat, lon) в порядке точек
+
+    Returns:
+        dict: {'length', 'legs', 'bbox'}
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if coordinates.shape[0] == 0:
+        return empty_stats()
+    return route_stats_batch(np.zeros(coordinates.shape[0], dtype=np.int64), coordinates[:, 0], coordinates[:, 1])[0]
@@ -0,0 +1,317 @@
+"""
+Фоновая обработка загруженных изображений
+
+Запрос на загрузку только сохраняет сырые файлы во временный каталог и
+ставит задачу в очередь — таблицу ImageUploadJob в той же SQLite базе,
+поэтому внешний брокер не нужен. Команда ``manage.py process_image_jobs``
+забирает задачи из очереди и выполняет проверку декодирования, обработку
+EXIF и генерацию уменьшенных копий в пуле процессов.
+
+Если обработчик упал посреди задачи, она остаётся в статусе processing и
+продолжает занимать лимит изображений точки. Такие задачи без движения
+дольше IMAGE_JOBS_STALE_TIMEOUT возвращаются в очередь (requeue_stale_jobs)
+и продолжаются с первого необработанного файла; после
+IMAGE_JOBS_MAX_ATTEMPTS захватов задача завершается ошибкой.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, JpegImagePlugin
+
+from .blobs import acquire_blob, blob_name, delete_blob_files, is_content_addressed
+from .models import ImageUploadJob, PointImage
+from .thumbnails import derivative_name, render_derivatives
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGES_PER_POINT = 4
+
+# Номер тега EXIF Orientation; значение тега 1 — поворот не нужен
+EXIF_ORIENTATION_TAG = 0x0112
+
+DEFAULT_STALE_TIMEOUT = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def get_staging_storage():
+    """Хранилище для сырых файлов, ожидающих обработки (не раздаётся как media)"""
+    return FileSystemStorage(location=settings.IMAGE_JOBS_STAGING_ROOT)
+
+
+def stale_timeout():
+    return getattr(settings, 'IMAGE_JOBS_STALE_TIMEOUT', DEFAULT_STALE_TIMEOUT)
+
+
+def max_attempts():
+    return getattr(settings, 'IMAGE_JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+
+def _pending_jobs(point):
+    return ImageUploadJob.objects.filter(
+        point=point,
+        status__in=[ImageUploadJob.STATUS_PENDING, ImageUploadJob.STATUS_PROCESSING],
+    ).values_list('total_files', 'processed_files')
+
+
+def pending_files_count(point):
+    """Количество файлов точки, которые ещё стоят в очереди"""
+    return sum(total - processed for total, processed in _pending_jobs(point))
+
+
+async def apending_files_count(point):
+    return sum([total - processed async for total, processed in _pending_jobs(point)])
+
+
+def enqueue_upload(point, uploaded_files, user=None):
+    """
+    Сохранение сырых файлов и постановка задачи в очередь
+
+    Args:
+        point: Точка, к которой загружаются изображения
+        uploaded_files: Список загруженных файлов (Django UploadedFile)
+        user: Пользователь, загрузивший файлы
+
+    Returns:
+        ImageUploadJob: Созданная задача
+    """
+    job_id = uuid.uuid4()
+    files = _stage_files(job_id, uploaded_files)
+    return ImageUploadJob.objects.create(
+        id=job_id, point=point, user=user, files=files, total_files=len(files),
+    )
+
+
+async def aenqueue_upload(point, uploaded_files, user=None):
+    """enqueue_upload для асинхронных представлений: файлы копируются в отдельном потоке"""
+    job_id = uuid.uuid4()
+    files = await sync_to_async(_stage_files, thread_sensitive=False)(job_id, uploaded_files)
+    return await ImageUploadJob.objects.acreate(
+        id=job_id, point=point, user=user, files=files, total_files=len(files),
+    )
+
+
+def _stage_files(job_id, uploaded_files):
+    staging = get_staging_storage()
+    files = []
+    for index, uploaded in enumerate(uploaded_files):
+        path = staging.save(os.path.join(str(job_id), f'{index}_{uuid.uuid4().hex}'), uploaded)
+        files.append({'path': path, 'name': uploaded.name})
+    return files
+
+
+def claim_next_job():
+    """
+    Атомарный захват следующей задачи из очереди
+
+    Задача переводится в статус processing условным UPDATE, поэтому
+    несколько обработчиков могут работать одновременно без двойного захвата.
+    Время захвата и номер попытки записываются тем же UPDATE.
+
+    Returns:
+        ImageUploadJob | None
+    """
+    while True:
+        job_id = (
+            ImageUploadJob.objects.filter(status=ImageUploadJob.STATUS_PENDING)
+            .order_by('created_at')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = ImageUploadJob.objects.filter(
+            id=job_id, status=ImageUploadJob.STATUS_PENDING,
+        ).update(
+            status=ImageUploadJob.STATUS_PROCESSING, claimed_at=timezone.now(), attempts=F('attempts') + 1,
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return ImageUploadJob.objects.get(id=job_id)
+
+
+def requeue_stale_jobs(timeout=None):
+    """
+    Возврат брошенных задач в очередь
+
+    Задача processing, которая не продвигалась дольше timeout секунд
+    (updated_at сдвигается после каждого файла), снова становится pending;
+    если попыток уже IMAGE_JOBS_MAX_ATTEMPTS — завершается ошибкой, её
+    сырые файлы удаляются.
+
+    Args:
+        timeout: Секунды без движения (по умолчанию IMAGE_JOBS_STALE_TIMEOUT)
+
+    Returns:
+        tuple: (возвращено в очередь, завершено ошибкой)
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_timeout() if timeout is None else timeout)
+    stale = ImageUploadJob.objects.filter(
+        status=ImageUploadJob.STATUS_PROCESSING, claimed_at__lte=cutoff, updated_at__lte=cutoff,
+    )
+    failed = 0
+    for job in stale.filter(attempts__gte=max_attempts()):
+        # Условие повторяется в UPDATE: задачу мог успеть завершить сам обработчик
+        if stale.filter(id=job.id).update(status=ImageUploadJob.STATUS_FAILED, updated_at=timezone.now()):
+            job.errors.append(f'Обработка прервана {job.attempts} раз(а)')
+            job.save(update_fields=['errors'])
+            delete_staged_files(job)
+            failed += 1
+    requeued = stale.filter(attempts__lt=max_attempts()).update(
+        status=ImageUploadJob.STATUS_PENDING, updated_at=timezone.now(),
+    )
+    if requeued or failed:
+        logger.warning("♻️ Stale upload jobs: %d requeued, %d failed", requeued, failed)
+    return requeued, failed
+
+
+def fail_job(job, error):
+    """Завершение задачи ошибкой с удалением её сырых файлов"""
+    job.errors.append(error)
+    job.status = ImageUploadJob.STATUS_FAILED
+    job.save(update_fields=['status', 'errors', 'updated_at'])
+    delete_staged_files(job)
+
+
+def delete_staged_files(job):
+    shutil.rmtree(get_staging_storage().path(str(job.id)), ignore_errors=True)
+
+
+def _save_options(image):
+    """
+    Параметры пересохранения, сохраняющие качество исходника
+
+    Без них Pillow пережимает JPEG с quality=75 и субдискретизацией 4:2:0,
+    поэтому берутся таблицы квантования и субдискретизация исходного файла.
+    """
+    options = {}
+    if image.info.get('icc_profile'):
+        options['icc_profile'] = image.info['icc_profile']
+    if image.format == 'JPEG':
+        options['qtables'] = image.quantization
+        options['subsampling'] = JpegImagePlugin.get_sampling(image)
+    return options
+
+
+def prepare_image(task):
+    """
+    Обработка одного файла в процессе пула
+
+    Проверяет, что файл декодируется, применяет поворот по EXIF,
+    сохраняет итоговый файл и его уменьшенные копии в хранилище media.
+    Работает только с файлами, без обращений к БД. В контентно-адресуемом
+    режиме файл кладётся по имени от хеша, уже существующие файлы не пишутся.
+
+    Args:
+        task (dict): {'staging_path', 'original_name', 'point_id', 'content_addressed'}
+
+    Returns:
+        dict: {'name', 'derivatives', 'sha256', 'size'} или {'error'}
+    """
+    original_name = task['original_name']
+    try:
+        with get_staging_storage().open(task['staging_path'], 'rb') as staged:
+            content = staged.read()
+
+        with Image.open(io.BytesIO(content)) as probe:
+            probe.verify()
+
+        with Image.open(io.BytesIO(content)) as image:
+            image_format = image.format
+            orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            if orientation != 1:
+                # Поворачиваем пиксели, чтобы исходник и копии отображались одинаково
+                rotated = ImageOps.exif_transpose(image)
+                buffer = io.BytesIO()
+                rotated.save(buffer, image_format, **_save_options(image))
+                content = buffer.getvalue()
+
+        extension = os.path.splitext(original_name)[1].lower().lstrip('.') or image_format.lower()
+        if task.get('content_addressed'):
+            digest = hashlib.sha256(content).hexdigest()
+            name = blob_name(digest, extension)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(content))
+        else:
+            digest = None
+            name = default_storage.save(
+                os.path.join('point_images', str(task['point_id']), f'{uuid.uuid4()}.{extension}'),
+                ContentFile(content),
+            )
+
+        derivatives = []
+        for width, fmt, rendered in render_derivatives(content):
+            target = derivative_name(name, width, fmt)
+            if not (digest and default_storage.exists(target)):
+                target = default_storage.save(target, ContentFile(rendered))
+            derivatives.append({'width': width, 'format': fmt, 'name': target})
+        return {'name': name, 'derivatives': derivatives, 'sha256': digest, 'size': len(content)}
+    except Exception as e:
+        return {'error': f'Файл {original_name} не удалось обработать: {e}'}
+
+
+def process_job(job, executor):
+    """
+    Выполнение задачи: файлы обрабатываются в пуле, записи PointImage
+    создаются в основном процессе по мере готовности
+
+    Задача, возвращённая в очередь после сбоя, продолжается с первого
+    необработанного файла (processed_files).
+
+    Args:
+        job (ImageUploadJob): Захваченная задача
+        executor: concurrent.futures.Executor для обработки файлов
+    """
+    content_addressed = is_content_addressed()
+    tasks = [
+        {
+            'staging_path': item['path'], 'original_name': item['name'], 'point_id': job.point_id,
+            'content_addressed': content_addressed,
+        }
+        for item in job.files[job.processed_files:]
+    ]
+    logger.info("⚙️ Processing job %s: %d file(s) for point %s", job.id, len(tasks), job.point_id)
+
+    for result in executor.map(prepare_image, tasks):
+        if 'error' in result:
+            job.errors.append(result['error'])
+        else:
+            with transaction.atomic():
+                # Лимит проверяется повторно: за время ожидания могли загрузить другие файлы
+                if PointImage.objects.filter(point_id=job.point_id).count() >= MAX_IMAGES_PER_POINT:
+                    job.errors.append(f'Maximum {MAX_IMAGES_PER_POINT} images per point')
+                    if result['sha256'] is None:
+                        default_storage.delete(result['name'])
+                        for derivative in result['derivatives']:
+                            default_storage.delete(derivative['name'])
+                    else:
+                        delete_blob_files(result['name'], result['derivatives'])
+                else:
+                    blob = None
+                    if result['sha256'] is not None:
+                        blob = acquire_blob(result['sha256'], result['name'], result['size'])
+                    image = PointImage.objects.create(
+                        point_id=job.point_id, image=blob.name if blob else result['name'],
+                        derivatives=result['derivatives'], blob=blob,
+                    )
+                    job.image_ids.append(image.id)
+        job.processed_files += 1
+        job.save(update_fields=['processed_files', 'image_ids', 'errors', 'updated_at'])
+
+    job.status = ImageUploadJob.STATUS_DONE if job.image_ids or not job.errors else ImageUploadJob.STATUS_FAILED
+    job.save(update_fields=['status', 'updated_at'])
+
+    delete_staged_files(job)
+    logger.info("✅ Job %s finished: %d saved, %d error(s)", job.id, len(job.image_ids), len(job.errors))
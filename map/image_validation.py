@@ -31,6 +31,22 @@ ALLOWED_MIME_TYPES = [
 MAX_IMAGE_SIZE_BYTES = 1 * 1024 * 1024
 MAX_IMAGE_SIZE_MB = 1
 
+# Максимальное количество пикселей (защита от "декомпрессионных бомб")
+MAX_IMAGE_PIXELS = 40 * 1000 * 1000
+
+# Сигнатуры (magic bytes) допустимых форматов: (смещение, байты) -> MIME-тип
+IMAGE_SIGNATURES = [
+    ([(0, b'\xff\xd8\xff')], 'image/jpeg'),
+    ([(0, b'\x89PNG\r\n\x1a\n')], 'image/png'),
+    ([(0, b'GIF87a')], 'image/gif'),
+    ([(0, b'GIF89a')], 'image/gif'),
+    ([(0, b'RIFF'), (8, b'WEBP')], 'image/webp'),
+    ([(0, b'BM')], 'image/bmp'),
+]
+
+# Сколько первых байт файла нужно для определения формата по сигнатуре
+SIGNATURE_BYTES = 12
+
 
 def get_allowed_formats_string():
     """Получить строку с допустимыми форматами для отображения"""
@@ -81,6 +97,32 @@ def is_valid_image_size(size_in_bytes):
     return size_in_bytes <= MAX_IMAGE_SIZE_BYTES
 
 
+def detect_image_mime_type(header):
+    """
+    Определение формата изображения по первым байтам файла
+
+    Args:
+        header (bytes): Начало файла (не меньше SIGNATURE_BYTES байт)
+
+    Returns:
+        str | None: MIME-тип или None, если сигнатура не распознана
+    """
+    for parts, mime_type in IMAGE_SIGNATURES:
+        if all(header[offset:offset + len(magic)] == magic for offset, magic in parts):
+            return mime_type
+    return None
+
+
+def is_valid_image_pixels(width, height):
+    """
+    Проверка размеров изображения в пикселях
+
+    Returns:
+        bool: True если количество пикселей допустимо
+    """
+    return width > 0 and height > 0 and width * height <= MAX_IMAGE_PIXELS
+
+
 def validate_image_file(file):
     """
     Комплексная проверка файла изображения
@@ -93,43 +135,26 @@ def validate_image_file(file):
         list: Список ошибок (пустой список если файл валиден)
     """
     errors = []
-    logger.info(f"\n{'=' * 60}")
-    logger.info(f"🔍 VALIDATING FILE: {file.name}")
-    logger.info(f"{'=' * 60}")
+    logger.debug("🔍 Validating file %s: %d bytes, content-type %s", file.name, file.size, file.content_type)
 
     # 1. Проверка размера файла
-    file_size_mb = file.size / (1024 * 1024)
-    logger.info(f"📦 File size: {file.size} bytes ({file_size_mb:.2f} MB)")
-
     if not is_valid_image_size(file.size):
-        error_msg = f'Файл {file.name} слишком большой ({file_size_mb:.2f} МБ). Максимум: {MAX_IMAGE_SIZE_MB} МБ'
-        logger.error(f"❌ {error_msg}")
-        errors.append(error_msg)
+        file_size_mb = file.size / (1024 * 1024)
+        errors.append(f'Файл {file.name} слишком большой ({file_size_mb:.2f} МБ). Максимум: {MAX_IMAGE_SIZE_MB} МБ')
 
     # 2. Проверка расширения файла
-    file_ext = os.path.splitext(file.name.lower())[1]
-    logger.info(f"📄 File extension: {file_ext}")
-
     if not is_valid_image_extension(file.name):
-        error_msg = f'Файл {file.name} имеет недопустимое расширение. Разрешены: {get_allowed_formats_string()}'
-        logger.error(f"❌ {error_msg}")
-        errors.append(error_msg)
+        errors.append(f'Файл {file.name} имеет недопустимое расширение. Разрешены: {get_allowed_formats_string()}')
 
     # 3. Проверка MIME-типа из заголовка
-    logger.info(f"🏷️  Content-Type (from header): {file.content_type}")
-
     if not is_valid_mime_type(file.content_type):
-        error_msg = f'Файл {file.name} имеет недопустимый MIME-тип: {file.content_type}. Разрешены: {", ".join(ALLOWED_MIME_TYPES)}'
-        logger.error(f"❌ {error_msg}")
-        errors.append(error_msg)
+        errors.append(
+            f'Файл {file.name} имеет недопустимый MIME-тип: {file.content_type}. '
+            f'Разрешены: {", ".join(ALLOWED_MIME_TYPES)}'
+        )
 
-    # Итоговый результат
     if errors:
-        logger.error(f"❌ VALIDATION FAILED with {len(errors)} error(s)")
-        for i, err in enumerate(errors, 1):
-            logger.error(f"   {i}. {err}")
+        logger.debug("❌ %s: %d validation error(s): %s", file.name, len(errors), errors)
     else:
-        logger.info(f"✅ VALIDATION PASSED")
-
-    logger.info(f"{'=' * 60}\n")
+        logger.debug("✅ %s: validation passed", file.name)
     return errors
@@ -0,0 +1,536 @@
+"""
+Импорт треков из GPX, GeoJSON и CSV в маршруты
+
+Файлы читаются потоково: GPX — через ElementTree.iterparse с очисткой
+разобранных элементов, GeoJSON — потоковым лексером (вершины линий не
+собираются в списки даже внутри одного объекта), CSV — построчно.
+Вершины каждого трека проходят через StreamingSimplifier, поэтому память ограничена
+независимо от размера файла, а в маршрут попадает не больше точек, чем
+разрешает тариф. Точки записываются одним bulk_create на маршрут.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import clustering, counters, route_events
+from .models import Point, Route
+from .route_stats import save_route_stats
+from .signals import suppress_point_signals
+from .simplification import StreamingSimplifier
+from .subscription_limits import get_max_points_per_route, get_max_routes
+
+IMPORT_FORMATS = ('gpx', 'geojson', 'csv')
+
+JSON_READ_SIZE = 64 * 1024
+# Сколько символов должно оставаться в буфере после текущей лексемы перед разбором следующей
+JSON_LOOKAHEAD = 256
+
+CSV_LAT_COLUMNS = ('lat', 'latitude', 'широта')
+CSV_LON_COLUMNS = ('lon', 'lng', 'long', 'longitude', 'долгота')
+CSV_ROUTE_COLUMNS = ('route', 'track', 'маршрут')
+
+COORDINATE_PLACES = Decimal('0.000000000000001')
+
+
+class TrackImportError(ValueError):
+    """Файл не удалось разобрать или импорт превышает лимиты тарифа"""
+
+
+def detect_format(file_name, fmt=None):
+    """Формат по явному параметру или расширению файла"""
+    fmt = (fmt or os.path.splitext(file_name or '')[1].lstrip('.')).lower()
+    if fmt == 'json':
+        fmt = 'geojson'
+    if fmt not in IMPORT_FORMATS:
+        raise TrackImportError(f'Неизвестный формат файла. Поддерживаются: {", ".join(IMPORT_FORMATS)}')
+    return fmt
+
+
+def _vertex(lat, lon, name=None, description=None):
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise TrackImportError(f'Координаты вне допустимого диапазона: {lat}, {lon}')
+    return (lat, lon, name or None, description or None)
+
+
+# --- GPX ---
+
+_local_names = {}
+
+
+def _local_name(tag):
+    """Имя тега без пространства имён (теги GPX повторяются — кешируем)"""
+    name = _local_names.get(tag)
+    if name is None:
+        name = _local_names[tag] = tag.rsplit('}', 1)[-1]
+    return name
+
+
+def _child_text(element, name):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or '').strip() or None
+    return None
+
+
+def iter_gpx_tracks(file, max_points):
+    """
+    Треки GPX: каждый trk (все сегменты подряд) и rte — отдельный трек;
+    отдельные wpt собираются в один трек
+
+    Разобранные точки сразу удаляются из дерева, поэтому дерево не растёт.
+
+    Yields:
+        tuple: (название, описание, StreamingSimplifier с вершинами трека)
+    """
+    waypoints = StreamingSimplifier(max_points)
+    track = None
+    stack = []
+    try:
+        for event, element in ET.iterparse(file, events=('start', 'end')):
+            tag = _local_name(element.tag)
+            if event == 'start':
+                stack.append(element)
+                if tag in ('trk', 'rte') and track is None:
+                    track = (element, StreamingSimplifier(max_points))
+                continue
+
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if tag in ('trkpt', 'rtept', 'wpt'):
+                vertex = _vertex(
+                    element.get('lat'), element.get('lon'),
+                    _child_text(element, 'name'), _child_text(element, 'desc'),
+                )
+                if tag == 'wpt':
+                    waypoints.add(vertex)
+                elif track is not None:
+                    track[1].add(vertex)
+            elif track is not None and element is track[0]:
+                yield _child_text(element, 'name'), _child_text(element, 'desc'), track[1]
+                track = None
+            elif tag != 'trkseg':
+                continue
+            if parent is not None:
+                parent.remove(element)
+    except (ET.ParseError, TypeError, ValueError) as e:
+        if isinstance(e, TrackImportError):
+            raise
+        raise TrackImportError(f'Некорректный GPX: {e}')
+    if waypoints.source_count:
+        yield 'Точки', None, waypoints
+
+
+# --- GeoJSON ---
+
+# Лексемы JSON; пробелы перед лексемой пропускаются тем же совпадением
+_JSON_TOKEN = re.compile(r"""
+    [\ \t\r\n]*
+    (?:
+        (?P<punct>[{}\[\]:,])
+      | (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<number>-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)
+      | (?P<literal>true|false|null)
+    )
+""", re.VERBOSE)
+
+_JSON_LITERALS = {'true': True, 'false': False, 'null': None}
+
+# Символы, с которых может начинаться лексема (остальное — ошибка сразу, без дочитывания файла)
+_JSON_TOKEN_START = frozenset('{}[]:,"-0123456789tfn')
+
+
+def iter_json_tokens(text_file, read_size=JSON_READ_SIZE):
+    """
+    Потоковый лексер JSON: текст читается блоками по read_size, в памяти —
+    только текущий блок и незаконченная лексема
+
+    Yields:
+        tuple: (вид, значение): вид — один из символов {}[]:, (значение None),
+        'string', 'number' (float) или 'literal' (True, False, None)
+    """
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        # Запас после текущей позиции: число или литерал не обрываются концом блока
+        if not eof and len(buffer) - position < JSON_LOOKAHEAD:
+            chunk = text_file.read(read_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+        match = _JSON_TOKEN.match(buffer, position)
+        if match is None:
+            rest = buffer[position:].lstrip(' \t\r\n')
+            if not rest and eof:
+                return
+            if rest and rest[0] not in _JSON_TOKEN_START:
+                raise TrackImportError('Некорректный GeoJSON')
+            if eof:
+                raise TrackImportError('Неожиданный конец GeoJSON')
+            # Строка длиннее блока: дочитываем до её конца
+            chunk = text_file.read(read_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            eof = not chunk
+            continue
+        position = match.end()
+        kind = match.lastgroup
+        if kind == 'punct':
+            yield match.group('punct'), None
+        elif kind == 'number':
+            yield 'number', float(match.group('number'))
+        elif kind == 'string':
+            text = match.group('string')
+            yield 'string', json.loads(text) if '\\' in text else text[1:-1]
+        else:
+            yield 'literal', _JSON_LITERALS[match.group('literal')]
+
+
+def _next_token(tokens):
+    token = next(tokens, None)
+    if token is None:
+        raise TrackImportError('Неожиданный конец GeoJSON')
+    return token
+
+
+def _expect(tokens, kind):
+    if _next_token(tokens)[0] != kind:
+        raise TrackImportError('Некорректный GeoJSON')
+
+
+def _read_value(tokens, token):
+    """Значение целиком (для небольших частей: properties, type)"""
+    kind, value = token
+    if kind in ('string', 'number', 'literal'):
+        return value
+    if kind == '[':
+        items = []
+        for item_token in _iter_items(tokens, ']'):
+            items.append(_read_value(tokens, item_token))
+        return items
+    if kind == '{':
+        return {key: _read_value(tokens, _next_token(tokens)) for key in _iter_keys(tokens)}
+    raise TrackImportError('Некорректный GeoJSON')
+
+
+def _skip_value(tokens, token):
+    """Пропуск значения без построения объектов"""
+    if token[0] not in ('{', '['):
+        if token[0] in ('string', 'number', 'literal'):
+            return
+        raise TrackImportError('Некорректный GeoJSON')
+    depth = 1
+    while depth:
+        kind = _next_token(tokens)[0]
+        if kind in ('{', '['):
+            depth += 1
+        elif kind in ('}', ']'):
+            depth -= 1
+
+
+def _iter_items(tokens, closing):
+    """Первые лексемы элементов массива (после '['); значение элемента читает вызывающий"""
+    token = _next_token(tokens)
+    if token[0] == closing:
+        return
+    while True:
+        yield token
+        kind = _next_token(tokens)[0]
+        if kind == closing:
+            return
+        if kind != ',':
+            raise TrackImportError('Некорректный GeoJSON')
+        token = _next_token(tokens)
+
+
+def _iter_keys(tokens):
+    """Ключи объекта (после '{'); после каждого ключа вызывающий читает значение"""
+    token = _next_token(tokens)
+    if token[0] == '}':
+        return
+    while True:
+        if token[0] != 'string':
+            raise TrackImportError('Некорректный GeoJSON')
+        _expect(tokens, ':')
+        yield token[1]
+        kind = _next_token(tokens)[0]
+        if kind == '}':
+            return
+        if kind != ',':
+            raise TrackImportError('Некорректный GeoJSON')
+        token = _next_token(tokens)
+
+
+def _stream_coordinates(tokens, on_position):
+    """
+    Обход массива coordinates (после '[') без построения вложенных списков
+
+    on_position(координаты, глубина) вызывается для каждой позиции:
+    глубина 1 у Point, 2 у LineString, 3 у MultiLineString
+    """
+    depth = 1
+    numbers = []
+    while depth:
+        kind, value = _next_token(tokens)
+        if kind == 'number':
+            numbers.append(value)
+        elif kind == '[':
+            depth += 1
+            numbers = []
+        elif kind == ']':
+            if numbers:
+                on_position(numbers, depth)
+                numbers = []
+            depth -= 1
+        elif kind != ',':
+            raise TrackImportError('Некорректные координаты в GeoJSON')
+
+
+def _read_geometry(tokens, max_points):
+    """
+    Геометрия объекта: (тип, координаты Point или None, StreamingSimplifier линии)
+
+    Вершины линии сразу уходят в StreamingSimplifier. Ключ type может идти
+    после coordinates, поэтому вершины добавляются, пока тип не известен
+    или это линия; остальные геометрии пропускаются.
+    """
+    geometry_type = None
+    point = None
+    track = StreamingSimplifier(max_points)
+
+    def on_position(numbers, depth):
+        nonlocal point
+        if depth == 1:
+            point = numbers
+        elif geometry_type in (None, 'LineString', 'MultiLineString'):
+            track.add(_vertex(numbers[1], numbers[0]))
+
+    for key in _iter_keys(tokens):
+        token = _next_token(tokens)
+        if key == 'type':
+            geometry_type = _read_value(tokens, token)
+        elif key == 'coordinates' and geometry_type in (None, 'Point', 'LineString', 'MultiLineString'):
+            if token[0] != '[':
+                raise TrackImportError('Некорректные координаты в GeoJSON')
+            _stream_coordinates(tokens, on_position)
+        else:
+            _skip_value(tokens, token)
+    return geometry_type, point, track
+
+
+def _read_feature(tokens, token, max_points):
+    """Объект Feature: (тип геометрии, координаты точки, линия, properties)"""
+    if token[0] != '{':
+        _skip_value(tokens, token)
+        return None, None, None, {}
+    geometry_type, point, track, properties = None, None, None, {}
+    for key in _iter_keys(tokens):
+        token = _next_token(tokens)
+        if key == 'geometry' and token[0] == '{':
+            geometry_type, point, track = _read_geometry(tokens, max_points)
+        elif key == 'properties' and token[0] == '{':
+            properties = _read_value(tokens, token)
+        else:
+            _skip_value(tokens, token)
+    return geometry_type, point, track, properties
+
+
+def iter_geojson_features(text_file, max_points):
+    """
+    Объекты массива features верхнего уровня, по одному
+
+    Ключ features ищется лексером (в том числе после других ключей
+    FeatureCollection), поэтому строка "features" внутри значений не мешает.
+    Координаты линий не собираются в списки: вершины по одной уходят в
+    StreamingSimplifier, память не зависит от размера объекта.
+
+    Yields:
+        tuple: (тип геометрии, координаты точки, StreamingSimplifier линии, properties)
+    """
+    tokens = iter_json_tokens(text_file)
+    if _next_token(tokens)[0] != '{':
+        raise TrackImportError('GeoJSON должен быть объектом FeatureCollection')
+    found = False
+    for key in _iter_keys(tokens):
+        token = _next_token(tokens)
+        if key != 'features' or found:
+            _skip_value(tokens, token)
+            continue
+        if token[0] != '[':
+            raise TrackImportError('"features" должен быть массивом')
+        found = True
+        for item_token in _iter_items(tokens, ']'):
+            yield _read_feature(tokens, item_token, max_points)
+    if not found:
+        raise TrackImportError('В GeoJSON нет массива "features"')
+
+
+def iter_geojson_tracks(text_file, max_points):
+    """
+    Треки GeoJSON: каждый LineString/MultiLineString — отдельный трек;
+    объекты Point собираются в один трек
+    """
+    points = StreamingSimplifier(max_points)
+    features = iter_geojson_features(text_file, max_points)
+    try:
+        for geometry_type, point, track, properties in features:
+            if not isinstance(properties, dict):
+                properties = {}
+            name = properties.get('name')
+            description = properties.get('description')
+            if geometry_type == 'Point' and point is not None:
+                points.add(_vertex(point[1], point[0], name, description))
+            elif geometry_type in ('LineString', 'MultiLineString'):
+                yield name, description, track
+    except (IndexError, TypeError, ValueError) as e:
+        if isinstance(e, TrackImportError):
+            raise
+        raise TrackImportError(f'Некорректные координаты в GeoJSON: {e}')
+    if points.source_count:
+        yield 'Точки', None, points
+
+
+# --- CSV ---
+
+def _find_column(header, names):
+    for index, column in enumerate(header):
+        if column.strip().lower() in names:
+            return index
+    return None
+
+
+def iter_csv_tracks(text_file, max_points):
+    """
+    Треки CSV: обязательны колонки lat/lon, необязательны name, description
+    и route — строки с одинаковым route подряд образуют один трек
+    """
+    reader = csv.reader(text_file)
+    header = next(reader, None)
+    if not header:
+        raise TrackImportError('Пустой CSV')
+    lat_index = _find_column(header, CSV_LAT_COLUMNS)
+    lon_index = _find_column(header, CSV_LON_COLUMNS)
+    if lat_index is None or lon_index is None:
+        raise TrackImportError('В CSV должны быть колонки lat и lon')
+    name_index = _find_column(header, ('name', 'название'))
+    description_index = _find_column(header, ('description', 'описание'))
+    route_index = _find_column(header, CSV_ROUTE_COLUMNS)
+
+    def cell(row, index):
+        return row[index].strip() if index is not None and index < len(row) else None
+
+    current_route, track = None, None
+    for line_number, row in enumerate(reader, start=2):
+        if not any(value.strip() for value in row):
+            continue
+        route_name = cell(row, route_index)
+        if track is not None and route_name != current_route:
+            yield current_route, None, track
+            track = None
+        if track is None:
+            current_route, track = route_name, StreamingSimplifier(max_points)
+        try:
+            track.add(_vertex(
+                cell(row, lat_index), cell(row, lon_index),
+                cell(row, name_index), cell(row, description_index),
+            ))
+        except (TypeError, ValueError) as e:
+            if isinstance(e, TrackImportError):
+                raise
+            raise TrackImportError(f'Строка {line_number}: некорректные координаты')
+    if track is not None:
+        yield current_route, None, track
+
+
+def iter_tracks(file, fmt, max_points):
+    """
+    Треки файла заданного формата (файл открыт в двоичном режиме)
+
+    Yields:
+        tuple: (название, описание, StreamingSimplifier с вершинами трека)
+    """
+    if fmt == 'gpx':
+        return iter_gpx_tracks(file, max_points)
+    text_file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if fmt == 'geojson':
+        return iter_geojson_tracks(text_file, max_points)
+    return iter_csv_tracks(text_file, max_points)
+
+
+def _point_value(value):
+    return Decimal(repr(value)).quantize(COORDINATE_PLACES)
+
+
+def import_tracks(file, fmt, user, default_name=None):
+    """
+    Импорт всех треков файла в маршруты пользователя
+
+    Вся загрузка выполняется в одной транзакции: при ошибке разбора или
+    превышении лимита маршрутов ничего не сохраняется.
+
+    Args:
+        file: Файл в двоичном режиме
+        fmt (str): Формат (gpx, geojson, csv)
+        user: Владелец маршрутов
+        default_name (str): Название для треков без имени
+
+    Returns:
+        list: [{'id', 'name', 'points_count', 'source_points'}] по созданным маршрутам
+    """
+    profile = user.profile
+    subscription = profile.get_subscription_status()
+    max_points = get_max_points_per_route(subscription)
+    max_routes = get_max_routes(subscription)
+    created = []
+
+    with transaction.atomic():
+        for name, description, simplifier in iter_tracks(file, fmt, max_points):
+            if not simplifier.source_count:
+                continue
+
+            route = Route.objects.create(
+                user=user,
+                name=(name or default_name or 'Импортированный маршрут')[:200],
+                description=description,
+            )
+            # Счётчик маршрутов увеличен сигналом: проверяем лимит после увеличения, как в perform_create
+            if counters.current_routes_count(user.id) > max_routes:
+                raise TrackImportError(
+                    f'Максимальное количество маршрутов ({max_routes}) достигнуто. Обновите подписку.'
+                )
+
+            points = []
+            for order, (lat, lon, point_name, point_description) in enumerate(simplifier.result()):
+                point = Point(
+                    route=route, order=order, lat=_point_value(lat), lon=_point_value(lon),
+                    name=(point_name or '')[:200] or None, description=point_description,
+                )
+                point.update_geohash()
+                points.append(point)
+            with suppress_point_signals():
+                Point.objects.bulk_create(points)
+            route_events.schedule_changes('point', 'created', [point.pk for point in points if point.pk])
+            coordinates = [(float(p.lat), float(p.lon)) for p in points]
+            clustering.apply_point_changes(user.id, added=coordinates)
+            counters.refresh_route_counters([route.id])
+            save_route_stats(route, coordinates)
+
+            created.append({
+                'id': route.id,
+                'name': route.name,
+                'points_count': len(points),
+                'source_points': simplifier.source_count,
+            })
+
+    if not created:
+        raise TrackImportError('В файле не найдено ни одного трека')
+    return created
@@ -0,0 +1,260 @@
+"""
+Метрики запросов: число SQL-запросов, время SQL, сериализации, рендеринга
+и общее время
+
+RequestMetricsMiddleware замеряет долю запросов, заданную настройкой
+``REQUEST_METRICS_SAMPLE_RATE`` (0 — выключено, 1 — все запросы). Для
+выбранных запросов:
+
+* SQL считается через connection.execute_wrapper (работает и без DEBUG);
+* время делится на фазы по хукам middleware: view (process_view ->
+  process_template_response) и render (до post-render callback ответа);
+  «serialize» — время view без SQL, т.е. построение данных ответа;
+* в ответ добавляется заголовок Server-Timing, если включён
+  ``REQUEST_METRICS_HEADER`` (по умолчанию выключен) и пользователь —
+  сотрудник (is_staff): остальным число SQL-запросов не показывается;
+* значения попадают в гистограммы по эндпоинтам (METRICS), которые
+  отдаёт /api/metrics/requests/ для администраторов.
+
+Под ASGI middleware работает асинхронно: обёртка SQL ставится на
+соединение потока, в котором sync_to_async выполняет запросы этого
+HTTP-запроса (соединения БД привязаны к потоку).
+
+Гистограммы хранятся в памяти процесса: у каждого воркера — свои.
+"""
+
+import bisect
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+# Верхние границы корзин гистограмм, мс (последняя корзина — всё, что больше)
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+TIMING_NAMES = ('db', 'serialize', 'render', 'total')
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.0)
+
+
+class RequestMetrics:
+    """Замеры одного запроса"""
+
+    __slots__ = ('started', 'phase', 'phase_started', 'durations', 'phase_db', 'queries', 'db_ms')
+
+    def __init__(self):
+        self.started = self.phase_started = time.perf_counter()
+        self.phase = 'middleware'
+        self.durations = {}
+        self.phase_db = {}
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper: время и число SQL-запросов"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_ms += elapsed
+            self.phase_db[self.phase] = self.phase_db.get(self.phase, 0.0) + elapsed
+
+    def start_phase(self, phase):
+        now = time.perf_counter()
+        self.durations[self.phase] = self.durations.get(self.phase, 0.0) + (now - self.phase_started) * 1000
+        self.phase, self.phase_started = phase, now
+
+    def finish(self):
+        """
+        Returns:
+            dict: {'db', 'serialize', 'render', 'total'} в мс и 'queries'
+        """
+        self.start_phase('done')
+
+        def without_db(phase):
+            return max(self.durations.get(phase, 0.0) - self.phase_db.get(phase, 0.0), 0.0)
+
+        return {
+            'db': self.db_ms,
+            'serialize': without_db('view'),
+            'render': without_db('render'),
+            'total': (self.phase_started - self.started) * 1000,
+            'queries': self.queries,
+        }
+
+
+def server_timing_header(values):
+    """Пример: db;dur=3.1;desc="4 queries", serialize;dur=12.0, render;dur=1.2, total;dur=17.5"""
+    parts = [f'db;dur={values["db"]:.1f};desc="{values["queries"]} queries"']
+    parts += [f'{name};dur={values[name]:.1f}' for name in TIMING_NAMES[1:]]
+    return ', '.join(parts)
+
+
+class MetricsRegistry:
+    """Гистограммы времени по эндпоинтам (потокобезопасно)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._since = timezone.now()
+
+    def record(self, endpoint, values, status_code):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'count': 0, 'errors': 0, 'queries_sum': 0, 'queries_max': 0,
+                    'timings': {
+                        name: {'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)}
+                        for name in TIMING_NAMES
+                    },
+                }
+            stats['count'] += 1
+            if status_code >= 500:
+                stats['errors'] += 1
+            stats['queries_sum'] += values['queries']
+            stats['queries_max'] = max(stats['queries_max'], values['queries'])
+            for name in TIMING_NAMES:
+                timing = stats['timings'][name]
+                value = values[name]
+                timing['sum'] += value
+                timing['max'] = max(timing['max'], value)
+                timing['buckets'][bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value)] += 1
+
+    @staticmethod
+    def _quantile(buckets, count, q):
+        """Оценка квантиля сверху: граница корзины, в которую он попадает"""
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return HISTOGRAM_BUCKETS_MS[index] if index < len(HISTOGRAM_BUCKETS_MS) else None
+        return None
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {'since', 'sample_rate', 'buckets_ms', 'endpoints': {эндпоинт: сводка}}
+        """
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                count = stats['count']
+                endpoints[endpoint] = {
+                    'count': count,
+                    'errors': stats['errors'],
+                    'queries': {'avg': round(stats['queries_sum'] / count, 2), 'max': stats['queries_max']},
+                    'timings': {
+                        name: {
+                            'avg': round(timing['sum'] / count, 2),
+                            'max': round(timing['max'], 2),
+                            'p50': self._quantile(timing['buckets'], count, 0.5),
+                            'p95': self._quantile(timing['buckets'], count, 0.95),
+                            'p99': self._quantile(timing['buckets'], count, 0.99),
+                            'histogram': list(timing['buckets']),
+                        }
+                        for name, timing in stats['timings'].items()
+                    },
+                }
+            return {
+                'since': self._since.isoformat(),
+                'sample_rate': sample_rate(),
+                'buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+                'endpoints': endpoints,
+            }
+
+
+METRICS = MetricsRegistry()
+
+
+def endpoint_name(request):
+    """Метод и имя URL (route-list, route-detail, ...), не зависящее от id в пути"""
+    match = getattr(request, 'resolver_match', None)
+    name = (match.view_name or match.route) if match is not None else 'unresolved'
+    return f'{request.method} {name}'
+
+
+def is_sampled():
+    rate = sample_rate()
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def header_enabled():
+    return getattr(settings, 'REQUEST_METRICS_HEADER', False)
+
+
+def can_see_timings(request):
+    """Server-Timing только для сотрудников (пользователь уже определён view или middleware)"""
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+class RequestMetricsMiddleware:
+    """Замеры выборки запросов: заголовок Server-Timing и гистограммы METRICS"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not is_sampled():
+            return self.get_response(request)
+
+        metrics = request._request_metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics.execute):
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, header_enabled() and can_see_timings(request))
+
+    async def __acall__(self, request):
+        if not is_sampled():
+            return await self.get_response(request)
+
+        metrics = request._request_metrics = RequestMetrics()
+        wrappers = await sync_to_async(lambda: connection.execute_wrappers)()
+        wrappers.append(metrics.execute)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrappers.remove(metrics.execute)
+        # request.user ленивый и может обратиться к сессии в БД
+        show_header = header_enabled() and await sync_to_async(can_see_timings)(request)
+        return self.finish(request, response, metrics, show_header)
+
+    def finish(self, request, response, metrics, show_header):
+        values = metrics.finish()
+        METRICS.record(endpoint_name(request), values, response.status_code)
+        if show_header:
+            response['Server-Timing'] = server_timing_header(values)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, '_request_metrics', None)
+        if metrics is not None:
+            metrics.start_phase('view')
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после этого хука; конец рендеринга — post-render callback
+        metrics = getattr(request, '_request_metrics', None)
+        if metrics is not None:
+            metrics.start_phase('render')
+            response.add_post_render_callback(lambda rendered: metrics.start_phase('after'))
+        return response
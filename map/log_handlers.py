@@ -0,0 +1,161 @@
+"""
+Неблокирующее логирование: очередь, фоновый поток, выборка и структурные записи
+
+* BackgroundQueueHandler — QueueHandler, который кладёт запись в
+  ограниченную очередь и сразу возвращает управление; форматирование
+  (formatter) и запись в поток выполняет QueueListener в фоновом потоке. Поток
+  запускается при первой записи, а не в dictConfig: процессы, которые
+  ничего не пишут (и мастер-процесс перед fork воркеров), его не создают.
+  При переполнении очереди записи отбрасываются (счётчик ``dropped``,
+  сумма по процессу — dropped_records() и /api/metrics/requests/, итог —
+  предупреждением при закрытии), запрос не ждёт вывода.
+* SamplingFilter — пропускает долю записей до заданного уровня
+  включительно (например, 10% INFO); WARNING и выше — всегда.
+* StructuredFormatter — добавляет к сообщению поля из ``extra={'data': {...}}``
+  в виде key=value.
+
+Сообщения передаются с аргументами (``logger.debug('%s', value)``), а не
+f-строками: строка собирается только для записей, прошедших уровень и
+фильтры. Аргументы подставляются ещё в потоке вызова — изменяемые объекты
+могут измениться, пока запись ждёт в очереди; оформление записи formatter'ом
+и вывод остаются фоновому потоку.
+"""
+
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+
+DEFAULT_QUEUE_SIZE = 10000
+
+_handlers = weakref.WeakSet()
+
+
+def dropped_records():
+    """Сколько записей отброшено из-за переполнения очередей всех обработчиков процесса"""
+    return sum(handler.dropped for handler in list(_handlers))
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Очередь может быть заполнена: ждём место вместо queue.Full при закрытии
+        self.queue.put(self._sentinel)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Запись логов через очередь в StreamHandler, работающий в отдельном потоке
+
+    Параметры dictConfig: stream (по умолчанию sys.stderr), queue_size;
+    formatter применяется к итоговому StreamHandler, level и filters — к
+    самому обработчику: отсеянные записи в очередь не попадают.
+    """
+
+    def __init__(self, stream=None, queue_size=DEFAULT_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self.listener = None
+        self._listener_pid = None
+        self._closed = False
+        self._state_lock = threading.Lock()
+        _handlers.add(self)
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Форматирует фоновый поток, а не вызывающий
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Вызывается только для записей, прошедших level и filters. Сообщение
+        # собирается сейчас: args могут измениться до записи фоновым потоком.
+        # Копия — запись передаётся и другим обработчикам логгера; исключение
+        # форматирует уже фоновый поток
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def _ensure_listener(self):
+        """Запуск фонового потока при первой записи (и заново в дочернем процессе после fork)"""
+        pid = os.getpid()
+        if self.listener is not None and self._listener_pid == pid:
+            return
+        with self._state_lock:
+            if self._closed or (self.listener is not None and self._listener_pid == pid):
+                return
+            if self.listener is not None:
+                # Поток родителя после fork не работает, а его очередь могла остаться заблокированной
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self.listener = _Listener(self.queue, self.target, respect_handler_level=True)
+            self.listener.start()
+            self._listener_pid = pid
+
+    def enqueue(self, record):
+        if self._closed:
+            # После закрытия (завершение процесса) пишем сразу
+            self.target.handle(record)
+            return
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._state_lock:
+                self.dropped += 1
+
+    def close(self):
+        with self._state_lock:
+            already_closed, self._closed = self._closed, True
+            listener, self.listener = self.listener, None
+        if listener is not None and self._listener_pid == os.getpid():
+            listener.stop()
+        if not already_closed:
+            if self.dropped:
+                self.target.handle(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': 'Очередь логов переполнялась: отброшено записей — %d', 'args': (self.dropped,),
+                }))
+            self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает долю rate записей уровня не выше max_level от логгеров loggers
+    (и их потомков); прочие записи — всегда
+
+    Фильтр вешается на обработчик: фильтры логгера не действуют на записи
+    дочерних логгеров. Пример: SamplingFilter(rate=0.1, loggers=['map']) —
+    10% DEBUG и INFO из map.*, все WARNING и выше.
+    """
+
+    def __init__(self, rate=1.0, max_level='INFO', loggers=()):
+        super().__init__()
+        self.rate = float(rate)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self.loggers = tuple(loggers)
+
+    def _is_sampled_logger(self, name):
+        return not self.loggers or any(name == prefix or name.startswith(f'{prefix}.') for prefix in self.loggers)
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > self.max_level or not self._is_sampled_logger(record.name):
+            return True
+        return random.random() < self.rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """Сообщение и поля extra={'data': {...}} в виде key=value"""
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        data = getattr(record, 'data', None)
+        if data:
+            message = f'{message} ' + ' '.join(f'{key}={value}' for key, value in data.items())
+        return message
@@ -0,0 +1,281 @@
+import asyncio
+import io
+import os
+import shutil
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils.crypto import get_random_string
+from PIL import Image
+
+from map import clustering
+from map.asgi import StreamingBodyASGIHandler
+from map.image_jobs import get_staging_storage
+from map.models import ImageUploadJob, Point, Route
+from map.seeding import seed_maps
+
+CONCURRENCY_PREFIX = 'concurrency'
+
+# Размер фрагмента тела, которыми «клиент» передаёт запрос
+CHUNK_SIZE = 64 * 1024
+
+# Сценарии: (синхронный URL, асинхронный URL); {point} — id точки
+SCENARIOS = {
+    'routes': ('/api/routes/?page_size=20', '/api/async/routes/?page_size=20'),
+    'upload': ('/api/points/{point}/upload_image/?async=1', '/api/async/points/{point}/upload_image/'),
+}
+
+
+def noise_png(size):
+    """PNG из случайных пикселей: почти не сжимается, размер ~3·size² байт"""
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (size, size), os.urandom(size * size * 3)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class Tracker:
+    """Время запросов и наибольшее число одновременно обслуживаемых соединений"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = self.peak = 0
+        self.timings = []
+        self.statuses = {}
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def leave(self, started, status):
+        with self._lock:
+            self.in_flight -= 1
+            self.timings.append((time.perf_counter() - started) * 1000)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class SlowInput(io.RawIOBase):
+    """wsgi.input медленного клиента: тело приходит фрагментами с паузами"""
+
+    def __init__(self, body, chunk_delay):
+        self.body = io.BytesIO(body)
+        self.chunk_delay = chunk_delay
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.body.read(min(len(buffer), CHUNK_SIZE))
+        if data:
+            time.sleep(self.chunk_delay)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение WSGI и ASGI по числу одновременных медленных соединений: N клиентов '
+        'передают тело запроса фрагментами за --send-delay с и читают ответ за --recv-delay с. '
+        'WSGI моделируется пулом из --threads потоков (как gunicorn gthread), где соединение '
+        'занимает поток от чтения тела до отправки ответа; ASGI — StreamingBodyASGIHandler и '
+        'асинхронные эндпоинты в одном цикле событий. Данные создаются и удаляются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=64, help='Одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=4, help='Запросов на клиента')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков WSGI-сервера')
+        parser.add_argument('--send-delay', type=float, default=0.2, help='Передача тела запроса, с')
+        parser.add_argument('--recv-delay', type=float, default=0.05, help='Чтение ответа клиентом, с')
+        parser.add_argument('--image-size', type=int, default=256, help='Сторона загружаемого PNG, пикс.')
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Только эти сценарии')
+
+    def handle(self, *args, **options):
+        self.options = options
+        users, _ = seed_maps(users=1, routes=40, points=10, images=0, prefix=CONCURRENCY_PREFIX)
+        self.user = users[0]
+        self.point_ids = list(Point.objects.filter(route__user=self.user).values_list('id', flat=True))
+        client = Client()
+        client.force_login(self.user)
+        csrf_token = get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS)
+        self.headers = [
+            ('cookie', f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+                       f'{settings.CSRF_COOKIE_NAME}={csrf_token}'),
+            ('x-csrftoken', csrf_token),
+            ('host', settings.ALLOWED_HOSTS[0]),
+        ]
+        image = noise_png(options['image_size'])
+        self.upload_body = encode_multipart(
+            BOUNDARY, {'images': [SimpleUploadedFile('photo.png', image, content_type='image/png')]},
+        )
+        connections.close_all()
+
+        self.stdout.write(
+            f'Клиентов {options["clients"]} × {options["requests"]} запросов, потоков WSGI {options["threads"]}, '
+            f'передача {options["send_delay"]} с, чтение ответа {options["recv_delay"]} с, '
+            f'тело загрузки {len(self.upload_body) // 1024} КБ'
+        )
+        self.stdout.write(
+            f'{"сценарий":<10}{"сервер":<7}{"время, с":>10}{"запр/с":>9}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"соединений":>12}  статусы'
+        )
+        # Кэш ответов есть только у синхронных эндпоинтов: сравнивается одинаковая работа
+        try:
+            with override_settings(ROUTES_RESPONSE_CACHE=False):
+                for name in options['scenario'] or SCENARIOS:
+                    sync_url, async_url = SCENARIOS[name]
+                    for server, url, run in (('wsgi', sync_url, self.run_wsgi), ('asgi', async_url, self.run_asgi)):
+                        tracker = Tracker()
+                        started = time.perf_counter()
+                        run(name, url, tracker)
+                        self.report(name, server, tracker, time.perf_counter() - started)
+                        self.cleanup_jobs()
+        finally:
+            self.cleanup()
+
+    def requests(self, name, url):
+        """Запросы клиентов: [[(метод, путь, строка запроса, тело)]]"""
+        result = []
+        for client in range(self.options['clients']):
+            client_requests = []
+            for index in range(self.options['requests']):
+                # Каждая загрузка — в свою точку: лимит изображений на точку не мешает замеру
+                point = self.point_ids[(client * self.options['requests'] + index) % len(self.point_ids)]
+                parts = urlsplit(url.format(point=point))
+                body = self.upload_body if name == 'upload' else b''
+                client_requests.append(('POST' if body else 'GET', parts.path, parts.query, body))
+            result.append(client_requests)
+        return result
+
+    def chunk_delay(self, body):
+        return self.options['send_delay'] / max(-(-len(body) // CHUNK_SIZE), 1)
+
+    def run_wsgi(self, name, url, tracker):
+        handler = WSGIHandler()
+        host = settings.ALLOWED_HOSTS[0]
+
+        def serve(method, path, query, body):
+            environ = {
+                'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.input': io.BufferedReader(SlowInput(body, self.chunk_delay(body))),
+                'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0),
+                'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            for header, value in self.headers:
+                environ[f'HTTP_{header.upper().replace("-", "_")}'] = value
+            if body:
+                environ.update(CONTENT_TYPE=MULTIPART_CONTENT, CONTENT_LENGTH=str(len(body)))
+            status = []
+            response = handler(environ, lambda status_line, headers: status.append(int(status_line[:3])))
+            try:
+                b''.join(response)
+                time.sleep(self.options['recv_delay'])
+            finally:
+                response.close()
+            return status[0]
+
+        # Соединение занимает поток сервера целиком; остальные клиенты ждут в очереди (backlog сокета),
+        # и это ожидание входит во время запроса
+        workers = threading.Semaphore(self.options['threads'])
+
+        def client(client_requests):
+            for request in client_requests:
+                started = time.perf_counter()
+                with workers:
+                    tracker.enter()
+                    status = 0
+                    try:
+                        status = serve(*request)
+                    finally:
+                        tracker.leave(started, status)
+
+        with ThreadPoolExecutor(self.options['clients']) as executor:
+            for future in [executor.submit(client, requests) for requests in self.requests(name, url)]:
+                future.result()
+
+    def run_asgi(self, name, url, tracker):
+        application = StreamingBodyASGIHandler()
+
+        async def serve(method, path, query, body):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'client': ('127.0.0.1', 50000), 'server': (settings.ALLOWED_HOSTS[0], 80),
+                'headers': [(header.encode(), value.encode()) for header, value in self.headers],
+            }
+            if body:
+                scope['headers'] += [
+                    (b'content-type', MULTIPART_CONTENT.encode()), (b'content-length', str(len(body)).encode()),
+                ]
+            chunks = [body[offset:offset + CHUNK_SIZE] for offset in range(0, len(body), CHUNK_SIZE)] or [b'']
+            chunk_delay = self.chunk_delay(body)
+            status = []
+
+            async def receive():
+                if chunks:
+                    if body:
+                        await asyncio.sleep(chunk_delay)
+                    chunk = chunks.pop(0)
+                    return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+                # Клиент не отключается: ожидание прерывается после отправки ответа
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body', False):
+                    await asyncio.sleep(self.options['recv_delay'])
+
+            started = time.perf_counter()
+            tracker.enter()
+            try:
+                await application(scope, receive, send)
+            finally:
+                tracker.leave(started, status[0] if status else 0)
+
+        async def client(client_requests):
+            for request in client_requests:
+                await serve(*request)
+
+        async def main():
+            await asyncio.gather(*(client(client_requests) for client_requests in self.requests(name, url)))
+
+        asyncio.run(main())
+
+    def report(self, name, server, tracker, elapsed):
+        values = sorted(tracker.timings)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(tracker.statuses.items()))
+        self.stdout.write(
+            f'{name:<10}{server:<7}{elapsed:>10.2f}{len(values) / elapsed:>9.1f}'
+            f'{statistics.median(values):>10.0f}{p95:>10.0f}{tracker.peak:>12}  {statuses}'
+        )
+
+    def cleanup_jobs(self):
+        jobs = ImageUploadJob.objects.filter(user=self.user)
+        staging = get_staging_storage()
+        for job_id in jobs.values_list('id', flat=True):
+            shutil.rmtree(staging.path(str(job_id)), ignore_errors=True)
+        jobs.delete()
+
+    def cleanup(self):
+        connections.close_all()
+        self.cleanup_jobs()
+        Route.objects.filter(user=self.user).delete()
+        User.objects.filter(id=self.user.id).delete()
+        clustering.rebuild_clusters()
+
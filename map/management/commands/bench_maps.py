@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from map.benchmarks import (
+    BASELINE_PATH,
+    DEFAULT_DATASET,
+    DEFAULT_TIME_TOLERANCE,
+    SCENARIOS,
+    find_regressions,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеры API карты (list/retrieve/create/update/upload/clusters) на синтетических данных: '
+        'время и число SQL-запросов, сравнение с базовой линией'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_DATASET.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--repeat', type=int, default=5, help='Прогонов каждого сценария')
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Только эти сценарии')
+        parser.add_argument('--baseline', default=BASELINE_PATH, help='Файл базовой линии')
+        parser.add_argument('--update-baseline', action='store_true', help='Записать результаты как базовую линию')
+        parser.add_argument(
+            '--time-tolerance', type=float, default=DEFAULT_TIME_TOLERANCE,
+            help='Допустимый рост медианы времени (0.5 — на 50%%)',
+        )
+        parser.add_argument('--queries-only', action='store_true', help='Сравнивать только число запросов')
+
+    def handle(self, *args, **options):
+        dataset = {name: options[name] for name in DEFAULT_DATASET}
+        results = run_benchmarks(dataset, repeat=options['repeat'], scenarios=options['scenario'])
+        baseline = load_baseline(options['baseline'])
+
+        self.stdout.write(f'Данные: {dataset}')
+        self.stdout.write(f'{"сценарий":<24}{"запросов":>10}{"медиана, мс":>14}{"база, мс":>12}')
+        for name, result in results['scenarios'].items():
+            expected = (baseline or {}).get('scenarios', {}).get(name)
+            base = f'{expected["median_ms"]:.1f}' if expected else '—'
+            self.stdout.write(f'{name:<24}{result["queries"]:>10}{result["median_ms"]:>14.1f}{base:>12}')
+
+        if options['update_baseline']:
+            if options['scenario'] and baseline:
+                results['scenarios'] = {**baseline['scenarios'], **results['scenarios']}
+            save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия записана: {options["baseline"]}'))
+            return
+        if baseline is None:
+            self.stdout.write(self.style.WARNING('Базовой линии нет: запустите с --update-baseline'))
+            return
+        if results['dataset'] != baseline.get('dataset') and not options['queries_only']:
+            self.stdout.write(self.style.WARNING('Набор данных отличается от базового: время не сравнивается'))
+
+        regressions = find_regressions(
+            results, baseline, options['time_tolerance'], check_timings=not options['queries_only'],
+        )
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from map.api_views import RouteViewSet
+from map.models import Point, Route
+from map.signals import suppress_point_signals
+
+
+class Rollback(Exception):
+    """Откат тестовых данных после замеров"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает GET /api/routes/ через RouteSerializer и через route_reader '
+        'на синтетических данных (создаются в транзакции и откатываются)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=1000, help='Маршрутов')
+        parser.add_argument('--points', type=int, default=40, help='Точек в маршруте')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.seed(options['routes'], options['points'])
+                self.measure(user, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, routes_count, points_count):
+        user = User.objects.create_user(f'bench-{time.monotonic_ns()}')
+        routes = Route.objects.bulk_create(
+            Route(user=user, name=f'Маршрут {idx}', description='Тестовый маршрут') for idx in range(routes_count)
+        )
+        points = []
+        for route in routes:
+            for idx in range(points_count):
+                point = Point(
+                    route=route, name=f'Точка {idx}', order=idx,
+                    lat=55 + (route.id % 100) / 100 + idx / 1000, lon=37 + idx / 1000,
+                )
+                point.update_geohash()
+                points.append(point)
+        with suppress_point_signals():
+            Point.objects.bulk_create(points, batch_size=2000)
+        self.stdout.write(f'Данные: маршрутов {routes_count}, точек {len(points)}')
+        return user
+
+    def request_once(self, user):
+        request = APIRequestFactory().get('/api/routes/', HTTP_HOST='localhost')
+        force_authenticate(request, user=user)
+        started = time.perf_counter()
+        response = RouteViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return time.perf_counter() - started, response.content
+
+    def measure(self, user, repeat):
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            for label, fast in (('RouteSerializer', False), ('route_reader', True)):
+                with override_settings(ROUTES_FAST_READ=fast):
+                    timings = []
+                    for _ in range(repeat):
+                        elapsed, content = self.request_once(user)
+                        timings.append(elapsed)
+                results[label] = (statistics.median(timings), content)
+                self.stdout.write(
+                    f'{label:>16}: медиана {results[label][0] * 1000:.0f} мс, ответ {len(content)} байт'
+                )
+
+        slow, fast = results['RouteSerializer'], results['route_reader']
+        if slow[1] != fast[1]:
+            self.stderr.write(self.style.ERROR('Ответы различаются!'))
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{slow[0] / fast[0]:.1f}, ответы совпадают: {slow[1] == fast[1]}'))
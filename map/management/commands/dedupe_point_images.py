@@ -0,0 +1,116 @@
+import os
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from map import counters, route_cache, route_events
+from map.blobs import acquire_blob, blob_name, hash_file
+from map.models import ImageBlob, PointImage
+from map.thumbnails import derivative_name
+
+
+def _size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def _copy(source_name, target_name):
+    """Копирование файла в хранилище; возвращает число записанных байт"""
+    if default_storage.exists(target_name):
+        return 0
+    with default_storage.open(source_name, 'rb') as source:
+        default_storage.save(target_name, source)
+    return _size(target_name)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит изображения точек в контентно-адресуемое хранилище: одинаковые файлы '
+        'хранятся один раз, дубликаты удаляются. Выводит объём освобождённого места'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать дубликаты и освобождаемое место, ничего не менять',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        queryset = PointImage.objects.filter(blob__isnull=True).exclude(image='').order_by('id')
+
+        groups = defaultdict(list)
+        missing = 0
+        for image_id, image_name, derivatives in queryset.values_list('id', 'image', 'derivatives'):
+            try:
+                with default_storage.open(image_name, 'rb') as source:
+                    digest, _ = hash_file(source)
+            except OSError:
+                missing += 1
+                self.stderr.write(f'  ❌ Файл не найден: {image_name} (PointImage {image_id})')
+                continue
+            groups[digest].append((image_id, image_name, derivatives or []))
+
+        if not groups:
+            self.stdout.write('Нет изображений для переноса')
+            return
+
+        images_count = sum(len(rows) for rows in groups.values())
+        self.stdout.write(f'Изображений: {images_count}, уникальных файлов: {len(groups)}')
+
+        reclaimed = 0
+        for digest, rows in groups.items():
+            existing = ImageBlob.objects.filter(sha256=digest).first()
+            first_name = rows[0][1]
+            target = existing.name if existing else blob_name(digest, os.path.splitext(first_name)[1] or '.bin')
+            source_derivatives = next((derivatives for _, _, derivatives in rows if derivatives), [])
+
+            old_names = {name for _, name, _ in rows}
+            old_names.update(d['name'] for _, _, derivatives in rows for d in derivatives)
+            before = sum(_size(name) for name in old_names)
+
+            if dry_run:
+                written = 0
+                if not default_storage.exists(target):
+                    written = _size(first_name) + sum(_size(d['name']) for d in source_derivatives)
+                reclaimed += before - written
+                continue
+
+            written = _copy(first_name, target)
+            new_derivatives = []
+            for derivative in source_derivatives:
+                name = derivative_name(target, derivative['width'], derivative['format'])
+                written += _copy(derivative['name'], name)
+                new_derivatives.append({**derivative, 'name': name})
+
+            image_ids = [image_id for image_id, _, _ in rows]
+            with transaction.atomic():
+                blob = acquire_blob(digest, target, _size(target), references=len(rows))
+                PointImage.objects.bulk_update(
+                    [
+                        PointImage(id=image_id, image=blob.name, blob=blob, derivatives=new_derivatives)
+                        for image_id in image_ids
+                    ],
+                    ['image', 'blob', 'derivatives'],
+                )
+                # bulk_update не отправляет сигналы: URL файлов изменились, ETag маршрутов тоже должен
+                counters.touch_routes_of_images(image_ids)
+                route_events.schedule_changes('image', 'updated', image_ids)
+            # Кэш сбрасывается до удаления старых файлов
+            route_cache.invalidate_all()
+
+            kept = {target, *(d['name'] for d in new_derivatives)}
+            for name in old_names - kept:
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+            reclaimed += before - written
+
+        prefix = 'Можно освободить' if dry_run else 'Освобождено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}: {reclaimed / (1024 * 1024):.2f} МБ ({reclaimed} байт); '
+            f'дубликатов: {images_count - len(groups)}, файлов не найдено: {missing}'
+        ))
@@ -0,0 +1,42 @@
+import sys
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from map.exporters import EXPORT_FORMATS
+from map.polyline import MAX_PRECISION, MIN_PRECISION
+from map.models import Route
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка маршрутов в GeoJSON, GPX или KML (память не зависит от объёма базы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fmt', choices=sorted(EXPORT_FORMATS), default='geojson', help='Формат выгрузки')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию — stdout)')
+        parser.add_argument('--user', help='Выгрузить только маршруты пользователя с этим username')
+        parser.add_argument(
+            '--polyline-precision', type=int, choices=range(MIN_PRECISION, MAX_PRECISION + 1), metavar='N',
+            help='Компактный GeoJSON: геометрия маршрутов строкой polyline с N знаками',
+        )
+
+    def handle(self, *args, **options):
+        routes = Route.objects.all()
+        if options['user']:
+            routes = routes.filter(user__username=options['user'])
+            if not routes.exists():
+                raise CommandError(f'У пользователя {options["user"]} нет маршрутов')
+
+        stream = EXPORT_FORMATS[options['fmt']][0]
+        precision = options['polyline_precision']
+        if precision is not None:
+            if options['fmt'] != 'geojson':
+                raise CommandError('--polyline-precision поддерживается только для --fmt geojson')
+            stream = partial(stream, polyline_precision=precision)
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for chunk in stream(routes):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
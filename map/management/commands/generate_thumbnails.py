@@ -0,0 +1,81 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from map import counters, route_cache, route_events
+from map.models import PointImage
+from map.thumbnails import derivatives_for_file
+
+
+def _save(pending):
+    """
+    Сохранение копий пакета; bulk_update не отправляет сигналы, поэтому
+    updated_at маршрутов (ETag/Last-Modified) и события сдвигаются здесь
+    """
+    image_ids = [image.id for image in pending]
+    with transaction.atomic():
+        PointImage.objects.bulk_update(pending, ['derivatives'])
+        counters.touch_routes_of_images(image_ids)
+        route_events.schedule_changes('image', 'updated', image_ids)
+
+def _init_worker():
+    # Дочерним процессам (в т.ч. при методе запуска spawn) нужен настроенный Django;
+    # соединения с БД из родителя не используем — воркеры работают только с файлами
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Генерирует уменьшенные копии для уже загруженных изображений точек (параллельно)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Количество процессов (по умолчанию — число ядер)',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии даже для изображений, у которых они уже есть',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Размер пакета при сохранении результатов в БД',
+        )
+
+    def handle(self, *args, **options):
+        queryset = PointImage.objects.exclude(image='')
+        if not options['force']:
+            queryset = queryset.filter(derivatives=[])
+        images = defaultdict(list)
+        for image_id, image_name in queryset.values_list('id', 'image'):
+            images[image_name].append(image_id)
+        if not images:
+            self.stdout.write('Нет изображений для обработки')
+            return
+
+        self.stdout.write(f'Изображений к обработке: {len(images)}, процессов: {options["workers"]}')
+        connections.close_all()
+
+        processed, failed, pending = 0, 0, []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+            for image_name, derivatives, error in executor.map(derivatives_for_file, images, chunksize=8):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'  ❌ {image_name}: {error}')
+                    continue
+                pending.extend(PointImage(id=image_id, derivatives=derivatives) for image_id in images[image_name])
+                processed += 1
+                if len(pending) >= options['batch_size']:
+                    _save(pending)
+                    pending = []
+        if pending:
+            _save(pending)
+        if processed:
+            # В ответах маршрутов появились новые копии
+            route_cache.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(f'Готово: обработано {processed}, ошибок {failed}'))
@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from map.importers import IMPORT_FORMATS, TrackImportError, detect_format, import_tracks
+
+
+class Command(BaseCommand):
+    help = 'Импортирует треки из GPX, GeoJSON или CSV в маршруты пользователя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument('--user', required=True, help='username владельца маршрутов')
+        parser.add_argument('--fmt', choices=IMPORT_FORMATS, help='Формат (по умолчанию — по расширению файла)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        started = time.monotonic()
+        try:
+            fmt = detect_format(options['path'], options['fmt'])
+            with open(options['path'], 'rb') as file:
+                created = import_tracks(
+                    file, fmt, user, default_name=os.path.splitext(os.path.basename(options['path']))[0],
+                )
+        except (OSError, TrackImportError) as e:
+            raise CommandError(str(e))
+
+        for route in created:
+            self.stdout.write(
+                f'  ✅ {route["name"]} (id {route["id"]}): {route["source_points"]} → {route["points_count"]} точек'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: маршрутов {len(created)} за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from map.image_jobs import claim_next_job, fail_job, process_job, requeue_stale_jobs
+
+
+def _init_worker():
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь фоновых загрузок изображений (ImageUploadJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Количество процессов для обработки файлов',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза между проверками пустой очереди, секунд',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать текущую очередь и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+            self.stdout.write(f'Обработчик очереди запущен, процессов: {options["workers"]}')
+            # Задачи, брошенные упавшими обработчиками, возвращаются в очередь при запуске
+            # и затем каждый раз, когда очередь пуста
+            requeue_stale_jobs()
+            while True:
+                job = claim_next_job()
+                if job is None:
+                    if requeue_stale_jobs()[0]:
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                try:
+                    process_job(job, executor)
+                except Exception as e:
+                    fail_job(job, str(e))
+                    self.stderr.write(f'❌ Задача {job.id}: {e}')
+        self.stdout.write(self.style.SUCCESS('Очередь обработана'))
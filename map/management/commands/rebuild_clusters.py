@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from map.clustering import rebuild_clusters, refresh_dirty_clusters
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает таблицу кластеров точек'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dirty', action='store_true',
+            help='Пересчитать только кластеры, у которых удалялись точки на границе',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['dirty']:
+                refreshed = refresh_dirty_clusters()
+                self.stdout.write(self.style.SUCCESS(f'Кластеров пересчитано: {refreshed}'))
+                return
+            created = rebuild_clusters()
+        self.stdout.write(self.style.SUCCESS(f'Кластеров построено: {created}'))
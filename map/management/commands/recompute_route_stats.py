@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from map.route_stats import refresh_route_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает длину, отрезки и bbox маршрутов (векторно, пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Маршрутов в одной пачке')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = refresh_route_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: маршрутов {count} за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from map.counters import refresh_route_counters, refresh_routes_counts
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики маршрутов пользователей и точек/изображений маршрутов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            routes = refresh_route_counters()
+            profiles = refresh_routes_counts()
+        self.stdout.write(self.style.SUCCESS(f'Готово: маршрутов {routes}, профилей {profiles}'))
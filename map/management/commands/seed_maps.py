@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from map.seeding import seed_maps
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетические данные: пользователи × маршруты × точки × изображения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Пользователей')
+        parser.add_argument('--routes', type=int, default=10, help='Маршрутов у пользователя')
+        parser.add_argument('--points', type=int, default=20, help='Точек в маршруте')
+        parser.add_argument('--images', type=int, default=1, help='Изображений у точки')
+        parser.add_argument('--prefix', default='seed', help='Префикс имён пользователей')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора координат')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        _, totals = seed_maps(
+            users=options['users'], routes=options['routes'], points=options['points'],
+            images=options['images'], prefix=options['prefix'], seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.2f} с: пользователей {totals["users"]}, '
+            f'маршрутов {totals["routes"]}, точек {totals["points"]}, изображений {totals["images"]}'
+        ))
@@ -0,0 +1,150 @@
+import multiprocessing
+import random
+import statistics
+import time
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+
+from map import clustering, counters, route_reader
+from map.models import Point, Route
+from map.route_stats import save_route_stats
+from map.seeding import seed_maps
+from map.signals import suppress_point_signals
+
+STRESS_PREFIX = 'stress'
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def read_once(user, route_ids, rng):
+    """Чтение страницы из 10 маршрутов быстрым путём списка"""
+    offset = rng.randrange(max(len(route_ids) - 10, 1))
+    routes = Route.objects.filter(user=user).order_by('id').values(*route_reader.ROUTE_READ_FIELDS)
+    route_reader.build_routes(routes[offset:offset + 10])
+
+
+def write_once(user, route_ids, rng):
+    """Перемещение случайной точки маршрута с пересчётом кластеров, статистики и счётчиков"""
+    route_id = rng.choice(route_ids)
+    with transaction.atomic():
+        # Чтение, затем запись в одной транзакции — типичный путь редактирования маршрута
+        points = list(Point.objects.filter(route_id=route_id).order_by('order'))
+        moved = rng.choice(points)
+        old = (float(moved.lat), float(moved.lon))
+        moved.lat, moved.lon = old[0] + rng.uniform(-0.001, 0.001), old[1] + rng.uniform(-0.001, 0.001)
+        moved.update_geohash()
+        with suppress_point_signals():
+            Point.objects.bulk_update([moved], ['lat', 'lon', 'geohash'])
+        clustering.apply_point_changes(user.id, added=[(float(moved.lat), float(moved.lon))], removed=[old])
+        save_route_stats(Route(id=route_id), [(point.lat, point.lon) for point in points])
+        counters.adjust_route_counters(route_id)
+
+
+class Command(BaseCommand):
+    help = (
+        'Конкурентная нагрузка чтения/записи на настроенную БД: пропускная способность, '
+        'задержки и ошибки «database is locked». Данные создаются и удаляются после замера; '
+        'профили сравниваются запуском с SQLITE_PROFILE=default и SQLITE_PROFILE=concurrent'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Процессов чтения')
+        parser.add_argument('--writers', type=int, default=4, help='Процессов записи')
+        parser.add_argument('--duration', type=float, default=10, help='Длительность, с')
+        parser.add_argument('--routes', type=int, default=50, help='Маршрутов в исходных данных')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        self.stdout.write(
+            f'journal_mode={journal_mode}, transaction_mode='
+            f'{connection.settings_dict.get("OPTIONS", {}).get("transaction_mode") or "DEFERRED"}, '
+            f'читателей {options["readers"]}, писателей {options["writers"]}, {options["duration"]} с'
+        )
+
+        users, _ = seed_maps(users=1, routes=options['routes'], points=20, images=0, prefix=STRESS_PREFIX)
+        self.user = users[0]
+        self.route_ids = list(Route.objects.filter(user=self.user).values_list('id', flat=True))
+
+        # Отдельные процессы, как воркеры gunicorn: потоки упирались бы в GIL, а не в блокировки БД
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.monotonic() + options['duration']
+        kinds = ['read'] * options['readers'] + ['write'] * options['writers']
+        connections.close_all()
+        processes = [
+            context.Process(target=self.worker, args=(kind, seed, deadline, results))
+            for seed, kind in enumerate(kinds)
+        ]
+        started = time.monotonic()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - started
+
+        try:
+            self.report(collected, elapsed)
+        finally:
+            self.cleanup()
+
+    def worker(self, kind, seed, deadline, results):
+        rng = random.Random(seed)
+        if kind == 'read':
+            operation = partial(read_once, self.user, self.route_ids)
+        else:
+            operation = partial(write_once, self.user, self.route_ids)
+        timings, errors, failure = [], 0, None
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    operation(rng)
+                except OperationalError as e:
+                    if not is_lock_error(e):
+                        raise
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            failure = repr(e)
+        finally:
+            connections.close_all()
+            results.put((kind, timings, errors, failure))
+
+    def report(self, collected, elapsed):
+        timings = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        for kind, worker_timings, worker_errors, failure in collected:
+            timings[kind].extend(worker_timings)
+            errors[kind] += worker_errors
+            if failure:
+                self.stderr.write(f'Ошибка процесса: {failure}')
+
+        for kind in ('read', 'write'):
+            values = sorted(timings[kind])
+            if values:
+                p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+                latency = f'медиана {statistics.median(values):.1f} мс, p95 {p95:.1f} мс'
+            else:
+                latency = 'нет успешных операций'
+            self.stdout.write(
+                f'{kind:>5}: {len(values) / elapsed:8.1f} оп/с, {latency}, ошибок блокировки {errors[kind]}'
+            )
+        if errors['read'] or errors['write']:
+            self.stdout.write(self.style.WARNING('Были ошибки «database is locked»'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Ошибок блокировки нет'))
+
+    def cleanup(self):
+        Route.objects.filter(user=self.user).delete()
+        User.objects.filter(id=self.user.id).delete()
+        clustering.rebuild_clusters()
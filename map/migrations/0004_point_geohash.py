@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:42
+
+from django.db import migrations, models
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+
+
+def encode_geohash(lat, lon):
+    # Копия map.spatial.encode_geohash на момент миграции: код приложения
+    # меняется, а миграция должна давать тот же результат. 12 символов —
+    # 60 бит, поровну на долготу и широту
+    bits = GEOHASH_PRECISION * 5 // 2
+    cells = 1 << bits
+    x = min(max(int((float(lon) + 180.0) / 360.0 * cells), 0), cells - 1)
+    y = min(max(int((float(lat) + 90.0) / 180.0 * cells), 0), cells - 1)
+    code = 0
+    for i in range(bits - 1, -1, -1):
+        code = (code << 2) | ((x >> i) & 1) << 1 | ((y >> i) & 1)
+    chars = []
+    for _ in range(GEOHASH_PRECISION):
+        chars.append(GEOHASH_ALPHABET[code & 31])
+        code >>= 5
+    return ''.join(reversed(chars))
+
+
+def fill_geohash(apps, schema_editor):
+    Point = apps.get_model('map', 'Point')
+    points = list(Point.objects.only('id', 'lat', 'lon'))
+    for point in points:
+        point.geohash = encode_geohash(point.lat, point.lon)
+    Point.objects.bulk_update(points, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0003_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='point',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
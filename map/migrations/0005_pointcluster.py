@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:44
+
+from django.db import migrations, models
+
+CLUSTER_PRECISIONS = range(1, 9)
+
+
+def build_clusters(apps, schema_editor):
+    # Копия map.clustering.rebuild_clusters на момент миграции: код приложения
+    # меняется, а миграция должна давать тот же результат. Ячейки — префиксы
+    # Point.geohash (заполнен в 0004)
+    Point = apps.get_model('map', 'Point')
+    PointCluster = apps.get_model('map', 'PointCluster')
+    cells = {}
+    for geohash, lat, lon in Point.objects.values_list('geohash', 'lat', 'lon').iterator(chunk_size=2000):
+        lat, lon = float(lat), float(lon)
+        for precision in CLUSTER_PRECISIONS:
+            key = (precision, geohash[:precision])
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, lat, lon, lat, lat, lon, lon]
+            else:
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lon
+                cell[3] = min(cell[3], lat)
+                cell[4] = max(cell[4], lat)
+                cell[5] = min(cell[5], lon)
+                cell[6] = max(cell[6], lon)
+    PointCluster.objects.bulk_create(
+        [
+            PointCluster(
+                precision=precision, cell=cell, count=count, sum_lat=sum_lat, sum_lon=sum_lon,
+                min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+            )
+            for (precision, cell), (count, sum_lat, sum_lon, min_lat, max_lat, min_lon, max_lon) in cells.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0004_point_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('cell', models.CharField(max_length=12)),
+                ('count', models.IntegerField(default=0)),
+                ('sum_lat', models.FloatField(default=0)),
+                ('sum_lon', models.FloatField(default=0)),
+                ('min_lat', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('min_lon', models.FloatField()),
+                ('max_lon', models.FloatField()),
+                ('dirty', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('precision', 'cell'), name='unique_point_cluster_cell')],
+            },
+        ),
+        migrations.RunPython(build_clusters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0005_pointcluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
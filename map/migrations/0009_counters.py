@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, group_field):
+    counts = queryset.order_by().values(group_field).annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Route = apps.get_model('map', 'Route')
+    Point = apps.get_model('map', 'Point')
+    PointImage = apps.get_model('map', 'PointImage')
+    UserProfile = apps.get_model('map', 'UserProfile')
+    Route.objects.update(
+        points_count=count_subquery(Point.objects.filter(route_id=OuterRef('pk')), 'route_id'),
+        images_count=count_subquery(PointImage.objects.filter(point__route_id=OuterRef('pk')), 'point__route_id'),
+    )
+    UserProfile.objects.update(
+        routes_count=count_subquery(Route.objects.filter(user_id=OuterRef('user_id')), 'user_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0008_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='images_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='points_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='routes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:01
+
+import numpy as np
+from django.db import migrations, models
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def route_stats_batch(route_ids, lats, lons):
+    # Копия map.geometry.route_stats_batch на момент миграции: код приложения
+    # меняется, а миграция должна давать тот же результат
+    route_ids = np.asarray(route_ids)
+    if route_ids.size == 0:
+        return {}
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    phi, lam = np.radians(lats), np.radians(lons)
+    phi1, phi2 = phi[:-1], phi[1:]
+    delta_lam = lam[1:] - lam[:-1]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lam / 2) ** 2
+    distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    y = np.sin(delta_lam) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(delta_lam)
+    bearings = (np.degrees(np.arctan2(y, x)) + 360.0) % 360.0
+
+    starts = np.flatnonzero(np.r_[True, route_ids[1:] != route_ids[:-1]])
+    distances = np.where(route_ids[1:] == route_ids[:-1], distances, 0.0)
+    lengths = np.add.reduceat(np.r_[distances, 0.0], starts)
+    min_lats, max_lats = np.minimum.reduceat(lats, starts), np.maximum.reduceat(lats, starts)
+    min_lons, max_lons = np.minimum.reduceat(lons, starts), np.maximum.reduceat(lons, starts)
+
+    distances = np.round(distances, 2).tolist()
+    bearings = np.round(bearings, 2).tolist()
+    ends = np.r_[starts[1:], route_ids.size].tolist()
+    stats = {}
+    for index, (start, end) in enumerate(zip(starts.tolist(), ends)):
+        stats[route_ids[start].item()] = {
+            'length': round(float(lengths[index]), 2),
+            'legs': [{'distance': distances[leg], 'bearing': bearings[leg]} for leg in range(start, end - 1)],
+            'bbox': [float(min_lons[index]), float(min_lats[index]), float(max_lons[index]), float(max_lats[index])],
+        }
+    return stats
+
+
+def fill_route_stats(apps, schema_editor):
+    Route = apps.get_model('map', 'Route')
+    Point = apps.get_model('map', 'Point')
+    rows = list(Point.objects.order_by('route_id', 'order', 'id').values_list('route_id', 'lat', 'lon'))
+    stats = route_stats_batch([r[0] for r in rows], [float(r[1]) for r in rows], [float(r[2]) for r in rows])
+    empty = {'length': 0.0, 'legs': [], 'bbox': None}
+    routes = [Route(id=route_id, **stats.get(route_id, empty)) for route_id in Route.objects.values_list('id', flat=True)]
+    Route.objects.bulk_update(routes, ['length', 'legs', 'bbox'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='bbox',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='legs',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='length',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_route_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:22
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import migrations, models
+
+USER_EMAIL_INDEX = 'map_auth_user_email_idx'
+
+
+def _user_email_column(apps):
+    """Таблица и столбец почты модели AUTH_USER_MODEL (None, если поля email нет)"""
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    try:
+        return user_model._meta.db_table, user_model._meta.get_field('email').column
+    except FieldDoesNotExist:
+        return None
+
+
+def create_user_email_index(apps, schema_editor):
+    # Регистрация проверяет занятость почты, а у стандартной модели пользователя индекса по email нет
+    target = _user_email_column(apps)
+    if target is None:
+        return
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {quote(USER_EMAIL_INDEX)} ON {quote(target[0])} ({quote(target[1])})'
+    )
+
+
+def drop_user_email_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(USER_EMAIL_INDEX)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0010_route_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imageuploadjob',
+            index=models.Index(fields=['user', 'created_at'], name='map_upload_job_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='point',
+            index=models.Index(fields=['route', 'order'], name='map_point_route_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['user', 'created_at'], name='map_route_user_created_idx'),
+        ),
+        # Таблица пользователей берётся из AUTH_USER_MODEL, а не задаётся именем auth_user
+        migrations.RunPython(create_user_email_index, drop_user_email_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imageblob',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,81 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+CLUSTER_PRECISIONS = range(1, 9)
+
+
+def build_user_clusters(apps, schema_editor):
+    # Копия map.clustering.rebuild_clusters на момент миграции: кластеры по
+    # точкам маршрутов каждого пользователя, ячейки — префиксы Point.geohash
+    Point = apps.get_model('map', 'Point')
+    PointCluster = apps.get_model('map', 'PointCluster')
+    cells = {}
+    points = Point.objects.filter(route__user__isnull=False).values_list('route__user_id', 'geohash', 'lat', 'lon')
+    for user_id, geohash, lat, lon in points.iterator(chunk_size=2000):
+        lat, lon = float(lat), float(lon)
+        for precision in CLUSTER_PRECISIONS:
+            key = (user_id, precision, geohash[:precision])
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, lat, lon, lat, lat, lon, lon]
+            else:
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lon
+                cell[3] = min(cell[3], lat)
+                cell[4] = max(cell[4], lat)
+                cell[5] = min(cell[5], lon)
+                cell[6] = max(cell[6], lon)
+    PointCluster.objects.bulk_create(
+        [
+            PointCluster(
+                user_id=user_id, precision=precision, cell=cell, count=count, sum_lat=sum_lat, sum_lon=sum_lon,
+                min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+            )
+            for (user_id, precision, cell), (count, sum_lat, sum_lon, min_lat, max_lat, min_lon, max_lon)
+            in cells.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    """Кластеры точек по пользователям: общие кластеры раскрывали чужие маршруты"""
+
+    dependencies = [
+        ('map', '0014_imageuploadjob_claimed_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Общие кластеры не разделить по владельцам: таблица строится заново
+        migrations.DeleteModel(
+            name='PointCluster',
+        ),
+        migrations.CreateModel(
+            name='PointCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('cell', models.CharField(max_length=12)),
+                ('count', models.IntegerField(default=0)),
+                ('sum_lat', models.FloatField(default=0)),
+                ('sum_lon', models.FloatField(default=0)),
+                ('min_lat', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('min_lon', models.FloatField()),
+                ('max_lon', models.FloatField()),
+                ('dirty', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL,
+                )),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('user', 'precision', 'cell'), name='unique_user_point_cluster_cell'),
+                ],
+            },
+        ),
+        migrations.RunPython(build_user_clusters, migrations.RunPython.noop),
+    ]
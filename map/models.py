@@ -6,6 +6,7 @@ import os
 import uuid
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from .spatial import encode_geohash
 
 def point_image_upload_to(instance, filename):
     ext = filename.split('.')[-1]
@@ -21,6 +22,8 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     subscription_type = models.CharField(max_length=10, choices=SUBSCRIPTION_CHOICES, default='free')
     subscription_until = models.DateTimeField(default=timezone.now)
+    # Денормализованный счётчик маршрутов (см. counters.py)
+    routes_count = models.PositiveIntegerField(default=0, editable=False)
 
     def is_subscription_active(self):
         return self.subscription_until > timezone.now()
@@ -45,6 +48,20 @@ class Route(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='routes', null=True, blank=True)
+    # Денормализованные счётчики точек и изображений (см. counters.py)
+    points_count = models.PositiveIntegerField(default=0, editable=False)
+    images_count = models.PositiveIntegerField(default=0, editable=False)
+    # Геометрия маршрута, пересчитывается при изменении точек (см. geometry.py, route_stats.py):
+    # длина в метрах, отрезки [{'distance': м, 'bearing': градусы}], bbox [minLon, minLat, maxLon, maxLat]
+    length = models.FloatField(default=0, editable=False)
+    legs = models.JSONField(default=list, blank=True, editable=False)
+    bbox = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Маршруты пользователя в порядке курсорной пагинации (created_at, id)
+            models.Index(fields=['user', 'created_at'], name='map_route_user_created_idx'),
+        ]
 
     def __str__(self):
         return self.name or f"Route {self.id}"
@@ -56,16 +73,88 @@ class Point(models.Model):
     lat = models.DecimalField(max_digits=18, decimal_places=15, validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)])
     lon = models.DecimalField(max_digits=18, decimal_places=15, validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)])
     order = models.IntegerField(default=0)
+    # Пространственный ключ для выборок по видимой области карты (см. spatial.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            # Точки маршрута по порядку без сортировки во временном B-дереве
+            models.Index(fields=['route', 'order'], name='map_point_route_order_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходные координаты, чтобы пересчитать кластеры при перемещении точки
+        if 'lat' in field_names and 'lon' in field_names:
+            instance._loaded_coords = (float(instance.lat), float(instance.lon))
+        # И исходный маршрут — для счётчиков при переносе точки в другой маршрут
+        if 'route_id' in field_names:
+            instance._loaded_route_id = instance.route_id
+        return instance
+
+    def update_geohash(self):
+        """Пересчёт geohash (нужен перед bulk_create/bulk_update, которые не вызывают save)"""
+        self.geohash = encode_geohash(self.lat, self.lon)
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'lat', 'lon'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name or f"Point {self.id}"
 
+class ImageBlob(models.Model):
+    """Файл изображения, адресуемый по содержимому; общий для нескольких PointImage (см. blobs.py)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    # Индекс нужен проверке «на файл снова сослались» перед удалением файлов (blobs.delete_blob_files)
+    name = models.CharField(max_length=255, db_index=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.ref_count})"
+
+
 class PointImage(models.Model):
     point = models.ForeignKey(Point, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to=point_image_upload_to)
+    # Уменьшенные копии: [{'width': 320, 'format': 'webp', 'name': '...'}] (см. thumbnails.py)
+    derivatives = models.JSONField(default=list, blank=True, editable=False)
+    # Общий файл в контентно-адресуемом режиме; None — файл принадлежит только этой записи
+    blob = models.ForeignKey(
+        ImageBlob, related_name='images', on_delete=models.PROTECT, null=True, blank=True, editable=False,
+    )
+
+    def save(self, *args, **kwargs):
+        from .blobs import is_content_addressed, release_blob, store_blob
+
+        previous_blob_id = self.blob_id
+        new_upload = bool(self.image) and not self.image._committed
+        if new_upload and is_content_addressed():
+            extension = os.path.splitext(self.image.name)[1] or '.bin'
+            blob = store_blob(self.image.file, extension, self.image.storage)
+            # Файл уже в хранилище: FileField не должен сохранять его ещё раз
+            self.image.name = blob.name
+            self.image._committed = True
+            self.blob = blob
+        elif new_upload:
+            self.blob = None
+        super().save(*args, **kwargs)
+        if previous_blob_id and previous_blob_id != self.blob_id:
+            release_blob(previous_blob_id)
+
+    def get_thumbnail_name(self, fmt='jpeg'):
+        """Имя самой маленькой копии заданного формата (или исходника, если копий нет)"""
+        candidates = [d for d in self.derivatives or [] if d['format'] == fmt]
+        if not candidates:
+            return self.image.name
+        return min(candidates, key=lambda d: d['width'])['name']
 
     def __str__(self):
         return f"Image for {self.point.name}"
@@ -78,4 +167,84 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+class PointCluster(models.Model):
+    """Предрасчитанный кластер точек пользователя: ячейка geohash заданной точности (см. clustering.py)"""
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    precision = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=12)
+    count = models.IntegerField(default=0)
+    sum_lat = models.FloatField(default=0)
+    sum_lon = models.FloatField(default=0)
+    min_lat = models.FloatField()
+    max_lat = models.FloatField()
+    min_lon = models.FloatField()
+    max_lon = models.FloatField()
+    # Удалена точка на границе кластера: bbox нужно пересчитать при следующем чтении
+    dirty = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'precision', 'cell'], name='unique_user_point_cluster_cell'),
+        ]
+
+    def __str__(self):
+        return f"Cluster {self.cell} ({self.count})"
+
+
+class ImageUploadJob(models.Model):
+    """Задача фоновой обработки загруженных изображений (очередь в БД, см. image_jobs.py)"""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    point = models.ForeignKey(Point, related_name='upload_jobs', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='image_upload_jobs', on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    # Сырые файлы во временном каталоге: [{'path': '...', 'name': 'photo.jpg'}]
+    files = models.JSONField(default=list)
+    total_files = models.PositiveSmallIntegerField(default=0)
+    processed_files = models.PositiveSmallIntegerField(default=0)
+    image_ids = models.JSONField(default=list, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    # Захват обработчиком; задача processing без движения дольше IMAGE_JOBS_STALE_TIMEOUT
+    # возвращается в очередь (обработчик мог упасть), после IMAGE_JOBS_MAX_ATTEMPTS попыток — failed
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='map_upload_job_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload job {self.id} ({self.status})"
+
+
+class RouteEvent(models.Model):
+    """
+    Событие изменения маршрута, точки или изображения для потока SSE
+
+    Хранится только при ROUTE_EVENTS_BACKEND=database: так события доходят
+    до подписчиков во всех процессах (см. route_events.py). Старые строки
+    удаляются через ROUTE_EVENTS_RETENTION секунд.
+    """
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    # {'type': 'point.updated', 'data': {...}}
+    event = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.event.get('type')} for user {self.user_id}"
@@ -0,0 +1,81 @@
+"""
+Кодирование координат в формат Google Encoded Polyline
+
+Каждая координата хранится как разность с предыдущей, умноженная на
+10 ** precision, в виде 5-битных групп ASCII-символов. При precision=5
+(стандарт Google) точность около 1 м, при 6 (OSRM, Valhalla) — около 10 см.
+"""
+
+import math
+
+DEFAULT_PRECISION = 5
+MIN_PRECISION = 1
+MAX_PRECISION = 10
+
+
+def _encode_value(value, output):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        output.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    output.append(chr(value + 63))
+
+
+def encode_polyline(coordinates, precision=DEFAULT_PRECISION):
+    """
+    Args:
+        coordinates: Последовательность (lat, lon) (float, Decimal или str)
+        precision: Число знаков после запятой
+
+    Returns:
+        str: Закодированная строка
+    """
+    factor = 10 ** precision
+    output = []
+    previous_lat = previous_lon = 0
+    for lat, lon in coordinates:
+        # Округление половины вверх, как Math.round в эталонной реализации
+        lat = math.floor(float(lat) * factor + 0.5)
+        lon = math.floor(float(lon) * factor + 0.5)
+        _encode_value(lat - previous_lat, output)
+        _encode_value(lon - previous_lon, output)
+        previous_lat, previous_lon = lat, lon
+    return ''.join(output)
+
+
+def decode_polyline(encoded, precision=DEFAULT_PRECISION):
+    """
+    Обратное преобразование к encode_polyline (координаты округлены до precision знаков)
+
+    Returns:
+        list: Кортежи (lat, lon)
+
+    Raises:
+        ValueError: Строка повреждена
+    """
+    factor = 10 ** precision
+    coordinates = []
+    values = []
+    index, length = 0, len(encoded)
+    while index < length:
+        result, shift = 0, 0
+        while True:
+            if index >= length:
+                raise ValueError('Некорректная строка polyline')
+            byte = ord(encoded[index]) - 63
+            if not 0 <= byte < 0x40:
+                raise ValueError('Некорректная строка polyline')
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        values.append(~(result >> 1) if result & 1 else result >> 1)
+    if len(values) % 2:
+        raise ValueError('Некорректная строка polyline')
+    lat = lon = 0
+    for delta_lat, delta_lon in zip(values[::2], values[1::2]):
+        lat += delta_lat
+        lon += delta_lon
+        coordinates.append((lat / factor, lon / factor))
+    return coordinates
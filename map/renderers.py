@@ -0,0 +1,113 @@
+"""
+Быстрые JSON-рендерер и парсер для REST API на orjson
+
+Включаются настройкой ``API_FAST_JSON``. Если orjson не установлен или
+настройка выключена, работают как стандартные JSONRenderer/JSONParser DRF.
+
+Вывод совпадает со стандартным рендерером: компактные разделители,
+символы не-ASCII без экранирования, экранированные U+2028/U+2029.
+Типы, которые orjson не сериализует сам (Decimal, lazy-строки, QuerySet),
+а также datetime/time (у DRF — «Z» вместо «+00:00») передаются в
+encoder_class рендерера. Отличается только запись больших float
+в экспоненте: 1e16 вместо 1e+16.
+
+Там, где orjson ведёт себя иначе, чем json, используется стандартная
+реализация: NaN/Infinity (orjson пишет null, DRF отклоняет их при
+STRICT_JSON), целые вне 64 бит (orjson их не сериализует, а при разборе
+превращает в float) и ошибки разбора (сообщение как у DRF).
+"""
+
+import io
+import re
+
+from django.conf import settings
+from rest_framework import renderers
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - необязательная зависимость
+    orjson = None
+
+if orjson is not None:
+    DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+# 19+ цифр подряд: возможно целое вне 64 бит (с запасом — и длинные дроби)
+_LONG_NUMBER = re.compile(rb'[0-9]{19}')
+
+# Типы, которые проверяет has_non_finite_float (контейнеры — с обходом)
+_WALKED_TYPES = (float, dict, list, tuple)
+
+
+def is_enabled():
+    return orjson is not None and getattr(settings, 'API_FAST_JSON', True)
+
+
+def has_non_finite_float(value):
+    """
+    Есть ли в данных NaN или ±Infinity (orjson записал бы их как null)
+
+    Строки, целые и None пропускаются без рекурсии: обход обходится в
+    несколько раз дешевле сериализации стандартным json.
+    """
+    value_type = type(value)
+    if value_type is float:
+        # Только у NaN и ±Infinity разность с собой не равна нулю
+        return value - value != 0.0
+    if value_type is dict:
+        items = value.values()
+    elif value_type is list or value_type is tuple:
+        items = value
+    else:
+        # Подклассы (ReturnDict/ReturnList DRF, OrderedDict, namedtuple) — как базовый тип
+        base = next((base for base in _WALKED_TYPES if isinstance(value, base)), None)
+        return base is not None and has_non_finite_float(base(value))
+    for item in items:
+        item_type = type(item)
+        if item_type is str or item_type is int or item is None:
+            continue
+        if has_non_finite_float(item):
+            return True
+    return False
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer на orjson; с отступами (?indent / ;indent=) — стандартная реализация"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if not is_enabled() or indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=DUMPS_OPTIONS)
+        except TypeError:
+            # Целые вне 64 бит и прочее, что orjson не умеет: ответ или ошибка как у DRF
+            return super().render(data, accepted_media_type, renderer_context)
+        # null в выводе может быть NaN/Infinity: проверяем данные только в этом случае
+        if b'null' in ret and has_non_finite_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer: вывод должен быть корректным JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson (только UTF-8; другие кодировки — стандартная реализация)"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not is_enabled() or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if not _LONG_NUMBER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
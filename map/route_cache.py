@@ -0,0 +1,157 @@
+"""
+Кэш ответов list/retrieve маршрутов с версией на пользователя
+
+Ключ ответа складывается из версии пользователя, общей версии и отпечатка
+запроса (тот же, что у ETag: маршруты пользователя, путь, хост, формат).
+Запись не удаляет ключи, а меняет версию: старые ответы становятся
+недостижимыми и вытесняются по таймауту.
+
+Версии меняются после фиксации транзакции (transaction.on_commit) по
+сигналам post_save/post_delete Route, Point и PointImage (см. signals.py).
+За транзакцию изменения копятся в один пакет: id маршрутов и точек
+переводятся во владельцев одним запросом. Массовые операции без сигналов
+(bulk_update, update) вызывают schedule_invalidation или invalidate_all сами.
+
+Версия — случайная строка, а не счётчик: параллельные записи не могут
+вернуть уже использованное значение, и кэш не требует атомарного incr.
+Бэкенд задаётся алиасом ROUTES_CACHE_ALIAS; при нескольких процессах он
+должен быть общим (файловый, Redis), иначе запись в одном процессе не
+сбросит кэш другого.
+"""
+
+import hashlib
+import secrets
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+
+from . import commit_batches
+from .models import Point, Route
+
+KEY_PREFIX = 'routes'
+
+_local = threading.local()
+
+
+def is_enabled():
+    return getattr(settings, 'ROUTES_RESPONSE_CACHE', False)
+
+
+def get_cache():
+    return caches[getattr(settings, 'ROUTES_CACHE_ALIAS', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'ROUTES_CACHE_TIMEOUT', 300)
+
+
+class CacheStats:
+    """Счётчики попаданий, промахов и сбросов (в памяти процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'enabled': is_enabled(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else None,
+                'invalidations': self.invalidations,
+            }
+
+
+STATS = CacheStats()
+
+
+def _version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # add не перезапишет версию, которую параллельно успел создать другой запрос
+        cache.add(key, secrets.token_hex(8), None)
+        version = cache.get(key)
+    return version
+
+
+def _user_version_key(user_id):
+    return f'{KEY_PREFIX}:version:{user_id}'
+
+
+def response_key(user_id, fingerprint):
+    versions = _version(f'{KEY_PREFIX}:version'), _version(_user_version_key(user_id))
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:32]
+    return f'{KEY_PREFIX}:{user_id}:{versions[0]}:{versions[1]}:{digest}'
+
+
+def get_data(key):
+    data = get_cache().get(key)
+    STATS.count('misses' if data is None else 'hits')
+    return data
+
+
+def set_data(key, data):
+    get_cache().set(key, data, cache_timeout())
+
+
+def invalidate_users(user_ids):
+    """Новые версии пользователей: их закэшированные ответы больше не отдаются"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        get_cache().set_many({_user_version_key(user_id): secrets.token_hex(8) for user_id in user_ids}, None)
+        STATS.count('invalidations')
+
+
+def invalidate_all():
+    """Сброс ответов всех пользователей (после массовых операций без сигналов)"""
+    get_cache().set(f'{KEY_PREFIX}:version', secrets.token_hex(8), None)
+    STATS.count('invalidations')
+
+
+class InvalidationBatch:
+    """Изменения одной транзакции; вызывается через transaction.on_commit"""
+
+    def __init__(self):
+        self.user_ids = set()
+        self.route_ids = set()
+        self.point_ids = set()
+
+    def __call__(self):
+        user_ids = set(self.user_ids)
+        if self.route_ids or self.point_ids:
+            point_routes = Point.objects.filter(id__in=self.point_ids).values('route_id')
+            owners = Route.objects.filter(Q(id__in=self.route_ids) | Q(id__in=point_routes))
+            user_ids.update(owners.values_list('user_id', flat=True).distinct())
+        invalidate_users(user_ids)
+
+
+def schedule_invalidation(user_ids=(), route_ids=(), point_ids=()):
+    """
+    Сброс кэша владельцев после фиксации текущей транзакции (вне транзакции — сразу)
+
+    Маршруты и точки, владелец которых неизвестен без запроса, передаются
+    id маршрута или точки: владельцы всего пакета находятся одним запросом.
+    """
+    batch = commit_batches.pending_batch(_local)
+    is_new = batch is None
+    if is_new:
+        batch = InvalidationBatch()
+    batch.user_ids.update(user_ids)
+    batch.route_ids.update(route_ids)
+    batch.point_ids.update(point_ids)
+    if is_new:
+        commit_batches.register_batch(_local, batch)
+
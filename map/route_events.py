@@ -0,0 +1,473 @@
+"""
+События изменения маршрутов, точек и изображений для потока SSE (/api/events/)
+
+Вместо полной перезагрузки дерева маршрутов после каждой записи клиент
+получает компактные события и правит своё состояние:
+
+* route.created / route.updated — поля маршрута без точек (как
+  RouteSummarySerializer: счётчики, длина и bbox уже пересчитаны);
+* point.created / point.updated — поля точки без изображений и id маршрута;
+* image.created / image.updated — изображение как у PointImageSerializer,
+  id точки и маршрута;
+* *.deleted — id удалённого объекта и его родителя;
+* resync — пропущенные события восстановить нельзя, нужна полная загрузка.
+
+За транзакцию изменения копятся в пакет (как сброс кэша в route_cache.py):
+сигналы post_save/post_delete и массовые операции (schedule_changes)
+дают id объектов, после фиксации данные читаются не более чем четырьмя
+запросами. Событие родителя, удалённого в той же транзакции, поглощает
+события детей; любое изменение точки или изображения даёт и route.updated.
+
+Доставка (ROUTE_EVENTS_BACKEND):
+
+* memory — подписчикам этого процесса; хватает одного воркера ASGI;
+* database — через таблицу RouteEvent: каждый процесс опрашивает новые
+  строки раз в ROUTE_EVENTS_POLL_INTERVAL и раздаёт своим подписчикам.
+  Номер строки — id события SSE, по Last-Event-ID пропущенное досылается.
+
+Пока в режиме memory нет подписчиков, пакеты не собираются и лишних
+запросов нет.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.fields import DateTimeField
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - необязательная зависимость
+    orjson = None
+
+from . import commit_batches, route_reader
+from .models import Point, PointImage, Route, RouteEvent
+
+# Порядок событий пакета: родитель создаётся раньше детей и удаляется позже них
+EVENT_ORDER = (
+    ('route', 'created'), ('route', 'updated'), ('point', 'created'), ('point', 'updated'),
+    ('image', 'created'), ('image', 'updated'), ('image', 'deleted'), ('point', 'deleted'),
+    ('route', 'deleted'),
+)
+
+RESYNC = {'type': 'resync', 'data': {}}
+
+_local = threading.local()
+
+
+def backend_name():
+    return getattr(settings, 'ROUTE_EVENTS_BACKEND', 'memory')
+
+
+def heartbeat_interval():
+    return getattr(settings, 'ROUTE_EVENTS_HEARTBEAT', 15)
+
+
+def poll_interval():
+    return getattr(settings, 'ROUTE_EVENTS_POLL_INTERVAL', 0.5)
+
+
+def retention():
+    return getattr(settings, 'ROUTE_EVENTS_RETENTION', 3600)
+
+
+class Subscription:
+    """Открытый поток одного клиента: очередь событий в его цикле событий"""
+
+    MAX_QUEUED = 1000
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.MAX_QUEUED)
+        # Клиент не успевает читать: вместо потерянных событий он получит resync
+        self.overflowed = False
+
+    def deliver(self, events):
+        """Вызывается в цикле событий подписки"""
+        for event in events:
+            if self.queue.full():
+                self.overflowed = True
+                return
+            self.queue.put_nowait(event)
+
+
+class EventHub:
+    """Подписки процесса по пользователям; раздача событий потокобезопасна"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def user_ids(self):
+        with self._lock:
+            return set(self._subscriptions)
+
+    def subscriptions(self, loop=None):
+        with self._lock:
+            return [
+                subscription for subscriptions in self._subscriptions.values() for subscription in subscriptions
+                if loop is None or subscription.loop is loop
+            ]
+
+    def dispatch(self, events):
+        by_user = {}
+        for event in events:
+            by_user.setdefault(event['user'], []).append(event)
+        with self._lock:
+            targets = [
+                (subscription, by_user[user_id])
+                for user_id in by_user.keys() & self._subscriptions.keys()
+                for subscription in self._subscriptions[user_id]
+            ]
+        for subscription, user_events in targets:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, user_events)
+
+
+HUB = EventHub()
+
+
+class MemoryBackend:
+    """События — только подписчикам этого процесса; последние HISTORY_SIZE — для Last-Event-ID"""
+
+    HISTORY_SIZE = 1000
+
+    def __init__(self, hub):
+        self.hub = hub
+        # Номера событий другого процесса (или до перезапуска) не совпадут с этими
+        self.prefix = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._history = deque(maxlen=self.HISTORY_SIZE)
+
+    def is_active(self):
+        return bool(self.hub.user_ids())
+
+    def publish(self, events):
+        with self._lock:
+            for event in events:
+                event['seq'] = next(self._counter)
+                event['id'] = f'{self.prefix}-{event["seq"]}'
+                self._history.append(event)
+        self.hub.dispatch(events)
+
+    def subscribe(self, user_id):
+        return self.hub.subscribe(user_id)
+
+    def unsubscribe(self, subscription):
+        self.hub.unsubscribe(subscription)
+
+    async def missed_events(self, user_id, last_event_id):
+        """События после last_event_id или None, если их уже не восстановить"""
+        prefix, _, seq = last_event_id.partition('-')
+        if prefix != self.prefix or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._lock:
+            history = list(self._history)
+        if history and history[0]['seq'] > seq + 1:
+            return None
+        return [event for event in history if event['seq'] > seq and event['user'] == user_id]
+
+
+class DatabaseBackend:
+    """События через таблицу RouteEvent: видны подписчикам всех процессов"""
+
+    PRUNE_INTERVAL = 60
+    POLL_BATCH = 500
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._pollers = {}
+        self._pruned_at = 0.0
+
+    def is_active(self):
+        return True
+
+    def publish(self, events):
+        RouteEvent.objects.bulk_create(
+            RouteEvent(user_id=event['user'], event={'type': event['type'], 'data': event['data']})
+            for event in events
+        )
+        if time.monotonic() - self._pruned_at > self.PRUNE_INTERVAL:
+            self._pruned_at = time.monotonic()
+            RouteEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention())).delete()
+
+    def subscribe(self, user_id):
+        subscription = self.hub.subscribe(user_id)
+        poller = self._pollers.get(subscription.loop)
+        if poller is None or poller.done():
+            # Опрос общий для всех подписчиков цикла и переживает первого из них:
+            # контекст его запроса (ThreadSensitiveContext asgiref и пр.) не наследуется
+            self._pollers[subscription.loop] = subscription.loop.create_task(
+                self.poll(subscription.loop), context=contextvars.Context(),
+            )
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.hub.unsubscribe(subscription)
+
+    @staticmethod
+    def event_from_row(row_id, user_id, event):
+        return {'id': str(row_id), 'seq': row_id, 'user': user_id, **event}
+
+    async def poll(self, loop):
+        """Раздача новых строк подписчикам цикла loop, пока они есть"""
+        last_id = await RouteEvent.objects.order_by('-id').values_list('id', flat=True).afirst() or 0
+        while True:
+            subscriptions = self.hub.subscriptions(loop)
+            if not subscriptions:
+                self._pollers.pop(loop, None)
+                return
+            rows = RouteEvent.objects.filter(
+                id__gt=last_id, user_id__in={subscription.user_id for subscription in subscriptions},
+            ).order_by('id').values_list('id', 'user_id', 'event')[:self.POLL_BATCH]
+            events = [self.event_from_row(*row) async for row in rows]
+            if events:
+                last_id = events[-1]['seq']
+                self.hub.dispatch(events)
+            if len(events) < self.POLL_BATCH:
+                await asyncio.sleep(poll_interval())
+
+    async def missed_events(self, user_id, last_event_id):
+        if not last_event_id.isdigit():
+            return None
+        last_id = int(last_event_id)
+        # Строки после last_id могли удалить по сроку хранения
+        oldest = await RouteEvent.objects.order_by('id').values_list('id', flat=True).afirst()
+        if oldest is not None and oldest > last_id + 1:
+            return None
+        rows = RouteEvent.objects.filter(user_id=user_id, id__gt=last_id).order_by('id')
+        return [self.event_from_row(*row) async for row in rows.values_list('id', 'user_id', 'event')]
+
+
+_backends = {}
+
+
+def get_backend():
+    name = backend_name()
+    backend = _backends.get(name)
+    if backend is None:
+        backend = _backends[name] = {'memory': MemoryBackend, 'database': DatabaseBackend}[name](HUB)
+    return backend
+
+
+class ChangeBatch:
+    """Изменения одной транзакции; вызывается через transaction.on_commit"""
+
+    def __init__(self):
+        # (вид, id) -> действие; для удалённых — и id родителя
+        self.changes = {}
+        self.deleted_parents = {}
+
+    def add(self, kind, action, object_id, parent_id=None):
+        key = (kind, object_id)
+        previous = self.changes.get(key)
+        if action == 'deleted':
+            if previous == 'created':
+                # Создан и удалён в одной транзакции: клиент его не видел
+                del self.changes[key]
+                return
+            self.deleted_parents[key] = parent_id
+        elif previous in ('created', 'deleted'):
+            return
+        self.changes[key] = action
+
+    def ids(self, kind, *actions):
+        return {object_id for (change_kind, object_id), action in self.changes.items()
+                if change_kind == kind and action in actions}
+
+    def __call__(self):
+        backend = get_backend()
+        if backend.is_active():
+            events = self.build_events()
+            if events:
+                backend.publish(events)
+
+    def build_events(self):
+        deleted_routes = self.ids('route', 'deleted')
+        deleted_points = self.ids('point', 'deleted')
+        events = {key: [] for key in EVENT_ORDER}
+        route_ids = self.ids('route', 'created', 'updated')
+
+        image_rows = []
+        saved_images = self.ids('image', 'created', 'updated')
+        if saved_images:
+            image_rows = list(
+                PointImage.objects.filter(id__in=saved_images).order_by('id')
+                .values_list(*route_reader.IMAGE_READ_FIELDS, 'point__route_id')
+            )
+            route_ids.update(row[-1] for row in image_rows)
+
+        image_deletes = {
+            image_id: point_id for (kind, image_id), point_id in self.deleted_parents.items()
+            if kind == 'image' and point_id not in deleted_points
+        }
+        image_routes = {}
+        if image_deletes:
+            image_routes = dict(
+                Point.objects.filter(id__in=set(image_deletes.values())).values_list('id', 'route_id')
+            )
+            route_ids.update(image_routes.values())
+
+        point_rows = []
+        saved_points = self.ids('point', 'created', 'updated')
+        if saved_points:
+            point_rows = list(
+                Point.objects.filter(id__in=saved_points).order_by('route_id', 'order', 'id')
+                .values_list(*route_reader.POINT_READ_FIELDS)
+            )
+            route_ids.update(row[1] for row in point_rows)
+        route_ids.update(
+            route_id for (kind, _), route_id in self.deleted_parents.items() if kind == 'point'
+        )
+
+        routes = {}
+        route_ids -= deleted_routes
+        if route_ids:
+            rows = Route.objects.filter(id__in=route_ids).values(*route_reader.SUMMARY_READ_FIELDS)
+            routes = {row['id']: row for row in rows}
+
+        datetime_field = DateTimeField()
+        for route_id, route in routes.items():
+            action = 'created' if self.changes.get(('route', route_id)) == 'created' else 'updated'
+            data = route_reader.summary_data(route, datetime_field)
+            events[('route', action)].append(self.event(route['user_id'], 'route', action, data))
+
+        for row in point_rows:
+            route = routes.get(row[1])
+            if route is not None:
+                action = self.changes[('point', row[0])]
+                data = route_reader.point_data(row, {})
+                del data['images']
+                data['route'] = row[1]
+                events[('point', action)].append(self.event(route['user_id'], 'point', action, data))
+
+        for image_id, point_id, name, derivatives, route_id in image_rows:
+            route = routes.get(route_id)
+            if route is not None:
+                action = self.changes[('image', image_id)]
+                data = {'id': image_id, 'point': point_id, 'route': route_id, 'name': name, 'derivatives': derivatives}
+                events[('image', action)].append(self.event(route['user_id'], 'image', action, data))
+
+        for image_id, point_id in image_deletes.items():
+            route = routes.get(image_routes.get(point_id))
+            if route is not None:
+                data = {'id': image_id, 'point': point_id, 'route': route['id']}
+                events[('image', 'deleted')].append(self.event(route['user_id'], 'image', 'deleted', data))
+
+        for point_id in deleted_points:
+            route = routes.get(self.deleted_parents[('point', point_id)])
+            if route is not None:
+                data = {'id': point_id, 'route': route['id']}
+                events[('point', 'deleted')].append(self.event(route['user_id'], 'point', 'deleted', data))
+
+        for route_id in deleted_routes:
+            user_id = self.deleted_parents[('route', route_id)]
+            if user_id is not None:
+                events[('route', 'deleted')].append(self.event(user_id, 'route', 'deleted', {'id': route_id}))
+
+        return [event for key in EVENT_ORDER for event in events[key]]
+
+    @staticmethod
+    def event(user_id, kind, action, data):
+        return {'user': user_id, 'type': f'{kind}.{action}', 'data': data}
+
+
+def schedule_changes(kind, action, ids, parent_id=None):
+    """
+    События об изменении объектов kind ('route', 'point', 'image') после
+    фиксации текущей транзакции (вне транзакции — сразу)
+
+    Для удалений parent_id — владелец маршрута, маршрут точки или точка
+    изображения: после удаления их уже не прочитать.
+    """
+    if not ids or not get_backend().is_active():
+        return
+    batch = commit_batches.pending_batch(_local)
+    is_new = batch is None
+    if is_new:
+        batch = ChangeBatch()
+    for object_id in ids:
+        batch.add(kind, action, object_id, parent_id)
+    if is_new:
+        commit_batches.register_batch(_local, batch)
+
+
+def dumps(value):
+    """Компактный JSON одной строкой; без orjson — стандартный json с тем же выводом"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def render_event(event, build_url):
+    """Сообщение SSE; файлы изображений превращаются в URL через build_url"""
+    data = event['data']
+    if event['type'] in ('image.created', 'image.updated'):
+        row = (data['id'], data['point'], data['name'], data['derivatives'])
+        image = route_reader.group_images([row], build_url)[data['point']][0]
+        data = {**image, 'point': data['point'], 'route': data['route']}
+    lines = [f'id: {event["id"]}'] if 'id' in event else []
+    lines.append(f'data: {dumps({"type": event["type"], "data": data})}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def event_stream(user_id, last_event_id, build_url):
+    """
+    Поток SSE пользователя: сначала пропущенное после last_event_id, затем
+    новые события; комментарий-пинг раз в ROUTE_EVENTS_HEARTBEAT секунд
+    """
+    backend = get_backend()
+    subscription = backend.subscribe(user_id)
+    try:
+        yield f'retry: {getattr(settings, "ROUTE_EVENTS_RETRY_MS", 3000)}\n\n'
+        last_seq = 0
+        if last_event_id:
+            missed = await backend.missed_events(user_id, last_event_id)
+            if missed is None:
+                yield render_event(RESYNC, build_url)
+            else:
+                for event in missed:
+                    yield render_event(event, build_url)
+                    last_seq = event['seq']
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat_interval())
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            if subscription.overflowed:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                yield render_event(RESYNC, build_url)
+                continue
+            # Досланное по Last-Event-ID могло прийти и из очереди
+            if event['seq'] > last_seq:
+                last_seq = event['seq']
+                yield render_event(event, build_url)
+    finally:
+        backend.unsubscribe(subscription)
+
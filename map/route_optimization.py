@@ -0,0 +1,179 @@
+"""
+Оптимизация порядка точек маршрута (незамкнутая задача коммивояжёра)
+
+Построение — жадный «ближайший сосед» по матрице расстояний, затем
+улучшение 2-opt (разворот участка) и Or-opt (перенос цепочки из 1–3 точек)
+до локального минимума или до исчерпания бюджета времени. Первая и
+последняя точки могут быть закреплены.
+"""
+
+import time
+
+import numpy as np
+
+from .geometry import haversine_matrix
+
+# Бюджет времени по умолчанию и верхняя граница, которую может запросить клиент
+DEFAULT_TIME_BUDGET_MS = 50
+MAX_TIME_BUDGET_MS = 500
+
+# Улучшения меньше этой величины (м) не учитываются — защита от зацикливания на погрешностях
+IMPROVEMENT_EPSILON = 1e-6
+
+OR_OPT_SEGMENT_LENGTHS = (1, 2, 3)
+
+
+def path_length(matrix, order):
+    order = np.asarray(order)
+    return float(matrix[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbour(matrix, start, end=None):
+    """
+    Жадный путь из start; если задан end, он ставится последним
+
+    Returns:
+        list: Порядок индексов точек
+    """
+    count = matrix.shape[0]
+    visited = np.zeros(count, dtype=bool)
+    visited[start] = True
+    if end is not None:
+        visited[end] = True
+    order = [start]
+    current = start
+    for _ in range(count - 1 - (end is not None)):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = int(np.argmin(distances))
+        visited[current] = True
+        order.append(current)
+    if end is not None:
+        order.append(end)
+    return order
+
+
+def _edge(matrix, order, left, right):
+    """Длина ребра между позициями left и right (0, если одной из позиций нет)"""
+    if left < 0 or right >= len(order):
+        return 0.0
+    return matrix[order[left]][order[right]]
+
+
+def two_opt(matrix, order, first, last, deadline):
+    """
+    Развороты участков order[i..j] для first <= i < j <= last
+
+    Returns:
+        bool: Было ли улучшение
+    """
+    improved = False
+    changed = True
+    while changed and time.perf_counter() < deadline:
+        changed = False
+        for i in range(first, last):
+            for j in range(i + 1, last + 1):
+                before = _edge(matrix, order, i - 1, i) + _edge(matrix, order, j, j + 1)
+                after = (
+                    (matrix[order[i - 1]][order[j]] if i > 0 else 0.0)
+                    + (matrix[order[i]][order[j + 1]] if j + 1 < len(order) else 0.0)
+                )
+                if after < before - IMPROVEMENT_EPSILON:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    changed = improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return improved
+
+
+def or_opt(matrix, order, first, last, deadline):
+    """
+    Перенос цепочек из 1–3 точек (в прямом или обратном порядке) на другое место
+
+    Returns:
+        bool: Было ли улучшение
+    """
+    improved = False
+    changed = True
+    while changed and time.perf_counter() < deadline:
+        changed = False
+        for length in OR_OPT_SEGMENT_LENGTHS:
+            i = first
+            while i + length - 1 <= last:
+                j = i + length - 1
+                segment = order[i:j + 1]
+                removal_gain = (
+                    _edge(matrix, order, i - 1, i) + _edge(matrix, order, j, j + 1)
+                    - (matrix[order[i - 1]][order[j + 1]] if i > 0 and j + 1 < len(order) else 0.0)
+                )
+                rest = order[:i] + order[j + 1:]
+                best = None
+                # Вставка между rest[k - 1] и rest[k]; закреплённые концы не сдвигаются
+                for k in range(first, last - length + 2):
+                    if k == i:
+                        continue
+                    prev_node = rest[k - 1] if k > 0 else None
+                    next_node = rest[k] if k < len(rest) else None
+                    base = matrix[prev_node][next_node] if prev_node is not None and next_node is not None else 0.0
+                    for candidate in (segment, segment[::-1]):
+                        cost = (
+                            (matrix[prev_node][candidate[0]] if prev_node is not None else 0.0)
+                            + (matrix[candidate[-1]][next_node] if next_node is not None else 0.0)
+                            - base
+                        )
+                        if cost < removal_gain - IMPROVEMENT_EPSILON and (best is None or cost < best[0]):
+                            best = (cost, k, candidate)
+                if best is not None:
+                    _, k, candidate = best
+                    order[:] = rest[:k] + list(candidate) + rest[k:]
+                    changed = improved = True
+                i += 1
+                if time.perf_counter() >= deadline:
+                    return improved
+    return improved
+
+
+def optimize_order(lats, lons, pin_start=True, pin_end=False, time_budget_ms=DEFAULT_TIME_BUDGET_MS):
+    """
+    Порядок точек, минимизирующий длину пути
+
+    Args:
+        lats, lons: Координаты точек в текущем порядке
+        pin_start: Оставить первую точку первой
+        pin_end: Оставить последнюю точку последней
+        time_budget_ms: Жёсткий бюджет времени на улучшение
+
+    Returns:
+        tuple: (новый порядок индексов, длина до, длина после)
+    """
+    count = len(lats)
+    current = list(range(count))
+    deadline = time.perf_counter() + time_budget_ms / 1000
+    matrix = haversine_matrix(lats, lons)
+    length_before = path_length(matrix, current)
+    if count < 3:
+        # Путь из двух точек одинаков в обоих направлениях
+        return current, length_before, length_before
+    end = count - 1 if pin_end else None
+
+    if pin_start:
+        order = nearest_neighbour(matrix, 0, end)
+    else:
+        # Без закреплённого начала пробуем каждую точку как стартовую
+        candidates = [nearest_neighbour(matrix, start, end) for start in range(count) if start != end]
+        order = min(candidates, key=lambda candidate: path_length(matrix, candidate))
+
+    first = 1 if pin_start else 0
+    last = count - 2 if pin_end else count - 1
+    # Во внутренних циклах списки списков быстрее поэлементного доступа к ndarray
+    rows = matrix.tolist()
+    while time.perf_counter() < deadline:
+        improved = two_opt(rows, order, first, last, deadline)
+        improved = or_opt(rows, order, first, last, deadline) or improved
+        if not improved:
+            break
+
+    length_after = path_length(matrix, order)
+    if length_after >= length_before - IMPROVEMENT_EPSILON:
+        # Текущий порядок не хуже найденного — не трогаем его
+        return current, length_before, length_before
+    return order, length_before, length_after
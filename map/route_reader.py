@@ -0,0 +1,207 @@
+"""
+Быстрое чтение маршрутов для list/retrieve
+
+Вместо RouteSerializer -> PointSerializer -> PointImageSerializer данные
+читаются через values()/values_list() тремя запросами (маршруты, точки,
+изображения) и собираются в словари вручную: без экземпляров моделей и без
+полей DRF на каждую точку. Результат совпадает с выводом RouteSerializer
+байт в байт (см. map/tests.py); при изменении полей сериализаторов нужно
+менять и этот модуль.
+
+Чтение строк и сборка разделены: build_routes читает синхронно,
+abuild_routes — через async ORM (асинхронные представления, async_views.py),
+сборка (assemble_routes) общая.
+"""
+
+from django.conf import settings
+from rest_framework.fields import DateTimeField
+
+from .models import Point, PointImage
+from .polyline import encode_polyline
+
+ROUTE_READ_FIELDS = (
+    'id', 'name', 'description', 'created_at', 'updated_at', 'user_id', 'length', 'legs', 'bbox',
+)
+POINT_READ_FIELDS = ('id', 'route_id', 'name', 'description', 'lat', 'lon', 'order')
+IMAGE_READ_FIELDS = ('id', 'point_id', 'image', 'derivatives')
+# Поля RouteSummarySerializer
+SUMMARY_READ_FIELDS = (
+    'id', 'name', 'description', 'created_at', 'updated_at', 'user_id',
+    'points_count', 'images_count', 'length', 'bbox',
+)
+
+
+def is_enabled():
+    return getattr(settings, 'ROUTES_FAST_READ', True)
+
+
+def route_row(route):
+    """Словарь полей маршрута из экземпляра модели (для страниц пагинации и retrieve)"""
+    return {field: getattr(route, field) for field in ROUTE_READ_FIELDS}
+
+
+def image_rows(route_ids=None, points=None):
+    """
+    Строки изображений в порядке id: точек маршрутов route_ids или точек
+    points (id или QuerySet точек — тогда подзапросом)
+    """
+    queryset = PointImage.objects.order_by('id')
+    if route_ids is not None:
+        queryset = queryset.filter(point__route_id__in=route_ids)
+    if points is not None:
+        queryset = queryset.filter(point_id__in=points)
+    return queryset.values_list(*IMAGE_READ_FIELDS)
+
+
+def point_rows(route_ids):
+    """Строки точек маршрутов в порядке следования"""
+    return (
+        Point.objects.filter(route_id__in=route_ids)
+        .order_by('route_id', 'order', 'id')
+        .values_list(*POINT_READ_FIELDS)
+    )
+
+
+def url_builder(request):
+    """Функция name -> URL файла изображения (абсолютный, если есть request)"""
+    storage = PointImage._meta.get_field('image').storage
+    if request is None:
+        return storage.url
+
+    def build_url(name):
+        return request.build_absolute_uri(storage.url(name))
+    return build_url
+
+
+def group_images(rows, build_url):
+    """Изображения точек: id точки -> список словарей как у PointImageSerializer"""
+    images = {}
+    for image_id, point_id, name, derivatives in rows:
+        if name:
+            url = build_url(name)
+            # Самая маленькая JPEG-копия, как в PointImage.get_thumbnail_name
+            jpegs = [d for d in derivatives or [] if d['format'] == 'jpeg']
+            thumbnail = build_url(min(jpegs, key=lambda d: d['width'])['name']) if jpegs else url
+        else:
+            url = thumbnail = None
+        srcset = {}
+        for derivative in sorted(derivatives or [], key=lambda d: d['width']):
+            srcset.setdefault(derivative['format'], []).append(
+                f"{build_url(derivative['name'])} {derivative['width']}w"
+            )
+        images.setdefault(point_id, []).append({
+            'id': image_id,
+            'image': url,
+            'thumbnail': thumbnail,
+            'srcset': {fmt: ', '.join(entries) for fmt, entries in srcset.items()},
+        })
+    return images
+
+
+def summary_data(row, datetime_field):
+    """Маршрут в формате RouteSummarySerializer из словаря SUMMARY_READ_FIELDS"""
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'],
+        'created_at': datetime_field.to_representation(row['created_at']),
+        'updated_at': datetime_field.to_representation(row['updated_at']),
+        'user': row['user_id'],
+        'points_count': row['points_count'],
+        'images_count': row['images_count'],
+        'length': row['length'],
+        'bbox': row['bbox'],
+    }
+
+
+def point_data(row, images, with_coordinates=True):
+    """Точка в формате PointSerializer из строки POINT_READ_FIELDS"""
+    point_id, _, name, description, lat, lon, order = row
+    # DecimalField DRF отдаёт строкой с фиксированным числом знаков; из БД значения уже квантованы
+    if with_coordinates:
+        return {
+            'id': point_id, 'name': name, 'description': description,
+            'lat': format(lat, 'f'), 'lon': format(lon, 'f'),
+            'images': images.get(point_id, []), 'order': order,
+        }
+    return {
+        'id': point_id, 'name': name, 'description': description,
+        'images': images.get(point_id, []), 'order': order,
+    }
+
+
+def assemble_routes(routes, points, images, polyline_precision=None):
+    """
+    Сборка маршрутов из уже прочитанных строк
+
+    Args:
+        routes: Словари с полями ROUTE_READ_FIELDS в нужном порядке
+        points: Строки point_rows
+        images: Результат group_images
+        polyline_precision: Точность ?geometry=polyline или None
+
+    Returns:
+        list: Словари в формате RouteSerializer
+    """
+    with_coordinates = polyline_precision is None
+    points_by_route = {}
+    coordinates_by_route = {}
+    for row in points:
+        route_id = row[1]
+        points_by_route.setdefault(route_id, []).append(point_data(row, images, with_coordinates))
+        if not with_coordinates:
+            coordinates_by_route.setdefault(route_id, []).append((row[4], row[5]))
+
+    datetime_field = DateTimeField()
+    result = []
+    for route in routes:
+        data = {
+            'id': route['id'],
+            'name': route['name'],
+            'description': route['description'],
+            'points': points_by_route.get(route['id'], []),
+            'created_at': datetime_field.to_representation(route['created_at']),
+            'updated_at': datetime_field.to_representation(route['updated_at']),
+            'user': route['user_id'],
+            'length': route['length'],
+            'legs': route['legs'],
+            'bbox': route['bbox'],
+        }
+        if polyline_precision is not None:
+            data['polyline'] = encode_polyline(coordinates_by_route.get(route['id'], []), polyline_precision)
+            data['polyline_precision'] = polyline_precision
+        result.append(data)
+    return result
+
+
+def build_routes(routes, request=None, polyline_precision=None):
+    """
+    Представление маршрутов с точками и изображениями
+
+    Args:
+        routes: Последовательность словарей с полями ROUTE_READ_FIELDS
+            (QuerySet.values() или route_row) в нужном порядке
+        request: Запрос для абсолютных URL изображений
+        polyline_precision: Точность ?geometry=polyline или None
+
+    Returns:
+        list: Словари в формате RouteSerializer
+    """
+    routes = list(routes)
+    if not routes:
+        return []
+    route_ids = [route['id'] for route in routes]
+    images = group_images(image_rows(route_ids=route_ids), url_builder(request))
+    return assemble_routes(routes, point_rows(route_ids), images, polyline_precision)
+
+
+async def abuild_routes(routes, request=None, polyline_precision=None):
+    """build_routes для асинхронных представлений: те же запросы через async ORM"""
+    if not isinstance(routes, (list, tuple)):
+        routes = [route async for route in routes]
+    if not routes:
+        return []
+    route_ids = [route['id'] for route in routes]
+    images = group_images([row async for row in image_rows(route_ids=route_ids)], url_builder(request))
+    points = [row async for row in point_rows(route_ids)]
+    return assemble_routes(routes, points, images, polyline_precision)
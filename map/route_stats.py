@@ -0,0 +1,56 @@
+"""
+Хранение геометрической статистики маршрутов (length, legs, bbox в Route)
+"""
+
+from .geometry import empty_stats, route_stats, route_stats_batch
+from .models import Point, Route
+
+STATS_FIELDS = ('length', 'legs', 'bbox')
+
+
+def save_route_stats(route, coordinates):
+    """
+    Пересчёт статистики по уже известным координатам точек (без запроса точек)
+
+    Args:
+        route: Маршрут (поля экземпляра тоже обновляются)
+        coordinates: (lat, lon) точек в порядке следования
+    """
+    stats = route_stats([(float(lat), float(lon)) for lat, lon in coordinates])
+    for field in STATS_FIELDS:
+        setattr(route, field, stats[field])
+    Route.objects.filter(id=route.id).update(**stats)
+
+
+def refresh_route_stats(route_ids=None, batch_size=500):
+    """
+    Пересчёт статистики маршрутов пачками: один запрос точек и один
+    bulk_update на пачку
+
+    Args:
+        route_ids: Маршруты для пересчёта (None — все)
+        batch_size: Сколько маршрутов обрабатывать за раз
+
+    Returns:
+        int: Количество пересчитанных маршрутов
+    """
+    queryset = Route.objects.order_by('id')
+    if route_ids is not None:
+        queryset = queryset.filter(id__in=route_ids)
+    ids = list(queryset.values_list('id', flat=True))
+
+    for offset in range(0, len(ids), batch_size):
+        batch = ids[offset:offset + batch_size]
+        rows = list(
+            Point.objects.filter(route_id__in=batch)
+            .order_by('route_id', 'order', 'id')
+            .values_list('route_id', 'lat', 'lon')
+        )
+        stats = route_stats_batch(
+            [row[0] for row in rows], [float(row[1]) for row in rows], [float(row[2]) for row in rows],
+        )
+        Route.objects.bulk_update(
+            [Route(id=route_id, **stats.get(route_id, empty_stats())) for route_id in batch],
+            list(STATS_FIELDS),
+        )
+    return len(ids)
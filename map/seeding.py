@@ -0,0 +1,140 @@
+"""
+Генерация синтетических данных: пользователи × маршруты × точки × изображения
+
+Всё создаётся через bulk_create с отключёнными сигналами точек; счётчики,
+геометрия маршрутов и кластеры затем пересчитываются пакетно. Все
+изображения ссылаются на один сгенерированный blob (см. blobs.py), поэтому
+файлов в хранилище — один исходник и его уменьшенные копии.
+"""
+
+import io
+import math
+import random
+import re
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import clustering
+from .blobs import acquire_blob, blob_name, hash_file
+from .models import Point, PointImage, Route, UserProfile
+from .route_stats import refresh_route_stats
+from .signals import suppress_point_signals
+from .thumbnails import store_derivatives
+
+# Область, в которой генерируются маршруты (lat, lon)
+SEED_AREA = ((43.0, 30.0), (60.0, 60.0))
+
+# Шаг между соседними точками маршрута, градусы
+SEED_STEP = 0.01
+
+BULK_BATCH_SIZE = 2000
+
+
+def seed_image(size=64):
+    """Небольшое PNG-изображение для изображений точек"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), (70, 130, 180)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def seed_blob(references, storage=None):
+    """
+    Общий blob для всех сгенерированных изображений (с уменьшенными копиями)
+
+    Returns:
+        tuple: (ImageBlob, описания копий)
+    """
+    from django.core.files.storage import default_storage
+
+    storage = storage or default_storage
+    data = seed_image()
+    digest, size = hash_file(ContentFile(data))
+    blob = acquire_blob(digest, blob_name(digest, 'png'), size, references=references)
+    if not storage.exists(blob.name):
+        storage.save(blob.name, ContentFile(data))
+    return blob, store_derivatives(blob.name, data, storage)
+
+
+def _track(rng, points_count):
+    """Случайное блуждание от случайной стартовой точки"""
+    (min_lat, min_lon), (max_lat, max_lon) = SEED_AREA
+    lat, lon = rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+    heading = rng.uniform(0, 2 * math.pi)
+    coordinates = []
+    for _ in range(points_count):
+        coordinates.append((round(lat, 6), round(lon, 6)))
+        heading += rng.uniform(-0.6, 0.6)
+        lat = min(max(lat + SEED_STEP * math.cos(heading), -90), 90)
+        lon = min(max(lon + SEED_STEP * math.sin(heading), -180), 180)
+    return coordinates
+
+
+@transaction.atomic
+def seed_maps(users=10, routes=10, points=20, images=1, prefix='seed', seed=0):
+    """
+    Создание users пользователей с routes маршрутами по points точек,
+    у каждой точки — images изображений
+
+    Пользователи получают тариф max на год и непригодный пароль;
+    имена — ``<prefix>-<номер>``.
+
+    Returns:
+        tuple: (список пользователей, {'users', 'routes', 'points', 'images'} — сколько создано)
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    existing = User.objects.filter(username__regex=rf'^{re.escape(prefix)}-[0-9]+$').values_list('username', flat=True)
+    start = max((int(name.rsplit('-', 1)[1]) for name in existing), default=-1) + 1
+    password = make_password(None)
+
+    created_users = User.objects.bulk_create(
+        User(username=f'{prefix}-{start + index}', password=password) for index in range(users)
+    )
+    # bulk_create не вызывает post_save, поэтому профили создаём сами
+    UserProfile.objects.bulk_create(
+        UserProfile(
+            user=user, subscription_type='max', subscription_until=now + timedelta(days=365),
+            routes_count=routes,
+        )
+        for user in created_users
+    )
+
+    blob, derivatives = seed_blob(users * routes * points * images) if images and points else (None, [])
+    totals = {'users': len(created_users), 'routes': 0, 'points': 0, 'images': 0}
+    for user in created_users:
+        created_routes = Route.objects.bulk_create(
+            Route(
+                user=user, name=f'Маршрут {index + 1}', description=f'Синтетический маршрут {user.username}',
+                points_count=points, images_count=points * images,
+            )
+            for index in range(routes)
+        )
+        new_points, coordinates = [], []
+        for route in created_routes:
+            for order, (lat, lon) in enumerate(_track(rng, points)):
+                point = Point(route=route, name=f'Точка {order + 1}', lat=lat, lon=lon, order=order)
+                point.update_geohash()
+                new_points.append(point)
+                coordinates.append((lat, lon))
+        with suppress_point_signals():
+            Point.objects.bulk_create(new_points, batch_size=BULK_BATCH_SIZE)
+            if blob is not None:
+                PointImage.objects.bulk_create(
+                    (
+                        PointImage(point=point, image=blob.name, blob=blob, derivatives=derivatives)
+                        for point in new_points for _ in range(images)
+                    ),
+                    batch_size=BULK_BATCH_SIZE,
+                )
+        clustering.apply_point_changes(user.id, added=coordinates)
+        refresh_route_stats([route.id for route in created_routes])
+        totals['routes'] += len(created_routes)
+        totals['points'] += len(new_points)
+        totals['images'] += len(new_points) * images
+    return created_users, totals
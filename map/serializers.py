@@ -1,9 +1,14 @@
 from rest_framework import serializers
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 from decimal import Decimal, InvalidOperation
-from .models import Route, Point, PointImage
+from . import clustering, counters, route_events
+from .models import Route, Point, PointImage, ImageUploadJob
 from .models import UserProfile
 from django.utils import timezone
+from .signals import suppress_point_signals
+from .route_stats import save_route_stats
+from .polyline import encode_polyline
 from .image_validation import (
     is_valid_image_extension,
     is_valid_mime_type,
@@ -15,10 +20,32 @@ from .image_validation import (
 
 
 class PointImageSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = PointImage
-        fields = ['id', 'image']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'thumbnail', 'srcset']
+        read_only_fields = ['id', 'thumbnail', 'srcset']
+
+    def _build_url(self, obj, name):
+        url = obj.image.storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_thumbnail(self, obj):
+        """URL самой маленькой JPEG-копии (или исходника, если копий ещё нет)"""
+        if not obj.image:
+            return None
+        return self._build_url(obj, obj.get_thumbnail_name('jpeg'))
+
+    def get_srcset(self, obj):
+        """Готовые значения srcset по форматам: {'webp': 'url 160w, url 320w', ...}"""
+        srcset = {}
+        for derivative in sorted(obj.derivatives or [], key=lambda d: d['width']):
+            entry = f"{self._build_url(obj, derivative['name'])} {derivative['width']}w"
+            srcset.setdefault(derivative['format'], []).append(entry)
+        return {fmt: ', '.join(entries) for fmt, entries in srcset.items()}
 
     def validate_image(self, value):
         """Валидация изображения с использованием единых констант"""
@@ -45,6 +72,47 @@ class PointImageSerializer(serializers.ModelSerializer):
         return value
 
 
+class ImageUploadJobListSerializer(serializers.ListSerializer):
+    """Список задач: изображения всех задач загружаются одним запросом"""
+
+    def to_representation(self, data):
+        jobs = list(data.all() if hasattr(data, 'all') else data)
+        image_ids = {image_id for job in jobs for image_id in job.image_ids}
+        self.child.images_by_id = PointImage.objects.in_bulk(image_ids)
+        return super().to_representation(jobs)
+
+
+class ImageUploadJobSerializer(serializers.ModelSerializer):
+    """Статус фоновой обработки загруженных изображений"""
+    progress = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+
+    # Изображения задач списка, загруженные ImageUploadJobListSerializer
+    images_by_id = None
+
+    class Meta:
+        model = ImageUploadJob
+        list_serializer_class = ImageUploadJobListSerializer
+        fields = [
+            'id', 'point', 'status', 'total_files', 'processed_files', 'progress',
+            'images', 'errors', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        if not obj.total_files:
+            return 1.0
+        return round(obj.processed_files / obj.total_files, 3)
+
+    def get_images(self, obj):
+        images_by_id = self.images_by_id
+        if images_by_id is None:
+            images_by_id = PointImage.objects.in_bulk(obj.image_ids)
+        # Удалённые после загрузки изображения пропускаются
+        images = [images_by_id[image_id] for image_id in obj.image_ids if image_id in images_by_id]
+        return PointImageSerializer(images, many=True, context=self.context).data
+
+
 class PointSerializer(serializers.ModelSerializer):
     images = PointImageSerializer(many=True, read_only=True)
 
@@ -53,6 +121,14 @@ class PointSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'lat', 'lon', 'images', 'order']
         read_only_fields = ['id', 'order', 'images']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('polyline_precision') is not None:
+            # Координаты отдаются одной строкой polyline в маршруте (?geometry=polyline)
+            fields.pop('lat')
+            fields.pop('lon')
+        return fields
+
     def validate_name(self, value):
         """Валидация названия точки"""
         if value:
@@ -114,8 +190,11 @@ class RouteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Route
-        fields = ['id', 'name', 'description', 'points', 'created_at', 'updated_at', 'user']  # добавить 'user'
-        read_only_fields = ['id', 'created_at', 'updated_at', 'points']
+        fields = [
+            'id', 'name', 'description', 'points', 'created_at', 'updated_at', 'user',
+            'length', 'legs', 'bbox',
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at', 'points', 'length', 'legs', 'bbox']
 
     def validate_name(self, value):
         """Валидация названия маршрута"""
@@ -170,6 +249,7 @@ class RouteSerializer(serializers.ModelSerializer):
 
         route = Route.objects.create(**validated_data)
 
+        points = []
         for idx, point_data in enumerate(points_data):
             # Фильтруем только разрешенные поля
             allowed_fields = {'name', 'description', 'lat', 'lon'}
@@ -177,10 +257,44 @@ class RouteSerializer(serializers.ModelSerializer):
 
             point_serializer = PointSerializer(data=filtered_point_data, context=self.context)
             point_serializer.is_valid(raise_exception=True)
-            point_serializer.save(route=route, order=idx)
-
+            point = Point(route=route, order=idx, **point_serializer.validated_data)
+            point.update_geohash()
+            points.append(point)
+
+        if points:
+            # Как в update: точки одним INSERT, производные данные — одним пакетом
+            with suppress_point_signals():
+                Point.objects.bulk_create(points)
+            route_events.schedule_changes('point', 'created', [point.pk for point in points if point.pk])
+            coordinates = [(float(point.lat), float(point.lon)) for point in points]
+            clustering.apply_point_changes(route.user_id, added=coordinates)
+            counters.adjust_route_counters(route.id, points=len(points))
+            save_route_stats(route, coordinates)
         return route
 
+    @staticmethod
+    def _same_point_value(field, current, new):
+        """Сравнение значения поля точки с присланным (координаты сравниваются как числа)"""
+        if field in ('lat', 'lon'):
+            try:
+                return Decimal(str(current)) == Decimal(str(new))
+            except (InvalidOperation, ValueError, TypeError):
+                return False
+        return current == new
+
+    def to_representation(self, instance):
+        # Точки с изображениями загружаются двумя запросами, а не по запросу на точку
+        if 'points' not in getattr(instance, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([instance], 'points__images')
+        data = super().to_representation(instance)
+        precision = self.context.get('polyline_precision')
+        if precision is not None:
+            data['polyline'] = encode_polyline(
+                ((point.lat, point.lon) for point in instance.points.all()), precision,
+            )
+            data['polyline_precision'] = precision
+        return data
+
     @transaction.atomic
     def update(self, instance, validated_data):
         """Обновление маршрута с точками"""
@@ -199,10 +313,19 @@ class RouteSerializer(serializers.ModelSerializer):
                     'points': f'Максимальное количество точек в маршруте: {MAX_POINTS}'
                 })
 
-            # Сохраняем существующие точки с изображениями
             existing_points_map = {point.id: point for point in instance.points.all()}
-            updated_point_ids = []
-
+            old_coordinates = [
+                (float(point.lat), float(point.lon))
+                for point in sorted(existing_points_map.values(), key=lambda point: (point.order, point.id))
+            ]
+            new_coordinates = []
+            points_to_create = []
+            points_to_update = []
+            kept_point_ids = set()
+            added_coords = []
+            removed_coords = []
+
+            # Вычисляем разницу между присланным списком и текущими точками
             for idx, point_data in enumerate(points_data):
                 point_id = point_data.get('id')
 
@@ -211,31 +334,77 @@ class RouteSerializer(serializers.ModelSerializer):
                 filtered_point_data = {k: v for k, v in point_data.items() if k in allowed_fields}
 
                 if point_id and isinstance(point_id, int) and point_id in existing_points_map:
-                    # Обновляем существующую точку
                     existing_point = existing_points_map[point_id]
-                    existing_point.name = filtered_point_data.get('name', existing_point.name)
-                    existing_point.description = filtered_point_data.get('description', existing_point.description)
-                    existing_point.lat = filtered_point_data.get('lat', existing_point.lat)
-                    existing_point.lon = filtered_point_data.get('lon', existing_point.lon)
-                    existing_point.order = idx
-                    existing_point.save()
-                    updated_point_ids.append(point_id)
+                    old_coords = (float(existing_point.lat), float(existing_point.lon))
+                    changed = False
+                    for field in ('name', 'description', 'lat', 'lon'):
+                        if field in filtered_point_data and not self._same_point_value(
+                                field, getattr(existing_point, field), filtered_point_data[field]):
+                            setattr(existing_point, field, filtered_point_data[field])
+                            changed = True
+                    if existing_point.order != idx:
+                        existing_point.order = idx
+                        changed = True
+                    if changed:
+                        existing_point.update_geohash()
+                        points_to_update.append(existing_point)
+                        new_coords = (float(existing_point.lat), float(existing_point.lon))
+                        if new_coords != old_coords:
+                            removed_coords.append(old_coords)
+                            added_coords.append(new_coords)
+                    kept_point_ids.add(point_id)
+                    new_coordinates.append((float(existing_point.lat), float(existing_point.lon)))
                 else:
-                    # Создаем новую точку
                     point_serializer = PointSerializer(data=filtered_point_data, context=self.context)
                     point_serializer.is_valid(raise_exception=True)
-                    new_point = point_serializer.save(route=instance, order=idx)
-                    updated_point_ids.append(new_point.id)
+                    new_point = Point(route=instance, order=idx, **point_serializer.validated_data)
+                    new_point.update_geohash()
+                    points_to_create.append(new_point)
+                    added_coords.append((float(new_point.lat), float(new_point.lon)))
+                    new_coordinates.append(added_coords[-1])
+
+            removed_ids = [point_id for point_id in existing_points_map if point_id not in kept_point_ids]
+            removed_coords.extend(
+                (float(existing_points_map[point_id].lat), float(existing_points_map[point_id].lon))
+                for point_id in removed_ids
+            )
 
-            # Удаляем точки, которые больше не присутствуют в маршруте
-            points_to_delete = instance.points.exclude(id__in=updated_point_ids)
-            for point in points_to_delete:
-                # Удаляем связанные изображения
-                point.images.all().delete()
-                point.delete()
+            # Применяем разницу фиксированным числом запросов
+            with suppress_point_signals():
+                if removed_ids:
+                    # Изображения удаляются каскадно вместе с точками
+                    Point.objects.filter(route=instance, id__in=removed_ids).delete()
+                if points_to_update:
+                    Point.objects.bulk_update(
+                        points_to_update, ['name', 'description', 'lat', 'lon', 'order', 'geohash']
+                    )
+                if points_to_create:
+                    Point.objects.bulk_create(points_to_create)
+            # bulk_update/bulk_create не отправляют сигналы; удаления выше их отправили
+            route_events.schedule_changes('point', 'updated', [point.id for point in points_to_update])
+            route_events.schedule_changes('point', 'created', [point.pk for point in points_to_create if point.pk])
+            clustering.apply_point_changes(instance.user_id, added=added_coords, removed=removed_coords)
+            if removed_ids or points_to_create:
+                counters.refresh_route_counters([instance.id])
+            # Геометрия пересчитывается, только если изменилась последовательность координат
+            if new_coordinates != old_coordinates:
+                save_route_stats(instance, new_coordinates)
 
         return instance
 
+class RouteSummarySerializer(serializers.ModelSerializer):
+    """Метаданные маршрута без точек (для списка в боковой панели)"""
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = Route
+        fields = [
+            'id', 'name', 'description', 'created_at', 'updated_at', 'user',
+            'points_count', 'images_count', 'length', 'bbox',
+        ]
+        read_only_fields = fields
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
@@ -257,7 +426,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         ]
 
     def get_routes_count(self, obj):
-        return obj.user.routes.count()
+        return obj.routes_count
 
     def get_max_routes(self, obj):
         from .subscription_limits import get_max_routes  # определим ниже
@@ -0,0 +1,210 @@
+"""
+Обработчики сигналов моделей приложения map
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import clustering, counters, route_cache, route_events
+from .blobs import release_blob
+from .models import Point, PointImage, Route
+
+_local = threading.local()
+
+
+@contextmanager
+def suppress_point_signals():
+    """
+    Отключение обработчиков сигналов точек на время массовых операций
+
+    Код внутри блока сам отвечает за обновление производных данных
+    (кластеров и т.п.) одним пакетом.
+    """
+    previous = getattr(_local, 'suppressed', False)
+    _local.suppressed = True
+    try:
+        yield
+    finally:
+        _local.suppressed = previous
+
+
+def point_signals_suppressed():
+    return getattr(_local, 'suppressed', False)
+
+
+def _cached_route_owner(point):
+    """Владелец маршрута точки, если маршрут уже загружен (иначе None — найдётся по id)"""
+    if Point._meta.get_field('route').is_cached(point):
+        return point.route.user_id
+    return None
+
+
+def _route_owner(point, route_id):
+    """Владелец маршрута route_id: из загруженного маршрута точки или одним запросом"""
+    user_id = _cached_route_owner(point) if point.route_id == route_id else None
+    if user_id is None:
+        user_id = Route.objects.filter(id=route_id).values_list('user_id', flat=True).first()
+    return user_id
+
+
+# Кэш ответов маршрутов сбрасывается всегда, в т.ч. при отключённых сигналах точек:
+# массовые удаления точек тоже меняют маршрут. Обработчики точек подключены раньше
+# update_point_aggregates_on_save, который обновляет _loaded_route_id
+@receiver([post_save, post_delete], sender=Route)
+def invalidate_cached_routes_on_route_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        route_cache.schedule_invalidation(user_ids=[instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=Point)
+def invalidate_cached_routes_on_point_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id = _cached_route_owner(instance)
+    if user_id is not None:
+        route_cache.schedule_invalidation(user_ids=[user_id])
+    else:
+        route_cache.schedule_invalidation(route_ids=[instance.route_id])
+    old_route_id = getattr(instance, '_loaded_route_id', None)
+    if old_route_id is not None and old_route_id != instance.route_id:
+        route_cache.schedule_invalidation(route_ids=[old_route_id])
+
+
+@receiver([post_save, post_delete], sender=PointImage)
+def invalidate_cached_routes_on_image_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    point = instance.point if PointImage._meta.get_field('point').is_cached(instance) else None
+    user_id = _cached_route_owner(point) if point is not None else None
+    if user_id is not None:
+        route_cache.schedule_invalidation(user_ids=[user_id])
+    else:
+        route_cache.schedule_invalidation(point_ids=[instance.point_id])
+
+
+# События для потока SSE (route_events.py); массовые операции без сигналов
+# вызывают route_events.schedule_changes сами
+@receiver(post_save, sender=Route)
+def publish_route_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        route_events.schedule_changes('route', 'created' if created else 'updated', [instance.pk])
+
+
+@receiver(post_delete, sender=Route)
+def publish_route_delete(sender, instance, **kwargs):
+    route_events.schedule_changes('route', 'deleted', [instance.pk], parent_id=instance.user_id)
+
+
+@receiver(post_save, sender=Point)
+def publish_point_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    route_events.schedule_changes('point', 'created' if created else 'updated', [instance.pk])
+    old_route_id = getattr(instance, '_loaded_route_id', None)
+    if old_route_id is not None and old_route_id != instance.route_id:
+        # Из прежнего маршрута точка пропала: клиенту нужны его новые счётчики
+        route_events.schedule_changes('route', 'updated', [old_route_id])
+
+
+@receiver(post_delete, sender=Point)
+def publish_point_delete(sender, instance, **kwargs):
+    route_events.schedule_changes('point', 'deleted', [instance.pk], parent_id=instance.route_id)
+
+
+@receiver(post_save, sender=PointImage)
+def publish_image_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        route_events.schedule_changes('image', 'created' if created else 'updated', [instance.pk])
+
+
+@receiver(post_delete, sender=PointImage)
+def publish_image_delete(sender, instance, **kwargs):
+    route_events.schedule_changes('image', 'deleted', [instance.pk], parent_id=instance.point_id)
+
+
+# Кластеры (clustering.py) и счётчики маршрутов (counters.py) для одиночных
+# изменений точек; массовые операции обновляют их сами одним пакетом
+@receiver(post_save, sender=Point)
+def update_point_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw or point_signals_suppressed():
+        return
+    old_route_id = getattr(instance, '_loaded_route_id', None)
+    if created:
+        counters.adjust_route_counters(instance.route_id, points=1)
+    elif old_route_id is not None and old_route_id != instance.route_id:
+        images = instance.images.count()
+        counters.adjust_route_counters(old_route_id, points=-1, images=-images)
+        counters.adjust_route_counters(instance.route_id, points=1, images=images)
+    else:
+        counters.adjust_route_counters(instance.route_id)
+    instance._loaded_route_id = instance.route_id
+    new_coords = (float(instance.lat), float(instance.lon))
+    old_coords = getattr(instance, '_loaded_coords', None)
+    # Кластеры у каждого пользователя свои: владелец ищется, только если они меняются
+    if created:
+        clustering.apply_point_changes(_route_owner(instance, instance.route_id), added=[new_coords])
+    elif old_route_id is not None and old_route_id != instance.route_id:
+        old_owner, new_owner = _route_owner(instance, old_route_id), _route_owner(instance, instance.route_id)
+        old_coords = old_coords or new_coords
+        if old_owner != new_owner:
+            clustering.apply_point_changes(old_owner, removed=[old_coords])
+            clustering.apply_point_changes(new_owner, added=[new_coords])
+        elif old_coords != new_coords:
+            clustering.apply_point_changes(new_owner, added=[new_coords], removed=[old_coords])
+    elif old_coords is not None and old_coords != new_coords:
+        clustering.apply_point_changes(
+            _route_owner(instance, instance.route_id), added=[new_coords], removed=[old_coords],
+        )
+    instance._loaded_coords = new_coords
+
+
+@receiver(post_delete, sender=Point)
+def update_point_aggregates_on_delete(sender, instance, **kwargs):
+    if point_signals_suppressed() or clustering.is_route_being_deleted(instance.route_id):
+        return
+    clustering.apply_point_changes(_route_owner(instance, instance.route_id), removed=[(instance.lat, instance.lon)])
+    counters.adjust_route_counters(instance.route_id, points=-1)
+
+
+@receiver(pre_delete, sender=Route)
+def update_clusters_on_route_delete(sender, instance, **kwargs):
+    clustering.start_route_deletion(instance.pk, instance.user_id)
+
+
+@receiver(post_delete, sender=Route)
+def finish_route_delete(sender, instance, **kwargs):
+    clustering.finish_route_deletion(instance.pk)
+    if instance.user_id:
+        counters.adjust_routes_count(instance.user_id, -1)
+
+
+@receiver(post_save, sender=Route)
+def count_created_route(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.user_id:
+        counters.adjust_routes_count(instance.user_id, 1)
+
+
+@receiver(post_save, sender=PointImage)
+def count_saved_image(sender, instance, created, raw=False, **kwargs):
+    if raw or point_signals_suppressed():
+        return
+    # Новые копии (derivatives) тоже меняют представление маршрута
+    counters.adjust_images_count_for_point(instance.point_id, 1 if created else 0)
+
+
+@receiver(post_delete, sender=PointImage)
+def count_deleted_image(sender, instance, **kwargs):
+    if point_signals_suppressed() or clustering.is_point_being_deleted_with_route(instance.point_id):
+        return
+    counters.adjust_images_count_for_point(instance.point_id, -1)
+
+
+@receiver(post_delete, sender=PointImage)
+def release_image_blob(sender, instance, **kwargs):
+    # Ссылки на общие файлы считаются всегда, в т.ч. при массовых удалениях
+    if instance.blob_id:
+        release_blob(instance.blob_id, instance.derivatives or ())
+
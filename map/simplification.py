@@ -0,0 +1,92 @@
+"""
+Упрощение ломаной алгоритмом Висвалингама — Уайатта
+
+На каждом шаге удаляется вершина, образующая с соседями треугольник
+наименьшей площади. Площади считаются в локальной равнопромежуточной
+проекции (долгота масштабируется на cos широты), чего достаточно для
+ранжирования вершин одного трека.
+"""
+
+import heapq
+import math
+
+
+def _triangle_area(a, b, c):
+    scale = math.cos(math.radians(b[0]))
+    return abs(
+        (a[1] - c[1]) * scale * (b[0] - c[0]) - (b[1] - c[1]) * scale * (a[0] - c[0])
+    ) / 2
+
+
+def simplify_track(points, target):
+    """
+    Упрощение трека до target вершин (первая и последняя сохраняются)
+
+    Args:
+        points (list): Вершины; первые два элемента каждой — (lat, lon)
+        target (int): Сколько вершин оставить
+
+    Returns:
+        list: Оставшиеся вершины в исходном порядке
+    """
+    count = len(points)
+    if count <= target:
+        return list(points)
+    if target <= 2:
+        return [points[0], points[-1]][:max(target, 0)] if count > 1 else list(points)
+
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    removed = [False] * count
+    heap = [
+        (_triangle_area(points[i - 1], points[i], points[i + 1]), i)
+        for i in range(1, count - 1)
+    ]
+    heapq.heapify(heap)
+    current_area = {i: area for area, i in heap}
+
+    remaining = count
+    while remaining > target and heap:
+        area, index = heapq.heappop(heap)
+        if removed[index] or current_area.get(index) != area:
+            continue  # устаревшая запись кучи
+        removed[index] = True
+        remaining -= 1
+        left, right = previous[index], following[index]
+        following[left] = right
+        previous[right] = left
+        # Площадь соседей не может стать меньше удалённой (иначе порядок удаления нарушится)
+        for neighbour in (left, right):
+            if 0 < neighbour < count - 1:
+                new_area = max(area, _triangle_area(
+                    points[previous[neighbour]], points[neighbour], points[following[neighbour]],
+                ))
+                current_area[neighbour] = new_area
+                heapq.heappush(heap, (new_area, neighbour))
+
+    return [point for point, is_removed in zip(points, removed) if not is_removed]
+
+
+class StreamingSimplifier:
+    """
+    Упрощение трека, вершины которого поступают потоком
+
+    Буфер не растёт больше ``buffer_size``: при переполнении он упрощается
+    вдвое, а в конце — до целевого числа вершин. Память ограничена
+    размером буфера независимо от длины трека.
+    """
+
+    def __init__(self, target, buffer_size=4096):
+        self.target = target
+        self.buffer_size = max(buffer_size, target * 4)
+        self.points = []
+        self.source_count = 0
+
+    def add(self, point):
+        self.points.append(point)
+        self.source_count += 1
+        if len(self.points) > self.buffer_size:
+            self.points = simplify_track(self.points, self.buffer_size // 2)
+
+    def result(self):
+        return simplify_track(self.points, self.target)
@@ -0,0 +1,241 @@
+"""
+Пространственный индекс точек на основе geohash
+
+Каждая точка хранит geohash своих координат в индексируемой колонке
+``Point.geohash``. Ячейки geohash упорядочены по кривой Z-order, поэтому
+прямоугольник на карте покрывается небольшим набором диапазонов строк,
+и выборка по видимой области идёт по B-tree индексу, а не полным сканом.
+"""
+
+from django.db.models import Q
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+
+# Максимальное количество ячеек в покрытии одного прямоугольника
+MAX_COVER_CELLS = 32
+
+
+def _bits_for_precision(precision):
+    """Количество бит долготы и широты для geohash заданной длины"""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return lon_bits, lat_bits
+
+
+def _cell_index(value, low, high, bits):
+    """Номер ячейки сетки 2^bits, в которую попадает значение"""
+    cells = 1 << bits
+    index = int((value - low) / (high - low) * cells)
+    return min(max(index, 0), cells - 1)
+
+
+def _interleave(x, y, lon_bits, lat_bits):
+    """Чередование бит долготы и широты (долгота идёт первой)"""
+    code = 0
+    for i in range(lon_bits + lat_bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    return code
+
+
+def _code_to_string(code, precision):
+    """Перевод целочисленного кода в строку geohash"""
+    chars = []
+    for _ in range(precision):
+        chars.append(GEOHASH_ALPHABET[code & 31])
+        code >>= 5
+    return ''.join(reversed(chars))
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    """
+    Вычисление geohash для координат
+
+    Args:
+        lat: Широта (float, Decimal или строка)
+        lon: Долгота (float, Decimal или строка)
+        precision (int): Длина geohash
+
+    Returns:
+        str: Строка geohash
+    """
+    lon_bits, lat_bits = _bits_for_precision(precision)
+    x = _cell_index(float(lon), -180.0, 180.0, lon_bits)
+    y = _cell_index(float(lat), -90.0, 90.0, lat_bits)
+    return _code_to_string(_interleave(x, y, lon_bits, lat_bits), precision)
+
+
+def decode_geohash_bounds(geohash):
+    """
+    Границы ячейки geohash
+
+    Returns:
+        tuple: (min_lon, min_lat, max_lon, max_lat)
+    """
+    min_lon, max_lon = -180.0, 180.0
+    min_lat, max_lat = -90.0, 90.0
+    is_lon = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if is_lon:
+                mid = (min_lon + max_lon) / 2
+                if bit:
+                    min_lon = mid
+                else:
+                    max_lon = mid
+            else:
+                mid = (min_lat + max_lat) / 2
+                if bit:
+                    min_lat = mid
+                else:
+                    max_lat = mid
+            is_lon = not is_lon
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_bbox(value):
+    """
+    Разбор параметра bbox вида ``minLon,minLat,maxLon,maxLat``
+
+    Args:
+        value (str): Значение параметра запроса
+
+    Returns:
+        tuple | None: (min_lon, min_lat, max_lon, max_lat) или None, если параметр пуст
+
+    Raises:
+        ValueError: Если значение некорректно
+    """
+    if value is None or value == '':
+        return None
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError('bbox должен иметь вид minLon,minLat,maxLon,maxLat')
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in parts)
+    except ValueError:
+        raise ValueError('bbox должен содержать четыре числа')
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('Долгота в bbox должна быть в диапазоне от -180 до 180')
+    if not (-90 <= min_lat <= 90 and -90 <= max_lat <= 90):
+        raise ValueError('Широта в bbox должна быть в диапазоне от -90 до 90')
+    if min_lat > max_lat:
+        raise ValueError('minLat не может быть больше maxLat')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def split_bbox(bbox):
+    """Разбиение прямоугольника, пересекающего 180-й меридиан, на два"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_lon <= max_lon:
+        return [bbox]
+    return [(min_lon, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lon, max_lat)]
+
+
+def _cover_precision(bbox):
+    """Наибольшая точность geohash, при которой покрытие укладывается в MAX_COVER_CELLS"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    best = 1
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        lon_bits, lat_bits = _bits_for_precision(precision)
+        columns = _cell_index(max_lon, -180.0, 180.0, lon_bits) - _cell_index(min_lon, -180.0, 180.0, lon_bits) + 1
+        rows = _cell_index(max_lat, -90.0, 90.0, lat_bits) - _cell_index(min_lat, -90.0, 90.0, lat_bits) + 1
+        if columns * rows > MAX_COVER_CELLS:
+            break
+        best = precision
+    return best
+
+
+def geohash_ranges(bbox, max_precision=GEOHASH_PRECISION):
+    """
+    Покрытие прямоугольника диапазонами geohash
+
+    Соседние по Z-order ячейки склеиваются в один диапазон, поэтому
+    число условий в запросе обычно заметно меньше числа ячеек.
+
+    Args:
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat)
+        max_precision (int): Ограничение точности покрытия (для колонок с короткими geohash)
+
+    Returns:
+        list: Список пар (нижняя граница включительно, верхняя граница не включительно или None)
+    """
+    ranges = []
+    for part in split_bbox(bbox):
+        min_lon, min_lat, max_lon, max_lat = part
+        precision = min(_cover_precision(part), max_precision)
+        lon_bits, lat_bits = _bits_for_precision(precision)
+        x_range = range(_cell_index(min_lon, -180.0, 180.0, lon_bits), _cell_index(max_lon, -180.0, 180.0, lon_bits) + 1)
+        y_range = range(_cell_index(min_lat, -90.0, 90.0, lat_bits), _cell_index(max_lat, -90.0, 90.0, lat_bits) + 1)
+        codes = sorted(_interleave(x, y, lon_bits, lat_bits) for x in x_range for y in y_range)
+
+        last_code = (1 << (precision * 5)) - 1
+        start = previous = codes[0]
+        for code in codes[1:] + [None]:
+            if code is not None and code == previous + 1:
+                previous = code
+                continue
+            upper = _code_to_string(previous + 1, precision) if previous < last_code else None
+            ranges.append((_code_to_string(start, precision), upper))
+            if code is not None:
+                start = previous = code
+    return ranges
+
+
+def geohash_prefix_upper_bound(prefix):
+    """Верхняя граница (не включительно) для всех geohash, начинающихся с prefix"""
+    return prefix + '{'
+
+
+def geohash_range_condition(bbox, field_name='geohash', max_precision=GEOHASH_PRECISION):
+    """
+    Условие по индексируемой колонке geohash, покрывающее прямоугольник
+
+    Args:
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat)
+        field_name (str): Путь к колонке geohash
+        max_precision (int): Длина geohash, хранимого в колонке
+
+    Returns:
+        Q: Условие для filter()
+    """
+    condition = Q()
+    for lower, upper in geohash_ranges(bbox, max_precision):
+        cell = Q(**{f'{field_name}__gte': lower})
+        if upper is not None:
+            cell &= Q(**{f'{field_name}__lt': upper})
+        condition |= cell
+    return condition
+
+
+def filter_points_in_bbox(queryset, bbox, prefix=''):
+    """
+    Фильтрация QuerySet точек по прямоугольнику через индекс geohash
+
+    Args:
+        queryset: QuerySet модели Point (или связанной с ней модели)
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat)
+        prefix (str): Префикс пути к полям точки, например ``'points__'``
+
+    Returns:
+        QuerySet: Отфильтрованный QuerySet
+    """
+    index_condition = geohash_range_condition(bbox, f'{prefix}geohash')
+
+    exact_condition = Q()
+    for min_lon, min_lat, max_lon, max_lat in split_bbox(bbox):
+        exact_condition |= Q(**{
+            f'{prefix}lat__gte': min_lat,
+            f'{prefix}lat__lte': max_lat,
+            f'{prefix}lon__gte': min_lon,
+            f'{prefix}lon__lte': max_lon,
+        })
+
+    return queryset.filter(index_condition, exact_condition)
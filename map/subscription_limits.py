@@ -1,15 +1,19 @@
+# Лимиты тарифов: таблицы строятся один раз при импорте модуля
+MAX_ROUTES = {
+    'free': 5,
+    'premium': 10,
+    'max': 15,
+}
+
+MAX_POINTS_PER_ROUTE = {
+    'free': 20,
+    'premium': 30,
+    'max': 40,
+}
+
+
 def get_max_routes(subscription_type):
-    limits = {
-        'free': 5,
-        'premium': 10,
-        'max': 15,
-    }
-    return limits.get(subscription_type, 5)
+    return MAX_ROUTES.get(subscription_type, MAX_ROUTES['free'])
 
 def get_max_points_per_route(subscription_type):
-    limits = {
-        'free': 20,
-        'premium': 30,
-        'max': 40,
-    }
-    return limits.get(subscription_type, 20)
\ No newline at end of file
+    return MAX_POINTS_PER_ROUTE.get(subscription_type, MAX_POINTS_PER_ROUTE['free'])
@@ -1,3 +1,2036 @@
-from django.test import TestCase
+import asyncio
+import base64
+import contextvars
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
+from xml.etree import ElementTree
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image, JpegImagePlugin
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from . import (
+    clustering, counters, geometry, image_jobs, importers, instrumentation, renderers, route_cache, route_events,
+    thumbnails,
+)
+from .asgi import StreamingBodyASGIHandler, iterate_in_thread
+from .image_validation import MAX_IMAGE_SIZE_BYTES
+from .log_handlers import BackgroundQueueHandler, SamplingFilter, StructuredFormatter, dropped_records
+from .management.commands import stress_sqlite
+from .models import ImageBlob, ImageUploadJob, Route, RouteEvent, Point, PointCluster, PointImage, UserProfile
+from .polyline import DEFAULT_PRECISION, MAX_PRECISION, MIN_PRECISION, decode_polyline, encode_polyline
+from .renderers import FastJSONParser, FastJSONRenderer
+from .route_optimization import optimize_order
+from .seeding import seed_image, seed_maps
+from .subscription_limits import get_max_routes
+from .upload_handlers import ImageUploadHandler
+
+
+class BboxQueryTests(TestCase):
+    """Выборка по видимой области, в том числе через 180-й меридиан"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.east = Route.objects.create(name='Камчатка', user=self.user)
+        self.west = Route.objects.create(name='Аляска', user=self.user)
+        self.far = Route.objects.create(name='Москва', user=self.user)
+        self.points = {
+            'east': Point.objects.create(route=self.east, lat=55, lon=179.5, order=0),
+            'west': Point.objects.create(route=self.west, lat=60, lon=-179.5, order=0),
+            'far': Point.objects.create(route=self.far, lat=55.75, lon=37.6, order=0),
+        }
+
+    def point_ids(self, bbox):
+        response = self.client.get('/api/points/', {'bbox': bbox})
+        self.assertEqual(response.status_code, 200)
+        return {point['id'] for point in response.json()}
+
+    def test_bbox_across_antimeridian(self):
+        self.assertEqual(
+            self.point_ids('179,50,-179,65'), {self.points['east'].id, self.points['west'].id},
+        )
+        response = self.client.get('/api/routes/', {'bbox': '179,50,-179,65', 'view': 'summary'})
+        self.assertEqual({route['id'] for route in response.json()}, {self.east.id, self.west.id})
+
+    def test_bbox_boundaries_and_errors(self):
+        self.assertEqual(self.point_ids('37,55,38,56'), {self.points['far'].id})
+        # Широта за пределами прямоугольника отсекает точку и по ту сторону меридиана
+        self.assertEqual(self.point_ids('179,50,-179,58'), {self.points['east'].id})
+        self.assertEqual(self.point_ids('-179.6,59,-179.4,61'), {self.points['west'].id})
+        response = self.client.get('/api/points/', {'bbox': '10,60,20,50'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bbox', response.json())
+
+
+class ClusterTests(TestCase):
+    """Таблица кластеров после создания, перемещения и удаления точек"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('clusterer', 'clusterer@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def clusters(self, zoom=3):
+        response = self.client.get('/api/points/clusters/', {'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return {cluster['cell']: cluster for cluster in response.json()}
+
+    def assert_matches_rebuild(self):
+        fields = ('user_id', 'precision', 'cell', 'count')
+        incremental = set(PointCluster.objects.values_list(*fields))
+        clustering.rebuild_clusters()
+        self.assertEqual(incremental, set(PointCluster.objects.values_list(*fields)))
+
+    def create_route(self):
+        points = [{'name': f'Точка {idx}', 'lat': str(55 + idx / 100), 'lon': '37.5'} for idx in range(5)]
+        points.append({'name': 'Далеко', 'lat': '-33.9', 'lon': '151.2'})
+        response = self.client.post('/api/routes/', {'name': 'Маршрут', 'points': points}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Route.objects.get(id=response.data['id'])
+
+    def test_route_create_is_batched(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/routes/', {'points': [{'lat': '1', 'lon': '1'}]}, format='json')
+        # Число запросов зависит от числа затронутых ячеек, но не от числа точек
+        points = [{'lat': f'1.00000{idx:02d}', 'lon': '1'} for idx in range(20)]
+        with CaptureQueriesContext(connection) as large:
+            self.client.post('/api/routes/', {'points': points}, format='json')
+        self.assertEqual(len(large), len(small))
+        self.assert_matches_rebuild()
+
+    def test_counts_after_create_move_and_delete(self):
+        route = self.create_route()
+        counts = {cell: cluster['count'] for cell, cluster in self.clusters().items()}
+        self.assertEqual(sorted(counts.values()), [1, 5])
+        self.assert_matches_rebuild()
+
+        far = route.points.get(name='Далеко')
+        response = self.client.patch(f'/api/points/{far.id}/', {'lat': '55.5', 'lon': '37.6'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([cluster['count'] for cluster in self.clusters().values()], [6])
+        self.assert_matches_rebuild()
+
+        self.assertEqual(self.client.delete(f'/api/points/{far.id}/').status_code, 204)
+        with CaptureQueriesContext(connection) as queries:
+            [cluster] = self.clusters().values()
+        self.assertEqual(cluster['count'], 5)
+        # Точка была на границе: прямоугольник сжат, но чтение таблицу не меняет
+        self.assertEqual(cluster['bbox'][3], 55.04)
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'DELETE'))])
+        self.assertTrue(clustering.refresh_dirty_clusters())
+        self.assertFalse(PointCluster.objects.filter(dirty=True).exists())
+        self.assert_matches_rebuild()
+
+        self.client.delete(f'/api/routes/{route.id}/')
+        self.assertFalse(PointCluster.objects.exists())
+
+    def test_clusters_are_scoped_to_owner(self):
+        route = self.create_route()
+        other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        other_route = Route.objects.create(name='Чужой', user=other)
+        with self.captureOnCommitCallbacks(execute=True):
+            Point.objects.create(route=other_route, lat=10, lon=10, order=0)
+        self.assertEqual(sorted(cluster['count'] for cluster in self.clusters().values()), [1, 5])
+        self.assert_matches_rebuild()
+
+        # Точка перенесена в чужой маршрут: кластеры обоих владельцев обновлены
+        far = route.points.get(name='Далеко')
+        with self.captureOnCommitCallbacks(execute=True):
+            far.route = other_route
+            far.save()
+        self.assertEqual([cluster['count'] for cluster in self.clusters().values()], [5])
+        self.client.force_authenticate(other)
+        self.assertEqual(sorted(cluster['count'] for cluster in self.clusters().values()), [1, 1])
+        self.assert_matches_rebuild()
+
+
+class RoutePaginationTests(TestCase):
+    """Курсорная пагинация по (created_at, id) и краткий список ?view=summary"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('pager', 'pager@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.routes = [Route.objects.create(name=f'Маршрут {idx}', user=self.user) for idx in range(7)]
+        # Одинаковый created_at у нескольких маршрутов: порядок внутри группы задаёт id
+        same_time = self.routes[0].created_at + timedelta(minutes=1)
+        Route.objects.filter(id__in=[self.routes[idx].id for idx in (1, 4, 5, 6)]).update(created_at=same_time)
+        Route.objects.filter(id=self.routes[2].id).update(created_at=same_time - timedelta(seconds=30))
+
+    def read_pages(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(route['id'] for route in data['results'])
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    def test_pages_follow_created_at_and_id(self):
+        expected = list(Route.objects.filter(user=self.user).order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertNotEqual(expected, sorted(expected))
+        for view in ('', '&view=summary'):
+            with self.subTest(view=view):
+                self.assertEqual(self.read_pages(f'/api/routes/?page_size=2{view}'), (expected, 4))
+                # Страница ровно до последнего маршрута: следующей нет
+                self.assertEqual(self.read_pages(f'/api/routes/?page_size=7{view}'), (expected, 1))
+
+    def test_malformed_cursor(self):
+        cursors = ['not-base64!', base64.urlsafe_b64encode(b'no separator').decode(),
+                   base64.urlsafe_b64encode(b'yesterday|5').decode(), base64.urlsafe_b64encode(b'2024-01-01T00:00|x').decode()]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/routes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json()['detail'], 'Некорректный курсор')
+
+    def test_summary_counts_follow_writes(self):
+        route = self.routes[0]
+
+        def summary():
+            data = self.client.get('/api/routes/?view=summary').json()
+            row = next(row for row in data if row['id'] == route.id)
+            self.assertNotIn('points', row)
+            return row['points_count'], row['images_count']
+
+        self.assertEqual(summary(), (0, 0))
+        point_ids = [Point.objects.create(route=route, lat=55 + idx, lon=37, order=idx).id for idx in range(3)]
+        images = [PointImage.objects.create(point_id=point_ids[idx], image=f'point_images/{idx}.png') for idx in (0, 1, 1)]
+        self.assertEqual(summary(), (3, 3))
+
+        images[0].delete()
+        self.assertEqual(summary(), (3, 2))
+        self.assertEqual(self.client.delete(f'/api/points/{point_ids[1]}/').status_code, 204)
+        self.assertEqual(summary(), (2, 0))
+
+
+class ImageJobTests(TestCase):
+    """Очередь фоновой обработки изображений: захват, обработка, сбои и лимит точки"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('uploader', 'uploader@example.com', 'password')
+        route = Route.objects.create(name='Маршрут', user=self.user)
+        self.point = Point.objects.create(route=route, name='Точка', lat=55, lon=37, order=0)
+        PointImage.objects.create(point=self.point, image='point_images/old.png')
+        staging, media = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        for directory in (staging, media):
+            self.addCleanup(directory.cleanup)
+        settings = self.settings(IMAGE_JOBS_STAGING_ROOT=staging.name, MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.executor = ThreadPoolExecutor(1)
+        self.addCleanup(self.executor.shutdown)
+
+    def enqueue(self, *contents):
+        files = [SimpleUploadedFile(f'{idx}.png', content) for idx, content in enumerate(contents)]
+        job = image_jobs.enqueue_upload(self.point, files, user=self.user)
+        self.assertTrue(os.path.isdir(image_jobs.get_staging_storage().path(str(job.id))))
+        return job
+
+    def assert_staging_removed(self, job):
+        self.assertFalse(os.path.exists(image_jobs.get_staging_storage().path(str(job.id))))
+
+    def make_stale(self, job, **fields):
+        past = timezone.now() - timedelta(seconds=image_jobs.stale_timeout() + 1)
+        ImageUploadJob.objects.filter(id=job.id).update(claimed_at=past, updated_at=past, **fields)
+
+    def test_claim_and_process(self):
+        job = self.enqueue(seed_image(), b'not an image')
+        self.assertEqual(image_jobs.pending_files_count(self.point), 2)
+
+        claimed = image_jobs.claim_next_job()
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (job.id, 'processing', 1))
+        self.assertIsNotNone(claimed.claimed_at)
+        self.assertIsNone(image_jobs.claim_next_job())
+
+        image_jobs.process_job(claimed, self.executor)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_files, len(job.image_ids), len(job.errors)), ('done', 2, 1, 1))
+        self.assertEqual(self.point.images.count(), 2)
+        self.assertEqual(image_jobs.pending_files_count(self.point), 0)
+        self.assert_staging_removed(job)
+
+    def test_failed_job_releases_quota_and_staging(self):
+        job = self.enqueue(seed_image(), seed_image(), seed_image())
+        self.assertEqual(image_jobs.pending_files_count(self.point), 3)
+        image_jobs.fail_job(image_jobs.claim_next_job(), 'Обработчик упал')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.errors), ('failed', ['Обработчик упал']))
+        self.assertEqual(image_jobs.pending_files_count(self.point), 0)
+        self.assert_staging_removed(job)
+
+    def test_stale_job_is_requeued_and_resumed(self):
+        job = self.enqueue(seed_image(), seed_image())
+        image_jobs.claim_next_job()
+        self.assertEqual(image_jobs.requeue_stale_jobs(), (0, 0))
+
+        # Обработчик упал после первого файла
+        self.make_stale(job, processed_files=1)
+        self.assertEqual(image_jobs.requeue_stale_jobs(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(image_jobs.pending_files_count(self.point), 1)
+
+        claimed = image_jobs.claim_next_job()
+        self.assertEqual(claimed.attempts, 2)
+        image_jobs.process_job(claimed, self.executor)
+        self.assertEqual(self.point.images.count(), 2)
+        self.assertEqual(image_jobs.pending_files_count(self.point), 0)
+
+    def test_stale_job_fails_after_max_attempts(self):
+        job = self.enqueue(seed_image())
+        image_jobs.claim_next_job()
+        self.make_stale(job, attempts=image_jobs.max_attempts())
+        self.assertEqual(image_jobs.requeue_stale_jobs(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(image_jobs.pending_files_count(self.point), 0)
+        self.assert_staging_removed(job)
+
+    def test_exif_rotation_keeps_jpeg_quality(self):
+        source = Image.new('RGB', (40, 20), (200, 40, 40))
+        exif = Image.Exif()
+        exif[image_jobs.EXIF_ORIENTATION_TAG] = 6
+        buffer = io.BytesIO()
+        source.save(buffer, 'JPEG', quality=95, subsampling=0, exif=exif)
+        with Image.open(io.BytesIO(buffer.getvalue())) as original:
+            quantization = original.quantization
+
+        path = image_jobs.get_staging_storage().save('exif/photo.jpg', io.BytesIO(buffer.getvalue()))
+        result = image_jobs.prepare_image({'staging_path': path, 'original_name': 'photo.jpg', 'point_id': self.point.id})
+        with default_storage.open(result['name']) as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(image.quantization, quantization)
+            self.assertEqual(JpegImagePlugin.get_sampling(image), 0)
+
+    def test_job_list_loads_images_in_one_query(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        def create_jobs(count):
+            for _ in range(count):
+                images = [PointImage.objects.create(point=self.point, image=f'point_images/{idx}.png') for idx in range(2)]
+                ImageUploadJob.objects.create(
+                    point=self.point, user=self.user, total_files=2, processed_files=2, status='done',
+                    image_ids=[images[1].id, images[0].id],
+                )
+
+        create_jobs(1)
+        with CaptureQueriesContext(connection) as single:
+            client.get('/api/image-jobs/')
+        create_jobs(4)
+        with CaptureQueriesContext(connection) as several:
+            response = client.get('/api/image-jobs/')
+        self.assertEqual(len(several), len(single))
+        image_ids = {str(job_id): ids for job_id, ids in ImageUploadJob.objects.values_list('id', 'image_ids')}
+        for job in response.json():
+            # Изображения идут в порядке загрузки, а не по id
+            self.assertEqual([image['id'] for image in job['images']], image_ids[job['id']])
+
+        detail = client.get(f"/api/image-jobs/{job['id']}/").json()
+        self.assertEqual(detail['images'], job['images'])
+
+
+class ImageBlobTests(TestCase):
+    """Контентно-адресуемое хранение: общие файлы и подсчёт ссылок"""
+
+    def setUp(self):
+        route = Route.objects.create(name='Маршрут')
+        self.points = [Point.objects.create(route=route, lat=55, lon=37 + idx, order=idx) for idx in range(2)]
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = self.settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = seed_image()
+
+    def add_image(self, point, name='photo.png'):
+        image = PointImage(point=point, image=SimpleUploadedFile(name, self.content))
+        image.save()
+        return image
+
+    def delete_image(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+
+    def test_content_addressed_mode_is_opt_in(self):
+        image = self.add_image(self.points[0])
+        self.assertIsNone(image.blob)
+        self.assertTrue(image.image.name.startswith(f'point_images/{self.points[0].id}/'))
+
+    @override_settings(POINT_IMAGE_CONTENT_ADDRESSED=True)
+    def test_shared_blob_is_deleted_with_last_reference(self):
+        first = self.add_image(self.points[0])
+        second = self.add_image(self.points[1], 'copy.png')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.image.name, second.image.name)
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+
+        self.delete_image(first)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(second.image.name))
+
+        self.delete_image(second)
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(default_storage.exists(second.image.name))
+
+    def test_dedupe_moves_existing_files_to_blobs(self):
+        images = [self.add_image(point) for point in self.points]
+        old_names = [image.image.name for image in images]
+        call_command('dedupe_point_images', stdout=io.StringIO())
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual({image.image.name for image in PointImage.objects.all()}, {blob.name})
+        self.assertFalse(any(default_storage.exists(name) for name in old_names))
+
+        self.delete_image(PointImage.objects.first())
+        self.assertTrue(default_storage.exists(blob.name))
+
+    @override_settings(ROUTE_EVENTS_BACKEND='database')
+    def test_dedupe_changes_route_validators(self):
+        user = User.objects.create_user('deduper', 'deduper@example.com', 'password')
+        Route.objects.update(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            images = [self.add_image(point) for point in self.points]
+        route_id = self.points[0].route_id
+        client = APIClient()
+        client.force_authenticate(user)
+        etag = client.get(f'/api/routes/{route_id}/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_point_images', stdout=io.StringIO())
+        response = client.get(f'/api/routes/{route_id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        blob = ImageBlob.objects.get()
+        urls = [image['image'] for point in response.json()['points'] for image in point['images']]
+        self.assertEqual(len(urls), 2)
+        self.assertTrue(all(url.endswith(blob.name) for url in urls))
+        self.assertEqual(
+            sorted(event['data']['id'] for event in RouteEvent.objects.filter(event__type='image.updated')
+                   .values_list('event', flat=True)),
+            sorted(image.id for image in images),
+        )
+
+
+class ThumbnailTests(TestCase):
+    """Уменьшенные копии изображений: ширины, форматы, thumbnail/srcset и пакетная генерация"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('thumbnailer', 'thumbnailer@example.com', 'password')
+        self.route = Route.objects.create(name='Маршрут', user=self.user)
+        self.point = Point.objects.create(route=self.route, lat=55, lon=37, order=0)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = self.settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    @staticmethod
+    def png(width, height, mode='RGB', color=(70, 130, 180)):
+        buffer = io.BytesIO()
+        Image.new(mode, (width, height), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def add_image(self, content):
+        image = PointImage(point=self.point, image=SimpleUploadedFile('photo.png', content))
+        image.save()
+        return image
+
+    def test_widths_and_formats(self):
+        rendered = thumbnails.render_derivatives(self.png(800, 400))
+        self.assertEqual(
+            [(width, fmt) for width, fmt, _ in rendered],
+            [(width, fmt) for width in thumbnails.DERIVATIVE_WIDTHS for fmt in ('webp', 'jpeg')],
+        )
+        for width, fmt, content in rendered:
+            with Image.open(io.BytesIO(content)) as image:
+                self.assertEqual(image.format, thumbnails.DERIVATIVE_FORMATS[fmt]['format'])
+                self.assertEqual(image.size, (width, width // 2))
+
+        # Меньше самой узкой копии: одна копия исходной ширины, без увеличения
+        small = thumbnails.render_derivatives(self.png(100, 50))
+        self.assertEqual([(width, fmt) for width, fmt, _ in small], [(100, 'webp'), (100, 'jpeg')])
+
+    def test_transparent_image_gets_white_jpeg_background(self):
+        rendered = thumbnails.render_derivatives(self.png(200, 200, 'RGBA', (0, 0, 0, 0)))
+        jpeg = next(content for _, fmt, content in rendered if fmt == 'jpeg')
+        with Image.open(io.BytesIO(jpeg)) as image:
+            self.assertEqual(image.mode, 'RGB')
+            self.assertEqual(image.getpixel((100, 100)), (255, 255, 255))
+
+    def test_serializer_thumbnail_and_srcset(self):
+        image = self.add_image(self.png(400, 300))
+        data = self.api.get(f'/api/points/{self.point.id}/').json()['images'][0]
+        # Копий ещё нет: thumbnail — сам исходник
+        self.assertEqual((data['thumbnail'], data['srcset']), (data['image'], {}))
+
+        derivatives = thumbnails.generate_derivatives(image)
+        self.assertEqual(sorted({d['width'] for d in derivatives}), [160, 320])
+        data = self.api.get(f'/api/points/{self.point.id}/').json()['images'][0]
+        smallest_jpeg = thumbnails.derivative_name(image.image.name, 160, 'jpeg')
+        self.assertTrue(data['thumbnail'].endswith(smallest_jpeg))
+        self.assertEqual(set(data['srcset']), {'webp', 'jpeg'})
+        self.assertEqual(
+            [entry.rsplit(' ', 1)[1] for entry in data['srcset']['webp'].split(', ')], ['160w', '320w'],
+        )
+
+    @override_settings(ROUTE_EVENTS_BACKEND='database')
+    def test_command_is_idempotent_and_changes_validators(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = self.add_image(self.png(400, 300))
+        etag = self.api.get(f'/api/routes/{self.route.id}/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generate_thumbnails', workers=1, stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual(len(image.derivatives), 4)
+        self.assertTrue(all(default_storage.exists(d['name']) for d in image.derivatives))
+        response = self.api.get(f'/api/routes/{self.route.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['points'][0]['images'][0]['srcset'])
+        self.assertTrue(RouteEvent.objects.filter(event__type='image.updated', event__data__id=image.id).exists())
+
+        # Повторный запуск ничего не делает, а с --force перезаписывает те же файлы
+        etag = response['ETag']
+        out = io.StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Нет изображений для обработки', out.getvalue())
+        self.assertEqual(self.api.get(f'/api/routes/{self.route.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        call_command('generate_thumbnails', workers=1, force=True, stdout=io.StringIO())
+        derivatives = image.derivatives
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives, derivatives)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(default_storage.path(derivatives[0]['name'])))), len(derivatives),
+        )
+
+
+class UploadValidationTests(TestCase):
+    """Потоковая проверка загрузок (ImageUploadHandler): отказ до буферизации, без следов на диске"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('streamer', 'streamer@example.com', 'password')
+        route = Route.objects.create(name='Маршрут', user=self.user)
+        self.point = Point.objects.create(route=route, name='Точка', lat=55, lon=37, order=0)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        staging, media = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        for directory in (staging, media):
+            self.addCleanup(directory.cleanup)
+        self.directories = staging.name, media.name
+        settings = self.settings(IMAGE_JOBS_STAGING_ROOT=staging.name, MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @staticmethod
+    def png_bomb(width, height):
+        """PNG с заявленными в IHDR размерами и крошечным IDAT вместо пикселей"""
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+        return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', zlib.compress(b'\0' * 64))
+
+    def assert_rejected(self, files, message, query=''):
+        response = self.api.post(
+            f'/api/points/{self.point.id}/upload_image/{query}',
+            {'images': [SimpleUploadedFile(name, content) for name, content in files]},
+        )
+        self.assertEqual(response.status_code, 400)
+        details = response.json()['details']
+        self.assertTrue(any(message in detail for detail in details), details)
+        self.assertFalse(self.point.images.exists())
+        self.assertFalse(ImageUploadJob.objects.exists())
+        for directory in self.directories:
+            self.assertEqual([files for _, _, files in os.walk(directory) if files], [])
+
+    def test_unknown_signature(self):
+        for query in ('', '?async=1'):
+            with self.subTest(query=query):
+                self.assert_rejected([('photo.png', b'GIF? no, plain text ' * 10)], 'не является изображением', query)
+
+    def test_file_over_size_limit_is_aborted_while_streaming(self):
+        content = seed_image() + b'\0' * (2 * MAX_IMAGE_SIZE_BYTES)
+        received = []
+        original = ImageUploadHandler.receive_data_chunk
+
+        def receive_data_chunk(handler, raw_data, start):
+            received.append(len(raw_data))
+            return original(handler, raw_data, start)
+
+        with mock.patch.object(ImageUploadHandler, 'receive_data_chunk', receive_data_chunk):
+            self.assert_rejected([('photo.png', content)], 'слишком большой')
+        # Чтение файла остановлено на первом блоке сверх лимита
+        self.assertLessEqual(sum(received), MAX_IMAGE_SIZE_BYTES + max(received))
+
+    def test_decompression_bomb_header(self):
+        # Больше лимита приложения и больше порога DecompressionBombError Pillow
+        for width in (10_000, 100_000):
+            with self.subTest(width=width):
+                self.assert_rejected([('bomb.png', self.png_bomb(width, width))], 'разрешение')
+
+    def test_request_over_total_limit(self):
+        # Каждый файл меньше лимита, но вместе больше, чем допустимо для MAX_IMAGES_PER_POINT файлов
+        chunk = seed_image() + b'\0' * (MAX_IMAGE_SIZE_BYTES - 1024)
+        files = [(f'{idx}.png', chunk) for idx in range(image_jobs.MAX_IMAGES_PER_POINT + 1)]
+        self.assert_rejected(files, 'Размер запроса')
+
+
+class CounterTests(TestCase):
+    """Денормализованные счётчики маршрутов, точек и изображений"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('counter', 'counter@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_route(self, points_count):
+        points = [{'lat': '55', 'lon': str(37 + idx / 10)} for idx in range(points_count)]
+        response = self.client.post('/api/routes/', {'name': 'Маршрут', 'points': points}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Route.objects.get(id=response.data['id'])
+
+    def assert_counters(self, route, points, images):
+        route.refresh_from_db()
+        self.assertEqual((route.points_count, route.images_count), (points, images))
+
+    def assert_match_recount(self):
+        stored = (
+            set(Route.objects.values_list('id', 'points_count', 'images_count')),
+            set(UserProfile.objects.values_list('user_id', 'routes_count')),
+        )
+        call_command('recount_counters', stdout=io.StringIO())
+        self.assertEqual(stored, (
+            set(Route.objects.values_list('id', 'points_count', 'images_count')),
+            set(UserProfile.objects.values_list('user_id', 'routes_count')),
+        ))
+
+    def test_counters_after_create_move_and_delete(self):
+        first, second = self.create_route(3), self.create_route(2)
+        self.assertEqual(counters.current_routes_count(self.user.id), 2)
+        self.assert_counters(first, 3, 0)
+
+        point = first.points.first()
+        PointImage.objects.create(point=point, image='point_images/a.png')
+        PointImage.objects.create(point=point, image='point_images/b.png')
+        self.assert_counters(first, 3, 2)
+
+        # Перенос точки с изображениями в другой маршрут
+        point.route = second
+        point.save()
+        self.assert_counters(first, 2, 0)
+        self.assert_counters(second, 3, 2)
+
+        self.assertEqual(self.client.delete(f'/api/points/{point.id}/').status_code, 204)
+        self.assert_counters(second, 2, 0)
+        self.assert_match_recount()
+
+        self.assertEqual(self.client.delete(f'/api/routes/{first.id}/').status_code, 204)
+        self.assertEqual(counters.current_routes_count(self.user.id), 1)
+        self.assert_match_recount()
+
+    def test_route_limit_uses_counter(self):
+        for _ in range(get_max_routes('free')):
+            self.create_route(1)
+        response = self.client.post('/api/routes/', {'name': 'Лишний', 'points': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detail', response.json())
+        self.assertEqual(Route.objects.filter(user=self.user).count(), get_max_routes('free'))
+
+
+class RouteUpdateQueryCountTests(TestCase):
+    """Количество запросов при редактировании маршрута не зависит от числа точек"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('traveller', 'traveller@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_route(self, points_count):
+        route = Route.objects.create(name='Маршрут', user=self.user)
+        for idx in range(points_count):
+            point = Point(route=route, name=f'Точка {idx}', lat=55 + idx / 100, lon=37 + idx / 100, order=idx)
+            point.save()
+            PointImage.objects.create(point=point, image=f'point_images/{point.id}/photo.png')
+        return route
+
+    def edit_payload(self, route):
+        points = list(route.points.order_by('order').values('id', 'name', 'description', 'lat', 'lon'))
+        # Удаляем первую точку, сдвигаем и переименовываем остальные, добавляем две новые
+        edited = [
+            {**point, 'name': f'{point["name"]} (изм.)', 'lat': str(point['lat'] + 1)}
+            for point in points[1:]
+        ]
+        edited += [
+            {'name': 'Новая 1', 'lat': '10.5', 'lon': '20.5'},
+            {'name': 'Новая 2', 'lat': '11.5', 'lon': '21.5'},
+        ]
+        return {'name': route.name, 'description': 'Обновлено', 'points': edited}
+
+    def count_update_queries(self, points_count):
+        route = self.create_route(points_count)
+        payload = self.edit_payload(route)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(f'/api/routes/{route.id}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data['points']), points_count + 1)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        small = self.count_update_queries(3)
+        large = self.count_update_queries(19)
+        self.assertEqual(small, large)
+
+    def test_diff_is_applied(self):
+        route = self.create_route(4)
+        first_point_id = route.points.order_by('order').first().id
+        response = self.client.put(f'/api/routes/{route.id}/', self.edit_payload(route), format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        points = list(route.points.order_by('order'))
+        self.assertEqual([point.order for point in points], list(range(5)))
+        self.assertNotIn(first_point_id, [point.id for point in points])
+        self.assertEqual(points[0].name, 'Точка 1 (изм.)')
+        self.assertEqual(points[-1].name, 'Новая 2')
+        self.assertFalse(PointImage.objects.filter(point_id=first_point_id).exists())
+        self.assertTrue(all(point.geohash for point in points))
+
+
+class ConditionalGetTests(TestCase):
+    """ETag и Last-Modified маршрутов: 304 без сериализации, новые валидаторы после изменений"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('revalidator', 'revalidator@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.route = Route.objects.create(name='Маршрут', user=self.user)
+        self.point = Point.objects.create(route=self.route, lat=55, lon=37, order=0)
+
+    def test_list_and_retrieve_revalidate(self):
+        for url in ('/api/routes/', f'/api/routes/{self.route.id}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertIn('private', response['Cache-Control'])
+                etag = response['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertFalse([query for query in queries if 'map_point' in query['sql']])
+                modified_since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(modified_since.status_code, 304)
+
+    def test_validators_change_after_writes(self):
+        etags = [self.client.get('/api/routes/')['ETag']]
+        self.client.patch(f'/api/points/{self.point.id}/', {'name': 'Новое имя'}, format='json')
+        etags.append(self.client.get('/api/routes/')['ETag'])
+        PointImage.objects.create(point=self.point, image='point_images/photo.png')
+        etags.append(self.client.get('/api/routes/')['ETag'])
+        self.client.post('/api/routes/', {'name': 'Второй', 'points': []}, format='json')
+        response = self.client.get('/api/routes/', HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, 200)
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+        # Валидаторы зависят от пользователя и параметров запроса
+        self.assertNotEqual(self.client.get('/api/routes/?view=summary')['ETag'], etags[-1])
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', 'other@example.com', 'password'))
+        self.assertEqual(other.get('/api/routes/', HTTP_IF_NONE_MATCH=etags[-1]).status_code, 200)
+        missing = self.client.get('/api/routes/999999/')
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing)
+
+
+class ExportTests(TestCase):
+    """Потоковая выгрузка маршрутов в GeoJSON, GPX и KML"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', 'exporter@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.route = Route.objects.create(name='Маршрут <&>', description='Описание', user=self.user)
+        for idx, (lat, lon) in enumerate([(55.75, 37.61), (55.76, 37.62), (55.77, 37.6)]):
+            Point.objects.create(route=self.route, name=f'Точка {idx}', lat=lat, lon=lon, order=idx)
+        Route.objects.create(name='Пустой', user=self.user)
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        Point.objects.create(route=Route.objects.create(name='Чужой', user=other), lat=1, lon=1, order=0)
+
+    def export(self, query):
+        response = self.client.get(f'/api/routes/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_geojson(self):
+        response, body = self.export('fmt=geojson')
+        self.assertEqual(response['Content-Type'], 'application/geo+json; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="routes.geojson"')
+        features = json.loads(body)['features']
+        routes = [feature for feature in features if feature['properties'].get('points_count') is not None]
+        self.assertEqual([route['properties']['name'] for route in routes], ['Маршрут <&>', 'Пустой'])
+        self.assertEqual(routes[0]['geometry']['coordinates'][0], [37.61, 55.75])
+        self.assertIsNone(routes[1]['geometry'])
+        points = [feature for feature in features if feature['geometry'] and feature['geometry']['type'] == 'Point']
+        self.assertEqual([point['properties']['order'] for point in points], [0, 1, 2])
+
+        _, body = self.export(f'fmt=geojson&route={self.route.id}&geometry=polyline&precision=5')
+        [feature] = json.loads(body)['features']
+        coordinates = [(55.75, 37.61), (55.76, 37.62), (55.77, 37.6)]
+        self.assertEqual(feature['properties']['polyline'], encode_polyline(coordinates, 5))
+
+    def test_gpx_and_kml(self):
+        response, body = self.export('fmt=gpx')
+        self.assertEqual(response['Content-Type'], 'application/gpx+xml; charset=utf-8')
+        gpx = ElementTree.fromstring(body)
+        namespace = {'gpx': 'http://www.topografix.com/GPX/1/1'}
+        [route] = [rte for rte in gpx.findall('gpx:rte', namespace) if rte.findall('gpx:rtept', namespace)]
+        self.assertEqual(route.find('gpx:name', namespace).text, 'Маршрут <&>')
+        self.assertEqual(
+            [(point.get('lat'), point.get('lon')) for point in route.findall('gpx:rtept', namespace)],
+            [('55.75', '37.61'), ('55.76', '37.62'), ('55.77', '37.6')],
+        )
+
+        response, body = self.export(f'fmt=kml&route={self.route.id}')
+        self.assertEqual(response['Content-Type'], 'application/vnd.google-earth.kml+xml; charset=utf-8')
+        kml = ElementTree.fromstring(body)
+        namespace = {'kml': 'http://www.opengis.net/kml/2.2'}
+        line = kml.find('.//kml:LineString/kml:coordinates', namespace).text
+        self.assertEqual(line, '37.61,55.75 37.62,55.76 37.6,55.77')
+        self.assertEqual(len(kml.findall('.//kml:Point', namespace)), 3)
+
+    async def test_asgi_export_streams_asynchronously(self):
+        expected = await sync_to_async(lambda: self.export('fmt=gpx')[1])()
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get('/api/routes/export/?fmt=gpx')
+        self.assertEqual(response.status_code, 200)
+        # Синхронный итератор Django под ASGI собрал бы целиком через sync_to_async(list)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]).decode(), expected)
+
+    async def test_iterate_in_thread_pulls_batches(self):
+        produced = []
+
+        def chunks():
+            for idx in range(10):
+                produced.append(idx)
+                yield 'x' * 10
+
+        batches = iterate_in_thread(chunks(), batch_size=25)
+        self.assertEqual(await anext(batches), 'x' * 30)
+        # Генератор прочитан только на одну пачку вперёд
+        self.assertEqual(produced, [0, 1, 2])
+        self.assertEqual([batch async for batch in batches], ['x' * 30, 'x' * 30, 'x' * 10])
+
+    def test_invalid_parameters(self):
+        for query in ('fmt=shp', 'fmt=gpx&geometry=polyline', 'route=abc'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/routes/export/?{query}').status_code, 400)
+
+
+class ImportTests(TestCase):
+    """Импорт треков из GPX, GeoJSON и CSV"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('importer', 'importer@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, expected_status=201):
+        response = self.client.post(
+            '/api/routes/import/', {'file': SimpleUploadedFile(name, content.encode())}, format='multipart',
+        )
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.json()
+
+    def route_points(self, route_id):
+        return [
+            (float(lat), float(lon), name)
+            for lat, lon, name in Point.objects.filter(route_id=route_id).order_by('order').values_list('lat', 'lon', 'name')
+        ]
+
+    def test_gpx(self):
+        content = """<?xml version="1.0"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <wpt lat="55.7" lon="37.5"><name>Стоянка</name></wpt>
+  <trk><name>Трек</name><desc>Описание</desc>
+    <trkseg><trkpt lat="55.75" lon="37.61"/><trkpt lat="55.76" lon="37.62"/></trkseg>
+    <trkseg><trkpt lat="55.77" lon="37.6"><name>Финиш</name></trkpt></trkseg>
+  </trk>
+</gpx>"""
+        routes = self.upload('track.gpx', content)['routes']
+        self.assertEqual([(r['name'], r['points_count']) for r in routes], [('Трек', 3), ('Точки', 1)])
+        track = Route.objects.get(id=routes[0]['id'])
+        self.assertEqual(track.description, 'Описание')
+        self.assertEqual(
+            self.route_points(track.id),
+            [(55.75, 37.61, None), (55.76, 37.62, None), (55.77, 37.6, 'Финиш')],
+        )
+        self.assertEqual(self.route_points(routes[1]['id']), [(55.7, 37.5, 'Стоянка')])
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.routes_count, 2)
+
+    def test_geojson(self):
+        content = json.dumps({
+            'type': 'FeatureCollection',
+            # Ключ features внутри строк и вложенных объектов не должен сбивать разбор
+            'name': '"features": [',
+            'metadata': {'features': [{'type': 'Feature'}]},
+            'features': [
+                {'type': 'Feature', 'properties': {'name': 'Линия', 'note': '"features": ['},
+                 'geometry': {'coordinates': [[37.61, 55.75], [37.62, 55.76, 150]], 'type': 'LineString'}},
+                {'type': 'Feature', 'properties': {'name': 'Мульти'},
+                 'geometry': {'type': 'MultiLineString', 'coordinates': [[[30.1, 50.1], [30.2, 50.2]], [[30.3, 50.3]]]}},
+                {'type': 'Feature', 'properties': {'name': 'Точка'}, 'geometry': {'type': 'Point', 'coordinates': [37.5, 55.7]}},
+                {'type': 'Feature', 'properties': None, 'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [0, 0]]]}},
+            ],
+        })
+        routes = self.upload('tracks.geojson', content)['routes']
+        self.assertEqual([(r['name'], r['points_count']) for r in routes], [('Линия', 2), ('Мульти', 3), ('Точки', 1)])
+        self.assertEqual(self.route_points(routes[0]['id']), [(55.75, 37.61, None), (55.76, 37.62, None)])
+        self.assertEqual([p[:2] for p in self.route_points(routes[1]['id'])], [(50.1, 30.1), (50.2, 30.2), (50.3, 30.3)])
+        self.assertEqual(self.route_points(routes[2]['id']), [(55.7, 37.5, 'Точка')])
+
+    def test_csv(self):
+        content = 'route,lat,lon,name\nА,55.75,37.61,Старт\nА,55.76,37.62,\n\nБ,50.1,30.1,\n'
+        routes = self.upload('points.csv', content)['routes']
+        self.assertEqual([(r['name'], r['points_count']) for r in routes], [('А', 2), ('Б', 1)])
+        self.assertEqual(self.route_points(routes[0]['id']), [(55.75, 37.61, 'Старт'), (55.76, 37.62, None)])
+
+    def test_invalid_files(self):
+        cases = [
+            ('bad.gpx', '<gpx><trk><trkpt lat="95" lon="0"/></trk></gpx>'),
+            ('bad.geojson', '{"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[1, '),
+            ('bad.geojson', '{"features": [{"geometry": {"type": "LineString", "coordinates": [["x", 1]]}}]}'),
+            ('empty.geojson', '{"type": "FeatureCollection", "features": []}'),
+            ('bad.csv', 'x,y\n1,2\n'),
+            ('track.shp', 'data'),
+        ]
+        for name, content in cases:
+            with self.subTest(name=name, content=content[:40]):
+                self.assertIn('file', self.upload(name, content, expected_status=400))
+        self.assertFalse(Route.objects.exists())
+
+    def large_linestring(self, count):
+        coordinates = [[37 + i * 1e-5, 55 + (i % 7) * 1e-4] for i in range(count)]
+        return json.dumps({'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'name': 'Трек'}, 'geometry': {'type': 'LineString', 'coordinates': coordinates}},
+        ]}).encode()
+
+    def test_large_linestring_is_streamed(self):
+        """Вершины одной линии не собираются в память и не разбираются повторно"""
+        data = self.large_linestring(100_000)
+        started = time.perf_counter()
+        [(name, _, track)] = importers.iter_tracks(io.BytesIO(data), 'geojson', 20)
+        self.assertLess(time.perf_counter() - started, 15)
+        self.assertEqual((name, track.source_count, len(track.result())), ('Трек', 100_000, 20))
+
+        data = self.large_linestring(40_000)
+        tracemalloc.start()
+        try:
+            [(_, _, track)] = importers.iter_tracks(io.BytesIO(data), 'geojson', 20)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(track.source_count, 40_000)
+        # Файл занимает 1,2 МБ, разобранный целиком объект — в несколько раз больше
+        self.assertLess(peak, 3 * 1024 * 1024)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Эталонное расстояние по формуле гаверсинусов на чистом math"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * geometry.EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class RouteStatsTests(TestCase):
+    """Длина, отрезки и bbox маршрутов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats', 'stats@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_route_stats_values(self):
+        stats = geometry.route_stats([(0, 0), (1, 0), (1, 1), (0, 1)])
+        self.assertEqual(stats['bbox'], [0.0, 0.0, 1.0, 1.0])
+        # Градус меридиана — 1/360 окружности Земли
+        meridian_degree = 2 * math.pi * geometry.EARTH_RADIUS_M / 360
+        self.assertAlmostEqual(stats['legs'][0]['distance'], meridian_degree, places=1)
+        self.assertEqual([round(leg['bearing']) for leg in stats['legs']], [0, 90, 180])
+        for leg, (start, end) in zip(stats['legs'], [((0, 0), (1, 0)), ((1, 0), (1, 1)), ((1, 1), (0, 1))]):
+            self.assertAlmostEqual(leg['distance'], haversine(*start, *end), places=1)
+        self.assertAlmostEqual(stats['length'], sum(leg['distance'] for leg in stats['legs']), places=1)
+
+        self.assertEqual(geometry.route_stats([]), {'length': 0.0, 'legs': [], 'bbox': None})
+        self.assertEqual(geometry.route_stats([(55.75, 37.61)]), {'length': 0.0, 'legs': [], 'bbox': [37.61, 55.75, 37.61, 55.75]})
+
+    def test_batch_matches_single_routes(self):
+        routes = {7: [(55.75, 37.61), (55.76, 37.62), (55.77, 37.6)], 3: [(-33.9, 151.2)], 5: [(10, 20), (11, 21)]}
+        route_ids = [route_id for route_id, coordinates in routes.items() for _ in coordinates]
+        lats = [lat for coordinates in routes.values() for lat, _ in coordinates]
+        lons = [lon for coordinates in routes.values() for _, lon in coordinates]
+        # Отрезки между соседними маршрутами в пачке не считаются
+        self.assertEqual(
+            geometry.route_stats_batch(route_ids, lats, lons),
+            {route_id: geometry.route_stats(coordinates) for route_id, coordinates in routes.items()},
+        )
+
+    def test_stats_follow_point_changes(self):
+        points = [{'lat': '55.75', 'lon': '37.61'}, {'lat': '55.76', 'lon': '37.62'}]
+        response = self.client.post('/api/routes/', {'name': 'Маршрут', 'points': points}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['bbox'], [37.61, 55.75, 37.62, 55.76])
+        self.assertAlmostEqual(response.data['length'], haversine(55.75, 37.61, 55.76, 37.62), places=1)
+        route = Route.objects.get(id=response.data['id'])
+
+        point = route.points.order_by('order').last()
+        response = self.client.patch(f'/api/points/{point.id}/', {'lat': '55.8'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        route.refresh_from_db()
+        self.assertEqual(route.bbox, [37.61, 55.75, 37.62, 55.8])
+        self.assertAlmostEqual(route.length, haversine(55.75, 37.61, 55.8, 37.62), places=1)
+
+        self.assertEqual(self.client.delete(f'/api/points/{point.id}/').status_code, 204)
+        route.refresh_from_db()
+        self.assertEqual((route.length, route.legs, route.bbox), (0.0, [], [37.61, 55.75, 37.61, 55.75]))
+
+        # Пересчёт командой совпадает с сохранённым при изменениях
+        Route.objects.filter(id=route.id).update(length=0, legs=[], bbox=None)
+        call_command('recompute_route_stats', stdout=io.StringIO())
+        route.refresh_from_db()
+        self.assertEqual(route.bbox, [37.61, 55.75, 37.61, 55.75])
+
+
+class RouteOptimizationTests(TestCase):
+    """Инварианты оптимизации порядка точек"""
+
+    def path_length(self, lats, lons, order):
+        return sum(haversine(lats[a], lons[a], lats[b], lons[b]) for a, b in zip(order, order[1:]))
+
+    def test_optimize_order_invariants(self):
+        random = np.random.default_rng(12)
+        for count in (1, 2, 3, 5, 12, 40):
+            lats = (55 + random.random(count)).tolist()
+            lons = (37 + random.random(count)).tolist()
+            for pin_start, pin_end in ((True, False), (False, False), (True, True), (False, True)):
+                with self.subTest(count=count, pin_start=pin_start, pin_end=pin_end):
+                    order, before, after = optimize_order(lats, lons, pin_start=pin_start, pin_end=pin_end)
+                    self.assertEqual(sorted(order), list(range(count)))
+                    if pin_start:
+                        self.assertEqual(order[0], 0)
+                    if pin_end:
+                        self.assertEqual(order[-1], count - 1)
+                    self.assertLessEqual(after, before)
+                    self.assertAlmostEqual(before, self.path_length(lats, lons, range(count)), places=3)
+                    self.assertAlmostEqual(after, self.path_length(lats, lons, order), places=3)
+
+    def test_optimal_order_is_kept_and_zigzag_is_fixed(self):
+        lats = [55.0, 55.1, 55.2, 55.3]
+        lons = [37.0] * 4
+        self.assertEqual(optimize_order(lats, lons)[0], [0, 1, 2, 3])
+
+        order, before, after = optimize_order([55.0, 55.3, 55.1, 55.2], lons)
+        self.assertEqual(order, [0, 2, 3, 1])
+        self.assertLess(after, before)
+
+    def test_endpoint_saves_order_and_stats(self):
+        user = User.objects.create_user('optimizer', 'optimizer@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(user)
+        route = Route.objects.create(name='Маршрут', user=user)
+        for order, lat in enumerate([55.0, 55.3, 55.1, 55.2, 55.05]):
+            Point.objects.create(route=route, lat=lat, lon=37, order=order)
+
+        response = client.post(f'/api/routes/{route.id}/optimize/', {'pin_end': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(response.data['length_after'], response.data['length_before'])
+        stored = list(route.points.order_by('order').values_list('order', 'lat'))
+        self.assertEqual([order for order, _ in stored], [0, 1, 2, 3, 4])
+        self.assertEqual([float(lat) for _, lat in stored], [55.0, 55.1, 55.2, 55.3, 55.05])
+        route.refresh_from_db()
+        self.assertAlmostEqual(route.length, response.data['length_after'], places=1)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('stranger', 'stranger@example.com', 'password'))
+        self.assertEqual(other.post(f'/api/routes/{route.id}/optimize/').status_code, 404)
+
+
+class PolylineTests(TestCase):
+    """Кодирование и декодирование Encoded Polyline"""
+
+    def test_reference_example(self):
+        coordinates = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        encoded = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+        self.assertEqual(encode_polyline(coordinates), encoded)
+        self.assertEqual(decode_polyline(encoded), coordinates)
+
+    def test_round_trip(self):
+        random = np.random.default_rng(15)
+        coordinates = list(zip((random.random(200) * 180 - 90).tolist(), (random.random(200) * 360 - 180).tolist()))
+        for precision in (MIN_PRECISION, DEFAULT_PRECISION, 6, MAX_PRECISION):
+            with self.subTest(precision=precision):
+                decoded = decode_polyline(encode_polyline(coordinates, precision), precision)
+                self.assertEqual(len(decoded), len(coordinates))
+                for (lat, lon), (decoded_lat, decoded_lon) in zip(coordinates, decoded):
+                    self.assertLessEqual(abs(lat - decoded_lat), 0.5 / 10 ** precision + 1e-12)
+                    self.assertLessEqual(abs(lon - decoded_lon), 0.5 / 10 ** precision + 1e-12)
+        self.assertEqual(decode_polyline(encode_polyline([])), [])
+
+    def test_corrupted_strings(self):
+        for encoded in ('_p~iF~ps|U_', '_p~iF', '_p~iF~ps|U ', '_p~iF\x7f'):
+            with self.subTest(encoded=encoded):
+                with self.assertRaises(ValueError):
+                    decode_polyline(encoded)
+
+
+@skipIf(renderers.orjson is None, 'orjson не установлен')
+class FastJSONTests(TestCase):
+    """FastJSONRenderer и FastJSONParser ведут себя как стандартные JSONRenderer/JSONParser"""
+
+    def render_both(self, data):
+        return FastJSONRenderer().render(data), JSONRenderer().render(data)
+
+    def parse_both(self, body):
+        results = []
+        for parser in (FastJSONParser(), JSONParser()):
+            try:
+                results.append(parser.parse(io.BytesIO(body)))
+            except ParseError as e:
+                results.append(('error', str(e.detail)))
+        return results
+
+    def test_render_matches_drf(self):
+        data = {
+            'name': 'Маршрут \u2028 <&>', 'lat': Decimal('55.123456'), 'length': 1234.5, 'empty': None,
+            'created_at': timezone.now(), 'items': [1, True, {'nested': [0.1, -2]}], 1: 'ключ-число',
+        }
+        fast, standard = self.render_both(data)
+        self.assertEqual(fast, standard)
+
+        # Целые вне 64 бит orjson не сериализует — ответ стандартным рендерером, а не 500
+        data['counts'] = [2 ** 70, -(2 ** 64)]
+        fast, standard = self.render_both(data)
+        self.assertEqual(fast, standard)
+        self.assertIn(b'1180591620717411303424', fast)
+
+    def test_non_finite_floats_are_rejected(self):
+        for value in (float('nan'), float('inf'), -float('inf')):
+            with self.subTest(value=value):
+                data = {'legs': [{'distance': 1.0}, {'distance': value}], 'bbox': None}
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render(data)
+                with self.assertRaises(ValueError):
+                    FastJSONRenderer().render(data)
+
+    def test_non_finite_float_search(self):
+        class Distance(float):
+            pass
+
+        Leg = namedtuple('Leg', 'distance bearing')
+        nan = float('nan')
+        cases = [
+            (ReturnList([ReturnDict({'distance': nan}, serializer=None)], serializer=None), True),
+            (OrderedDict(legs=[Leg(1.0, -float('inf'))]), True),
+            ({'distance': Distance('inf')}, True),
+            ({'distance': Distance(1.5), 'name': 'nan', 'count': 0, 'ok': True, 'bbox': None}, False),
+            ([Decimal('NaN'), (1.0, [2.0])], False),
+        ]
+        for data, expected in cases:
+            with self.subTest(data=data):
+                self.assertIs(renderers.has_non_finite_float(data), expected)
+
+    def test_parse_matches_drf(self):
+        bodies = [
+            b'{"name": "\xd0\x9c\xd0\xb0\xd1\x80\xd1\x88\xd1\x80\xd1\x83\xd1\x82", "points": [{"lat": 55.5}]}',
+            b'{"id": 123456789012345678901234567890}',
+            b'[18446744073709551616, -9223372036854775809, 0.12345678901234567890]',
+            b'[1e400]',
+            b'[NaN]',
+            b'{"a": ',
+            b'',
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                fast, standard = self.parse_both(body)
+                self.assertEqual(fast, standard)
+                if isinstance(standard, dict) and 'id' in standard:
+                    self.assertEqual(fast['id'], 123456789012345678901234567890)
+
+    def test_api_uses_fast_renderer(self):
+        user = User.objects.create_user('json', 'json@example.com', 'password')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/routes/', {'name': 'Маршрут', 'points': [{'lat': '55.75', 'lon': '37.61'}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1, REQUEST_METRICS_HEADER=True, ROUTES_RESPONSE_CACHE=False)
+class RequestMetricsTests(TestCase):
+    """Метрики запросов: Server-Timing, гистограммы и /api/metrics/requests/"""
+
+    def setUp(self):
+        instrumentation.METRICS.reset()
+        self.addCleanup(instrumentation.METRICS.reset)
+        self.user = User.objects.create_user('metrics', 'metrics@example.com', 'password')
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        Route.objects.create(name='Маршрут', user=self.user)
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_server_timing_only_for_staff(self):
+        response = self.client_for(self.staff).get('/api/routes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[0-9.]+;desc="\d+ queries", serialize;dur=[0-9.]+, render;dur=[0-9.]+, total;dur=[0-9.]+$',
+        )
+        self.assertNotIn('Server-Timing', self.client_for(self.user).get('/api/routes/'))
+        self.assertNotIn('Server-Timing', Client().get('/api/routes/'))
+        with self.settings(REQUEST_METRICS_HEADER=False):
+            self.assertNotIn('Server-Timing', self.client_for(self.staff).get('/api/routes/'))
+
+    async def test_async_server_timing_only_for_staff(self):
+        for user, expected in ((self.staff, True), (self.user, False)):
+            client = AsyncClient()
+            await client.aforce_login(user)
+            response = await client.get('/api/async/routes/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual('Server-Timing' in response, expected)
+
+    def test_histograms_record_sampled_requests(self):
+        client = self.client_for(self.user)
+        for _ in range(3):
+            client.get('/api/routes/')
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=0):
+            client.get('/api/routes/')
+        [(endpoint, stats)] = instrumentation.METRICS.snapshot()['endpoints'].items()
+        self.assertEqual(endpoint, 'GET route-list')
+        self.assertEqual(stats['count'], 3)
+        self.assertGreater(stats['queries']['max'], 0)
+        self.assertEqual(sum(stats['timings']['total']['histogram']), 3)
+
+    def test_quantiles(self):
+        registry = instrumentation.MetricsRegistry()
+        # 90 быстрых, 9 средних и 1 медленный: p50 — 5 мс, p95 — 250 мс, p99 — 250 мс
+        for total, count in ((3, 90), (200, 9), (7000, 1)):
+            for _ in range(count):
+                values = {'db': 1.0, 'serialize': 1.0, 'render': 1.0, 'total': total, 'queries': 2}
+                registry.record('GET route-list', values, 500 if total > 5000 else 200)
+        stats = registry.snapshot()['endpoints']['GET route-list']
+        self.assertEqual((stats['count'], stats['errors']), (100, 1))
+        total = stats['timings']['total']
+        self.assertEqual((total['p50'], total['p95'], total['p99']), (5, 250, 250))
+        self.assertEqual(total['max'], 7000)
+        self.assertEqual(total['histogram'], [90, 0, 0, 0, 0, 9, 0, 0, 0, 0, 1])
+        # Квантиль в последней (открытой) корзине оценить нельзя
+        self.assertIsNone(instrumentation.MetricsRegistry._quantile(total['histogram'], 100, 1.0))
+        self.assertEqual(stats['queries'], {'avg': 2, 'max': 2})
+
+    def test_metrics_endpoint(self):
+        self.client_for(self.user).get('/api/routes/')
+        self.assertEqual(self.client_for(self.user).get('/api/metrics/requests/').status_code, 403)
+
+        client = self.client_for(self.staff)
+        response = client.get('/api/metrics/requests/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['endpoints']['GET route-list']['count'], 1)
+        self.assertIn('route_cache', response.json())
+
+        self.assertEqual(client.delete('/api/metrics/requests/').status_code, 204)
+        # После сброса остаётся только сам запрос DELETE
+        self.assertEqual(list(instrumentation.METRICS.snapshot()['endpoints']), ['DELETE request_metrics'])
+
+
+class BlockingStream(io.StringIO):
+    """Поток, запись в который ждёт release (очередь обработчика заполняется)"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(5)
+        return super().write(text)
+
+
+class LoggingTests(TestCase):
+    """Фоновый обработчик логов, выборка записей и структурный формат"""
+
+    def make_record(self, message, *args, level=logging.INFO, name='map.api_views', data=None):
+        record = logging.LogRecord(name, level, __file__, 1, message, args, None)
+        if data is not None:
+            record.data = data
+        return record
+
+    def test_listener_starts_lazily_and_flushes_on_close(self):
+        stream = io.StringIO()
+        handler = BackgroundQueueHandler(stream=stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.addCleanup(handler.close)
+        self.assertIsNone(handler.listener)
+
+        for idx in range(3):
+            handler.handle(self.make_record('Запись %d', idx))
+        self.assertIsNotNone(handler.listener)
+        handler.close()
+        self.assertEqual(stream.getvalue().splitlines(), ['INFO Запись 0', 'INFO Запись 1', 'INFO Запись 2'])
+
+        # После закрытия записи пишутся сразу, поток не запускается снова
+        handler.handle(self.make_record('Поздняя запись'))
+        self.assertIsNone(handler.listener)
+        self.assertEqual(stream.getvalue().splitlines()[-1], 'INFO Поздняя запись')
+
+    def test_dropped_records_are_counted_and_reported(self):
+        stream = BlockingStream()
+        handler = BackgroundQueueHandler(stream=stream, queue_size=2)
+        self.addCleanup(handler.close)
+        total = 200
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda idx: handler.handle(self.make_record('Запись %d', idx)), range(total)))
+        self.assertGreater(handler.dropped, 0)
+        self.assertGreaterEqual(dropped_records(), handler.dropped)
+
+        stream.release.set()
+        handler.close()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[-1], f'Очередь логов переполнялась: отброшено записей — {handler.dropped}')
+        # Каждая запись либо выведена, либо учтена в dropped
+        self.assertEqual(len(lines) - 1 + handler.dropped, total)
+
+        staff = User.objects.create_user('log-staff', 'log-staff@example.com', 'password', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        self.assertEqual(client.get('/api/metrics/requests/').json()['logging']['dropped'], dropped_records())
+
+    def test_message_is_built_before_enqueue(self):
+        stream = BlockingStream()
+        handler = BackgroundQueueHandler(stream=stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.addCleanup(handler.close)
+        handler.setLevel(logging.INFO)
+        logger = logging.getLogger('map.tests.queue')
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        points = [1, 2]
+        record = self.make_record('Точки %s', points, name=logger.name)
+        logger.handle(record)
+        logger.debug('Отладка %s', points)
+        points.append(3)
+        stream.release.set()
+        handler.close()
+        self.assertEqual(stream.getvalue().splitlines(), ['INFO Точки [1, 2]'])
+        # Другие обработчики логгера получают запись с исходными аргументами
+        self.assertEqual((record.msg, record.args), ('Точки %s', (points,)))
+
+    def test_sampling_filter(self):
+        sampling = SamplingFilter(rate=0.5, max_level='INFO', loggers=['map'])
+        with mock.patch('map.log_handlers.random.random', side_effect=[0.2, 0.7]):
+            self.assertTrue(sampling.filter(self.make_record('Попала в выборку')))
+            self.assertFalse(sampling.filter(self.make_record('Отброшена', level=logging.DEBUG)))
+        with mock.patch('map.log_handlers.random.random', side_effect=AssertionError('не должен вызываться')):
+            self.assertTrue(sampling.filter(self.make_record('Предупреждение', level=logging.WARNING)))
+            self.assertTrue(sampling.filter(self.make_record('Другой логгер', name='django.request')))
+            self.assertTrue(sampling.filter(self.make_record('Похожее имя', name='mapper')))
+            self.assertTrue(SamplingFilter(rate=1).filter(self.make_record('Всё подряд')))
+        self.assertFalse(SamplingFilter(rate=0, loggers=['map']).filter(self.make_record('Ничего', name='map')))
+
+    def test_structured_formatter(self):
+        formatter = StructuredFormatter('%(levelname)s %(name)s: %(message)s')
+        record = self.make_record('📤 Image upload %s', 'ok', data={'point': 5, 'status': 201, 'reason': 'too large'})
+        self.assertEqual(
+            formatter.format(record),
+            'INFO map.api_views: 📤 Image upload ok point=5 status=201 reason=too large',
+        )
+        self.assertEqual(formatter.format(self.make_record('Без полей')), 'INFO map.api_views: Без полей')
+        self.assertEqual(formatter.format(self.make_record('Пустые поля', data={})), 'INFO map.api_views: Пустые поля')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Проверка профиля SQLITE_PROFILE=concurrent')
+class SQLiteConcurrencyTests(TransactionTestCase):
+    """
+    Параллельные чтения и записи на файловой БД в профиле SQLITE_PROFILE=concurrent
+    (как stress_sqlite, но потоками) не получают «database is locked»
+
+    Тестовая БД SQLite в памяти не поддерживает WAL, поэтому на время теста
+    соединение default переключается на временный файл с настройками профиля
+    (независимо от того, включён ли он для запуска тестов).
+    """
+
+    READERS = 3
+    WRITERS = 2
+    DURATION = 2.0
+
+    def use_file_database(self):
+        directory = tempfile.mkdtemp()
+        original_settings, original_connection = connections.settings['default'], connections['default']
+        connections.settings['default'] = {
+            **original_settings, **settings.SQLITE_CONCURRENT_SETTINGS, 'NAME': os.path.join(directory, 'stress.sqlite3'),
+        }
+        connections['default'] = connections.create_connection('default')
+
+        def restore():
+            connections['default'].close()
+            connections['default'] = original_connection
+            connections.settings['default'] = original_settings
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.addCleanup(restore)
+        call_command('migrate', verbosity=0, interactive=False)
+
+    def worker(self, kind, seed, deadline, route_ids, user):
+        rng = random.Random(seed)
+        operations, errors = 0, 0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    if kind == 'read':
+                        stress_sqlite.read_once(user, route_ids, rng)
+                    else:
+                        stress_sqlite.write_once(user, route_ids, rng)
+                except OperationalError as e:
+                    if not stress_sqlite.is_lock_error(e):
+                        raise
+                    errors += 1
+                else:
+                    operations += 1
+        finally:
+            connections.close_all()
+        return kind, operations, errors
+
+    def test_no_lock_errors_under_mixed_load(self):
+        self.use_file_database()
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+        [user], _ = seed_maps(users=1, routes=10, points=10, images=0, prefix='stress')
+        route_ids = list(Route.objects.filter(user=user).values_list('id', flat=True))
+
+        kinds = ['read'] * self.READERS + ['write'] * self.WRITERS
+        deadline = time.monotonic() + self.DURATION
+        with ThreadPoolExecutor(max_workers=len(kinds)) as executor:
+            results = list(executor.map(
+                lambda args: self.worker(*args, deadline, route_ids, user), enumerate(kinds),
+            ))
+
+        self.assertEqual([errors for _, _, errors in results], [0] * len(kinds))
+        self.assertTrue(all(operations for _, operations, _ in results), results)
+        # Записи не потеряли обновлений кластеров друг друга
+        for precision in clustering.CLUSTER_PRECISIONS:
+            self.assertEqual(
+                PointCluster.objects.filter(precision=precision).aggregate(total=Sum('count'))['total'],
+                Point.objects.count(),
+            )
+
+
+@override_settings(ROUTES_RESPONSE_CACHE=False)
+class RouteFastReadTests(TestCase):
+    """Быстрый путь чтения (route_reader) отдаёт тот же JSON, что и RouteSerializer"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for route_idx in range(3):
+            route = Route.objects.create(
+                name=f'Маршрут {route_idx}', description=None if route_idx else 'Описание', user=self.user,
+            )
+            for idx in range(route_idx * 3):
+                point = Point.objects.create(
+                    route=route, name=f'Точка «{idx}»', lat=f'55.{idx}123456789', lon=f'-37.{idx}5', order=idx,
+                )
+                if idx % 2 == 0:
+                    PointImage.objects.create(
+                        point=point, image=f'point_images/{point.id}/photo {idx}.png',
+                        derivatives=[
+                            {'width': width, 'format': fmt, 'name': f'point_images/{point.id}/d/photo_{width}.{fmt}'}
+                            for width in (320, 160) for fmt in ('webp', 'jpeg')
+                        ],
+                    )
+            route.length = 1234.5 * route_idx
+            route.legs = [{'distance': 1.5, 'bearing': 90.25}] * route_idx
+            route.bbox = [-37.5, 55.1, -37.0, 55.9] if route_idx else None
+            route.save()
+        self.route_id = route.id
+
+    def assert_same_content(self, url):
+        with self.settings(ROUTES_FAST_READ=False):
+            expected = self.client.get(url)
+        with self.settings(ROUTES_FAST_READ=True):
+            actual = self.client.get(url)
+        self.assertEqual(expected.status_code, 200)
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual(actual.content, expected.content)
+
+    def test_list_is_byte_identical(self):
+        self.assert_same_content('/api/routes/')
+
+    def test_paginated_list_is_byte_identical(self):
+        self.assert_same_content('/api/routes/?page_size=2')
+
+    def test_retrieve_is_byte_identical(self):
+        self.assert_same_content(f'/api/routes/{self.route_id}/')
+
+    def test_polyline_is_byte_identical(self):
+        self.assert_same_content('/api/routes/?geometry=polyline&precision=6')
+
+    def test_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/routes/')
+        route = Route.objects.create(name='Ещё', user=self.user)
+        for idx in range(5):
+            point = Point.objects.create(route=route, lat=10 + idx, lon=20, order=idx)
+            PointImage.objects.create(point=point, image=f'point_images/{point.id}/x.png')
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get('/api/routes/')
+        self.assertEqual(len(queries), len(more_queries))
+
+
+class BenchmarkQueryCountTests(TestCase):
+    """Число SQL-запросов по эндпоинтам не превышает базовую линию bench_maps"""
+
+    def test_query_counts_do_not_regress(self):
+        from .benchmarks import find_regressions, load_baseline, run_benchmarks
+
+        baseline = load_baseline()
+        self.assertIsNotNone(baseline, 'Нет map/benchmarks_baseline.json: запустите bench_maps --update-baseline')
+        results = run_benchmarks({'users': 1, 'routes': 3, 'points': 5, 'images': 1}, repeat=1)
+        self.assertEqual(set(results['scenarios']), set(baseline['scenarios']))
+        self.assertEqual(find_regressions(results, baseline, check_timings=False), [])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Запросы маршрутов, точек, профиля и авторизации не сканируют таблицы целиком
+
+    Все SQL-запросы сценариев перехватываются через execute_wrapper и
+    проверяются EXPLAIN QUERY PLAN: строка плана «SCAN <таблица>» означает,
+    что для запроса нет подходящего индекса. Список точек без bbox (все точки
+    сразу) к горячему пути не относится и не проверяется.
+    """
+
+    # Строки плана без обращения к таблице: перебор констант (INSERT ... VALUES (...), (...))
+    # и материализованного списка дельт кластеров (UPDATE ... FROM (VALUES ...) AS delta)
+    ALLOWED_SCANS = re.compile(r'^SCAN (CONSTANT ROW|\d+ CONSTANT ROWS|delta)$')
+    PLANNED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+    def setUp(self):
+        self.user = User.objects.create_user('planner', 'planner@example.com', 'password')
+        other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        for owner in (self.user, other):
+            for route_idx in range(3):
+                route = Route.objects.create(name=f'Маршрут {route_idx}', user=owner)
+                for idx in range(4):
+                    point = Point.objects.create(route=route, lat=55 + idx / 10, lon=37 + route_idx / 10, order=idx)
+                    PointImage.objects.create(point=point, image=f'point_images/{point.id}/photo.png')
+        self.route = Route.objects.filter(user=self.user).order_by('id').first()
+        self.point = self.route.points.first()
+        self.client = APIClient()
+        self.client.login(username='planner', password='password')
+        self.statements = []
+
+    @contextmanager
+    def capture_statements(self):
+        def wrapper(execute, sql, params, many, context):
+            if many:
+                params = list(params)
+                self.statements.append((sql, params[0] if params else None))
+            else:
+                self.statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield
+
+    def request(self, method, url, expected_status, **kwargs):
+        # Отложенные on_commit обработчики (сброс кэша маршрутов) тоже проверяются
+        with self.capture_statements(), self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, expected_status, f'{method.upper()} {url}')
+        return response
+
+    def query_plans(self):
+        """Планы перехваченных запросов: [(sql, [строки плана])]"""
+        plans = []
+        for sql, params in dict.fromkeys((sql, tuple(params or ())) for sql, params in self.statements):
+            if not sql.lstrip().upper().startswith(self.PLANNED_STATEMENTS):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return plans
+
+    def assert_no_table_scans(self):
+        plans = self.query_plans()
+        self.assertTrue(plans)
+        scans = [
+            f'{line}: {sql}'
+            for sql, lines in plans for line in lines
+            if line.startswith('SCAN ') and not self.ALLOWED_SCANS.match(line)
+        ]
+        self.assertEqual(scans, [], 'Полное сканирование таблиц:\n' + '\n'.join(scans))
+
+    def test_route_endpoints(self):
+        self.request('get', '/api/routes/', 200)
+        self.request('get', '/api/routes/?view=summary', 200)
+        page = self.request('get', '/api/routes/?page_size=2', 200)
+        self.request('get', page.data['next'], 200)
+        self.request('get', '/api/routes/?bbox=36,54,38,56', 200)
+        self.request('get', f'/api/routes/{self.route.id}/', 200)
+        self.request('get', '/api/routes/export/?fmt=geojson', 200)
+        payload = {'name': 'Новый', 'points': [{'name': 'A', 'lat': '55.1', 'lon': '37.1'}]}
+        created = self.request('post', '/api/routes/', 201, data=payload, format='json')
+        points = [
+            {'id': point.id, 'name': 'Изменена', 'lat': str(point.lat), 'lon': str(point.lon)}
+            for point in self.route.points.all()[1:]
+        ]
+        self.request('put', f'/api/routes/{self.route.id}/', 200, data={'name': 'Маршрут', 'points': points}, format='json')
+        self.request('post', f'/api/routes/{self.route.id}/optimize/', 200, data={}, format='json')
+        self.request('delete', f'/api/routes/{created.data["id"]}/', 204)
+        self.assert_no_table_scans()
+
+    def test_point_endpoints(self):
+        self.request('get', f'/api/points/{self.point.id}/', 200)
+        self.request('get', '/api/points/?bbox=36,54,38,56', 200)
+        self.request('get', '/api/points/clusters/?zoom=6', 200)
+        self.request('patch', f'/api/points/{self.point.id}/', 200, data={'lat': '55.05'}, format='json')
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            image = SimpleUploadedFile('photo.png', seed_image(), content_type='image/png')
+            self.request('post', f'/api/points/{self.point.id}/upload_image/', 201, data={'images': [image]})
+        self.request('get', '/api/image-jobs/', 200)
+        self.request('delete', f'/api/points/{self.point.id}/', 204)
+        self.assert_no_table_scans()
+
+    def test_profile_and_auth_endpoints(self):
+        self.request('get', '/api/user/', 200)
+        self.request('get', '/api/profile/', 200)
+        self.request('post', '/api/change-subscription/', 200, data={'subscription_type': 'premium'}, format='json')
+        self.request('post', '/api/logout/', 200)
+        self.request('post', '/api/login/', 200, data={'username': 'planner', 'password': 'password'}, format='json')
+        self.request('post', '/api/register/', 200, data={
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'password', 'password2': 'password',
+        }, format='json')
+        self.assert_no_table_scans()
+
+    def test_ordered_reads_use_composite_indexes(self):
+        self.request('get', '/api/routes/?page_size=2', 200)
+        self.request('get', '/api/image-jobs/', 200)
+        used = ' '.join(line for _, lines in self.query_plans() for line in lines)
+        for index in ('map_route_user_created_idx', 'map_point_route_order_idx', 'map_upload_job_user_idx'):
+            self.assertIn(index, used)
+
+
+class RouteResponseCacheTests(TestCase):
+    """Кэш ответов маршрутов: повторное чтение из кэша, сброс после фиксации записи"""
+
+    def setUp(self):
+        route_cache.get_cache().clear()
+        route_cache.STATS.reset()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'password')
+        self.other = User.objects.create_user('stranger', 'stranger@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Сброс по созданию данных выполняется сразу, а не при фиксации транзакции теста
+        with self.captureOnCommitCallbacks(execute=True):
+            self.route = Route.objects.create(name='Маршрут', user=self.user)
+            self.point = Point.objects.create(route=self.route, name='Старт', lat=55, lon=37, order=0)
+            Point.objects.create(route=self.route, name='Финиш', lat=56, lon=38, order=1)
+            Point.objects.create(route=self.route, name='Середина', lat=55.5, lon=37.5, order=2)
+
+    def user_keys(self):
+        return (
+            route_cache.response_key(self.user.pk, 'fingerprint'),
+            route_cache.response_key(self.other.pk, 'fingerprint'),
+        )
+
+    def assert_invalidates_only_owner(self, write):
+        user_key, other_key = self.user_keys()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+            # До фиксации транзакции версия не меняется
+            self.assertEqual(self.user_keys(), (user_key, other_key))
+        self.assertNotEqual(self.user_keys()[0], user_key)
+        self.assertEqual(self.user_keys()[1], other_key)
+
+    def test_repeated_read_is_served_from_cache(self):
+        first = self.client.get(f'/api/routes/{self.route.id}/')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(f'/api/routes/{self.route.id}/')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual((route_cache.STATS.hits, route_cache.STATS.misses), (1, 1))
+        # Остаётся только агрегат для ETag
+        self.assertEqual(len(queries), 1)
+
+    def test_write_is_visible_even_with_unchanged_etag(self):
+        updated_at = Route.objects.get(id=self.route.id).updated_at
+        self.client.get('/api/routes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/points/{self.point.id}/', {'name': 'Изменена'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # Возвращаем updated_at: ETag совпадает с закэшированным, спасает только версия
+        Route.objects.filter(id=self.route.id).update(updated_at=updated_at)
+        response = self.client.get('/api/routes/')
+        self.assertEqual(response.data[0]['points'][0]['name'], 'Изменена')
+
+    def test_signals_and_bulk_writes_invalidate_owner(self):
+        points = [
+            {'id': point.id, 'name': point.name, 'lat': str(point.lat), 'lon': str(point.lon)}
+            for point in self.route.points.all()
+        ]
+        writes = [
+            lambda: self.client.put(f'/api/routes/{self.route.id}/', {'name': 'Новое', 'points': points}, format='json'),
+            lambda: self.client.post(f'/api/routes/{self.route.id}/optimize/', {}, format='json'),
+            lambda: PointImage.objects.create(point_id=self.point.id, image='point_images/photo.png'),
+            lambda: Point.objects.filter(id=self.point.id).delete(),
+            lambda: Route.objects.get(id=self.route.id).delete(),
+        ]
+        for index, write in enumerate(writes):
+            with self.subTest(write=index):
+                self.assert_invalidates_only_owner(write)
+
+    def test_rolled_back_write_keeps_cache(self):
+        user_key, _ = self.user_keys()
+        try:
+            with transaction.atomic():
+                Point.objects.create(route=self.route, lat=57, lon=39, order=2)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with self.captureOnCommitCallbacks(execute=True):
+            pass
+        self.assertEqual(self.user_keys()[0], user_key)
+
+
+@override_settings(ROUTES_RESPONSE_CACHE=False)
+class AsyncEndpointTests(TestCase):
+    """Асинхронные эндпоинты (/api/async/...) отдают тот же JSON, что и DRF"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('async', 'async@example.com', 'password')
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        for owner in (self.user, other):
+            for route_idx in range(3):
+                route = Route.objects.create(name=f'Маршрут {route_idx}', description='Описание', user=owner)
+                for idx in range(route_idx + 1):
+                    point = Point.objects.create(
+                        route=route, name=f'Точка {idx}', lat=f'55.{idx}12345', lon=f'37.{route_idx}5', order=idx,
+                    )
+                    PointImage.objects.create(
+                        point=point, image=f'point_images/{point.id}/photo.png',
+                        derivatives=[{'width': 320, 'format': 'webp', 'name': f'point_images/{point.id}/d.webp'}],
+                    )
+        self.route = route
+        self.point = point
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def assert_same_response(self, url, expected_status=200):
+        expected = self.client.get(f'/api/{url}')
+        actual = self.client.get(f'/api/async/{url}')
+        self.assertEqual(expected.status_code, expected_status, url)
+        self.assertEqual(actual.status_code, expected_status, url)
+        self.assertEqual(actual.json(), expected.json(), url)
+        return actual
+
+    def test_reads_match_sync_endpoints(self):
+        own_route = Route.objects.filter(user=self.user).first()
+        for url in (
+            'routes/', 'routes/?view=summary', 'routes/?geometry=polyline&precision=6', 'routes/?bbox=37,55,37.2,56',
+            f'routes/{own_route.id}/', 'points/?bbox=37,55,37.2,56', f'points/{self.point.id}/',
+        ):
+            with self.subTest(url=url):
+                self.assert_same_response(url)
+
+    def test_pagination_matches_sync_endpoint(self):
+        expected = self.client.get('/api/routes/?page_size=2').json()
+        actual = self.client.get('/api/async/routes/?page_size=2').json()
+        self.assertEqual(actual['results'], expected['results'])
+        self.assertEqual(actual['next'], expected['next'].replace('/api/routes/', '/api/async/routes/'))
+        self.assertEqual(self.client.get(actual['next']).json()['results'], self.client.get(expected['next']).json()['results'])
+
+    def test_errors_match_sync_endpoints(self):
+        self.assert_same_response(f'routes/{self.route.id}/', 404)
+        self.assert_same_response('routes/?bbox=1,2', 400)
+        self.client.logout()
+        self.assert_same_response('routes/', 403)
+
+    def test_upload_is_queued(self):
+        with tempfile.TemporaryDirectory() as staging, self.settings(IMAGE_JOBS_STAGING_ROOT=staging):
+            images = [SimpleUploadedFile(f'{idx}.png', seed_image(), content_type='image/png') for idx in range(2)]
+            response = self.client.post(f'/api/async/points/{self.point.id}/upload_image/', {'images': images})
+            self.assertEqual(response.status_code, 202)
+            job = ImageUploadJob.objects.get(id=response.json()['job_id'])
+            self.assertEqual((job.point_id, job.user_id, job.total_files), (self.point.id, self.user.id, 2))
+
+            bad = SimpleUploadedFile('bad.png', b'not an image', content_type='image/png')
+            expected = self.client.post(f'/api/points/{self.point.id}/upload_image/?async=1', {'images': [bad]})
+            bad.seek(0)
+            actual = self.client.post(f'/api/async/points/{self.point.id}/upload_image/', {'images': [bad]})
+            self.assertEqual((actual.status_code, actual.json()), (expected.status_code, expected.json()))
+
+    def test_upload_requires_csrf_token(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        image = SimpleUploadedFile('photo.png', seed_image(), content_type='image/png')
+        expected = client.post(f'/api/points/{self.point.id}/upload_image/?async=1', {'images': [image]})
+        image.seek(0)
+        actual = client.post(f'/api/async/points/{self.point.id}/upload_image/', {'images': [image]})
+        self.assertEqual(expected.status_code, 403)
+        self.assertEqual((actual.status_code, actual.json()), (expected.status_code, expected.json()))
+
+    async def test_asgi_body_over_memory_limit_goes_to_file(self):
+        messages = [{'type': 'http.request', 'body': bytes([idx]) * 700, 'more_body': idx < 2} for idx in range(3)]
+
+        async def receive():
+            return messages.pop(0)
+
+        with self.settings(ASGI_BODY_MEMORY_SIZE=1024):
+            body_file = await StreamingBodyASGIHandler().read_body(receive)
+        with body_file:
+            self.assertTrue(body_file._rolled)
+            self.assertEqual(body_file.read(), b'\x00' * 700 + b'\x01' * 700 + b'\x02' * 700)
+
+
+class RouteEventsTests(TestCase):
+    """Поток SSE /api/events/: компактные события после фиксации записи"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('listener', 'listener@example.com', 'password')
+        self.other = User.objects.create_user('neighbour', 'neighbour@example.com', 'password')
+        self.route = Route.objects.create(name='Маршрут', user=self.user)
+        self.points = [
+            Point.objects.create(route=self.route, name=f'Точка {idx}', lat=55 + idx, lon=37, order=idx)
+            for idx in range(3)
+        ]
+        self.image = PointImage.objects.create(point=self.points[2], image='point_images/photo.png')
+        self.other_point = Point.objects.create(
+            route=Route.objects.create(name='Чужой', user=self.other), lat=50, lon=30, order=0,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def write(self, method, url, data=None, user=None):
+        if user is not None:
+            self.api.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.api, method)(url, data, format='json')
+        self.api.force_authenticate(self.user)
+        self.assertLess(response.status_code, 300)
+
+    async def open_stream(self, last_event_id=None):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+        response = await client.get('/api/events/', headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        # Первая порция (retry) — подписка уже оформлена
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        return stream
+
+    async def close_stream(self, stream):
+        # Как при отключении клиента под ASGI: ожидающее чтение потока отменяется
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+    async def read_events(self, stream, count):
+        events = []
+        while len(events) < count:
+            chunk = (await asyncio.wait_for(anext(stream), 5)).decode()
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            events.append((fields.get('id'), json.loads(fields['data'])))
+        return events
+
+    async def test_stream_delivers_own_changes(self):
+        stream = await self.open_stream()
+        try:
+            await sync_to_async(self.write)('patch', f'/api/points/{self.other_point.id}/', {'name': 'x'}, self.other)
+            await sync_to_async(self.write)('patch', f'/api/points/{self.points[1].id}/', {'name': 'Новое имя'})
+            (_, route_event), (_, point_event) = await self.read_events(stream, 2)
+        finally:
+            await self.close_stream(stream)
+        self.assertEqual(route_event['type'], 'route.updated')
+        self.assertEqual(route_event['data']['points_count'], 3)
+        self.assertNotIn('points', route_event['data'])
+        expected = (await sync_to_async(self.api.get)(f'/api/points/{self.points[1].id}/')).json()
+        del expected['images']
+        self.assertEqual(point_event, {'type': 'point.updated', 'data': {**expected, 'route': self.route.id}})
+        self.assertEqual(route_events.HUB.subscriptions(), [])
+
+    async def test_reconnect_replays_missed_events_or_resyncs(self):
+        stream = await self.open_stream()
+        try:
+            await sync_to_async(self.write)('patch', f'/api/routes/{self.route.id}/', {'name': 'Первое'})
+            [(last_id, _)] = await self.read_events(stream, 1)
+        finally:
+            await self.close_stream(stream)
+        # Событие без открытого потока доходит только в историю, если кто-то подписан
+        other_stream = await self.open_stream()
+        try:
+            await sync_to_async(self.write)('delete', f'/api/points/{self.points[2].id}/')
+            await self.read_events(other_stream, 2)
+            stream = await self.open_stream(last_id)
+            try:
+                missed = await self.read_events(stream, 2)
+            finally:
+                await self.close_stream(stream)
+        finally:
+            await self.close_stream(other_stream)
+        self.assertEqual([event['type'] for _, event in missed], ['route.updated', 'point.deleted'])
+        self.assertEqual(missed[1][1]['data'], {'id': self.points[2].id, 'route': self.route.id})
+
+        stream = await self.open_stream('unknown-1')
+        try:
+            [(_, event)] = await self.read_events(stream, 1)
+        finally:
+            await self.close_stream(stream)
+        self.assertEqual(event['type'], 'resync')
+
+    @override_settings(ROUTE_EVENTS_BACKEND='database')
+    def test_bulk_route_update_and_cascade_delete(self):
+        points = [
+            {'id': self.points[0].id, 'name': 'Переименована', 'lat': '55', 'lon': '37'},
+            {'id': self.points[1].id, 'name': 'Точка 1', 'lat': '56', 'lon': '37'},
+            {'name': 'Новая', 'lat': '58', 'lon': '37'},
+        ]
+        self.write('put', f'/api/routes/{self.route.id}/', {'name': 'Маршрут', 'points': points})
+        events = [row.event for row in RouteEvent.objects.filter(user=self.user).order_by('id')]
+        self.assertEqual(
+            [(event['type'], event['data'].get('name')) for event in events],
+            # Изображение удалённой точки отдельного события не получает
+            [('route.updated', 'Маршрут'), ('point.created', 'Новая'), ('point.updated', 'Переименована'),
+             ('point.deleted', None)],
+        )
+        self.assertEqual(events[0]['data']['points_count'], 3)
+        self.assertFalse(RouteEvent.objects.filter(user=self.other).exists())
+
+        RouteEvent.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            image = PointImage.objects.create(point=self.points[0], image='point_images/new.png')
+        event = RouteEvent.objects.get(event__type='image.created')
+        message = route_events.render_event({'id': '1', **event.event}, lambda name: f'/media/{name}')
+        self.assertEqual(json.loads(message.split('data: ', 1)[1])['data'], {
+            'id': image.id, 'image': '/media/point_images/new.png', 'thumbnail': '/media/point_images/new.png',
+            'srcset': {}, 'point': self.points[0].id, 'route': self.route.id,
+        })
+
+        RouteEvent.objects.all().delete()
+        # Удаление маршрута поглощает события точек и изображений
+        self.write('delete', f'/api/routes/{self.route.id}/')
+        self.assertEqual(
+            [row.event for row in RouteEvent.objects.all()],
+            [{'type': 'route.deleted', 'data': {'id': self.route.id}}],
+        )
+
+    @override_settings(ROUTE_EVENTS_BACKEND='database')
+    def test_batch_is_dropped_with_rolled_back_savepoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Point.objects.create(route=self.route, name='Откат', lat=50, lon=30, order=5)
+                raise RuntimeError
+            Point.objects.create(route=self.route, name='После отката', lat=51, lon=30, order=5)
+            Point.objects.filter(id=self.points[0].id).update(name='Массово')
+            route_events.schedule_changes('point', 'updated', [self.points[0].id])
+        events = RouteEvent.objects.order_by('id').values_list('event', flat=True)
+        self.assertEqual(
+            [(event['type'], event['data'].get('name')) for event in events],
+            [('route.updated', 'Маршрут'), ('point.created', 'После отката'), ('point.updated', 'Массово')],
+        )
+
+    @override_settings(ROUTE_EVENTS_BACKEND='database')
+    def test_import_sends_point_events(self):
+        line = {'type': 'LineString', 'coordinates': [[37, 55], [37.5, 55.2], [37.1, 55.6], [37.9, 55.9]]}
+        track = {'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': line, 'properties': {}}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            [imported] = importers.import_tracks(io.BytesIO(json.dumps(track).encode()), 'geojson', self.user, 'Трек')
+        events = [row.event for row in RouteEvent.objects.filter(user=self.user).order_by('id')]
+        self.assertEqual([event['type'] for event in events], ['route.created'] + ['point.created'] * 4)
+        self.assertEqual(events[0]['data']['points_count'], imported['points_count'])
+        self.assertEqual(
+            [event['data']['order'] for event in events[1:]], list(range(imported['points_count'])),
+        )
+
+    def test_render_event_without_orjson(self):
+        event = {'id': '7', 'type': 'route.updated', 'data': {'id': 1, 'name': 'Маршрут "А"\nБ', 'bbox': [1.5, None]}}
+        with mock.patch.object(route_events, 'orjson', None):
+            fallback = route_events.render_event(event, str)
+        self.assertEqual(fallback, route_events.render_event(event, str))
+        self.assertEqual(fallback.count('\n'), 3)
+
+    async def test_poller_does_not_inherit_subscriber_context(self):
+        marker = contextvars.ContextVar('marker', default=None)
+        seen = []
+
+        async def poll(loop):
+            seen.append(marker.get())
+
+        backend = route_events.DatabaseBackend(route_events.HUB)
+        marker.set('request')
+        with mock.patch.object(backend, 'poll', poll):
+            subscription = backend.subscribe(self.user.id)
+            try:
+                await asyncio.sleep(0)
+            finally:
+                backend.unsubscribe(subscription)
+        self.assertEqual(seen, [None])
+
+    def test_stream_requires_asgi(self):
+        client = Client()
+        client.force_login(self.user)
+        self.assertEqual(client.get('/api/events/').status_code, 501)
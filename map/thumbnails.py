@@ -0,0 +1,137 @@
+"""
+Генерация уменьшенных копий (производных) изображений точек
+
+Для каждого загруженного изображения создаются копии фиксированной ширины
+в форматах WebP и JPEG. Список копий хранится в ``PointImage.derivatives``
+и отдаётся клиенту в виде готовых значений ``srcset``.
+"""
+
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Ширины производных копий в пикселях
+DERIVATIVE_WIDTHS = (160, 320, 640)
+
+# Форматы производных копий: расширение файла и параметры сохранения Pillow
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'extension': 'webp', 'options': {'quality': 80, 'method': 4}},
+    'jpeg': {'format': 'JPEG', 'extension': 'jpg', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+
+def derivative_name(image_name, width, fmt):
+    """
+    Путь производной копии в хранилище
+
+    Пример: point_images/10/abc.png -> point_images/10/derivatives/abc_320.webp
+    """
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    extension = DERIVATIVE_FORMATS[fmt]['extension']
+    return os.path.join(directory, 'derivatives', f'{stem}_{width}.{extension}')
+
+
+def _target_widths(original_width):
+    """Ширины копий без увеличения исходника (минимум одна копия)"""
+    widths = [width for width in DERIVATIVE_WIDTHS if width <= original_width]
+    return widths or [original_width]
+
+
+def render_derivatives(source):
+    """
+    Построение производных копий изображения
+
+    Args:
+        source: Открытый файл или байты исходного изображения
+
+    Returns:
+        list: Кортежи (ширина, формат, байты)
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+        base = original.convert('RGBA' if has_alpha else 'RGB')
+
+    rendered = []
+    for width in _target_widths(base.width):
+        height = max(1, round(base.height * width / base.width))
+        resized = base.resize((width, height), Image.Resampling.LANCZOS) if width != base.width else base
+        for fmt, params in DERIVATIVE_FORMATS.items():
+            image = resized
+            if params['format'] == 'JPEG' and image.mode != 'RGB':
+                # JPEG не поддерживает прозрачность: подкладываем белый фон
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            buffer = io.BytesIO()
+            image.save(buffer, params['format'], **params['options'])
+            rendered.append((width, fmt, buffer.getvalue()))
+    return rendered
+
+
+def store_derivatives(image_name, source, storage=None):
+    """
+    Построение и сохранение производных копий в хранилище
+
+    Args:
+        image_name (str): Имя исходного файла в хранилище
+        source: Открытый файл или байты исходного изображения
+        storage: Хранилище (по умолчанию default_storage)
+
+    Returns:
+        list: Описания копий для ``PointImage.derivatives``
+    """
+    storage = storage or default_storage
+    derivatives = []
+    for width, fmt, content in render_derivatives(source):
+        name = derivative_name(image_name, width, fmt)
+        if storage.exists(name):
+            storage.delete(name)
+        saved_name = storage.save(name, ContentFile(content))
+        derivatives.append({'width': width, 'format': fmt, 'name': saved_name})
+    return derivatives
+
+
+def generate_derivatives(point_image):
+    """
+    Генерация копий для PointImage и сохранение их списка в модели
+
+    Returns:
+        list: Описания созданных копий
+    """
+    derivatives = None
+    if point_image.blob_id:
+        # Общий файл: копии уже могли построить для другой точки с тем же содержимым
+        derivatives = (
+            type(point_image).objects.filter(blob_id=point_image.blob_id)
+            .exclude(id=point_image.id).exclude(derivatives=[])
+            .values_list('derivatives', flat=True).first()
+        )
+    if not derivatives:
+        with point_image.image.open('rb') as source:
+            derivatives = store_derivatives(point_image.image.name, source.read(), point_image.image.storage)
+    point_image.derivatives = derivatives
+    point_image.save(update_fields=['derivatives'])
+    return derivatives
+
+
+def derivatives_for_file(image_name):
+    """
+    Генерация копий по имени файла (для пакетной обработки в отдельных процессах)
+
+    Returns:
+        tuple: (имя файла, описания копий или None, текст ошибки или None)
+    """
+    try:
+        with default_storage.open(image_name, 'rb') as source:
+            return image_name, store_derivatives(image_name, source.read()), None
+    except Exception as e:
+        return image_name, None, str(e)
+
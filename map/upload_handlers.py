@@ -0,0 +1,139 @@
+"""
+Потоковая проверка загружаемых изображений
+
+Обработчик стоит первым в цепочке upload handlers и видит каждый блок
+файла до того, как он попадёт в память или во временный файл. Поэтому
+неподходящий файл отклоняется по первым килобайтам, а не после
+буферизации всего тела запроса.
+"""
+
+import io
+import warnings
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from PIL import Image
+
+from .image_validation import (
+    detect_image_mime_type,
+    is_valid_image_pixels,
+    get_allowed_formats_string,
+    MAX_IMAGE_PIXELS,
+    MAX_IMAGE_SIZE_BYTES,
+    MAX_IMAGE_SIZE_MB,
+    SIGNATURE_BYTES,
+)
+
+# Сколько байт заголовка накапливаем для чтения размеров изображения
+# (у JPEG маркер SOF может идти после крупных блоков EXIF)
+MAX_HEADER_BYTES = 256 * 1024
+
+# Формат Pillow для каждого допустимого MIME-типа
+PILLOW_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/gif': 'GIF',
+    'image/webp': 'WEBP',
+    'image/bmp': 'BMP',
+}
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Отклоняет загрузку, как только становится ясно, что файл не подходит:
+    неизвестная сигнатура, слишком большие размеры в пикселях по заголовку
+    или превышение лимита размера файла по мере чтения потока.
+
+    Найденные ошибки сохраняются в ``request.image_upload_errors``.
+    """
+
+    def __init__(self, request=None, max_files=None):
+        super().__init__(request)
+        self.max_files = max_files
+        self.errors = []
+        if request is not None:
+            request.image_upload_errors = self.errors
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_too_large = False
+        if self.max_files and content_length:
+            # Тело запроса с max_files файлами не может быть больше этого (с запасом на заголовки частей)
+            limit = self.max_files * (MAX_IMAGE_SIZE_BYTES + 64 * 1024)
+            if content_length > limit:
+                self.request_too_large = True
+                self.reject(
+                    f'Размер запроса ({content_length / (1024 * 1024):.2f} МБ) превышает допустимый '
+                    f'для {self.max_files} файлов по {MAX_IMAGE_SIZE_MB} МБ'
+                )
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if getattr(self, 'request_too_large', False):
+            raise StopUpload(connection_reset=True)
+        self.received = 0
+        self.header = b''
+        self.identified = False
+
+    def reject(self, message):
+        self.errors.append(message)
+
+    def abort(self, message):
+        self.reject(message)
+        raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > MAX_IMAGE_SIZE_BYTES:
+            self.abort(
+                f'Файл {self.file_name} слишком большой (больше {MAX_IMAGE_SIZE_MB} МБ). '
+                f'Максимум: {MAX_IMAGE_SIZE_MB} МБ'
+            )
+
+        if not self.identified:
+            self.header += raw_data[:MAX_HEADER_BYTES - len(self.header)]
+            self.inspect_header()
+        return raw_data
+
+    def inspect_header(self, final=False):
+        """Проверка сигнатуры и размеров изображения по накопленному заголовку"""
+        if len(self.header) < SIGNATURE_BYTES and not final:
+            return
+
+        mime_type = detect_image_mime_type(self.header)
+        if mime_type is None:
+            self.abort(
+                f'Файл {self.file_name} не является изображением допустимого формата. '
+                f'Разрешены: {get_allowed_formats_string()}'
+            )
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                # Image.open читает только заголовок, пиксели не декодируются
+                with Image.open(io.BytesIO(self.header), formats=[PILLOW_FORMATS[mime_type]]) as image:
+                    width, height = image.size
+        except Image.DecompressionBombError:
+            self.abort(f'Файл {self.file_name} имеет слишком большое разрешение')
+        except Exception:
+            # Заголовок ещё не дочитан — ждём следующий блок
+            if final or len(self.header) >= MAX_HEADER_BYTES:
+                self.abort(f'Не удалось прочитать заголовок изображения {self.file_name}')
+            return
+
+        if not is_valid_image_pixels(width, height):
+            self.abort(
+                f'Файл {self.file_name} имеет слишком большое разрешение ({width}x{height}). '
+                f'Максимум: {MAX_IMAGE_PIXELS // 1000000} млн пикселей'
+            )
+        self.identified = True
+
+    def file_complete(self, file_size):
+        if not self.identified:
+            self.inspect_header(final=True)
+        return None
+
+
+def get_upload_errors(request):
+    """Ошибки, найденные ImageUploadHandler при разборе тела запроса"""
+    django_request = getattr(request, '_request', request)
+    return getattr(django_request, 'image_upload_errors', [])
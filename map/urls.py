@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Главная страница с картой
@@ -17,4 +17,17 @@ urlpatterns = [
     path('api/csrf/', views.get_csrf_token, name='csrf'),
     path('api/profile/', views.profile_view, name='profile'),
     path('api/change-subscription/', views.change_subscription, name='change_subscription'),
+
+    # Асинхронные (ASGI) чтение маршрутов и точек и загрузка изображений
+    path('api/async/routes/', async_views.route_list, name='async-route-list'),
+    path('api/async/routes/<int:pk>/', async_views.route_detail, name='async-route-detail'),
+    path('api/async/points/', async_views.point_list, name='async-point-list'),
+    path('api/async/points/<int:pk>/', async_views.point_detail, name='async-point-detail'),
+    path('api/async/points/<int:pk>/upload_image/', async_views.point_upload_image, name='async-point-upload-image'),
+
+    # Поток событий изменений маршрутов (SSE, только ASGI)
+    path('api/events/', async_views.events_stream, name='route-events'),
+
+    # Метрики запросов (только для администраторов)
+    path('api/metrics/requests/', views.request_metrics_view, name='request_metrics'),
 ]
\ No newline at end of file
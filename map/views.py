@@ -7,7 +7,7 @@ from .models import Point, Route
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.middleware.csrf import get_token
@@ -16,9 +16,19 @@ from .serializers import UserProfileSerializer
 from .subscription_limits import get_max_routes, get_max_points_per_route
 from django.utils import timezone
 from datetime import timedelta
+from .spatial import parse_bbox, filter_points_in_bbox
+from .instrumentation import METRICS
+from .log_handlers import dropped_records
+from . import route_cache
 
 def map_view(request):
     points = Point.objects.all()
+    try:
+        bbox = parse_bbox(request.GET.get('bbox'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if bbox:
+        points = filter_points_in_bbox(points, bbox)
     return render(request, 'map_template.html', {'points': points})
 
 @require_POST
@@ -154,4 +164,21 @@ def change_subscription(request):
         'status': 'ok',
         'subscription_type': profile.subscription_type,
         'subscription_until': profile.subscription_until
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def request_metrics_view(request):
+    """
+    Гистограммы времени запросов по эндпоинтам, счётчики кэша маршрутов
+    и число отброшенных записей лога (DELETE — сброс гистограмм и кэша)
+    """
+    if request.method == 'DELETE':
+        METRICS.reset()
+        route_cache.STATS.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({
+        **METRICS.snapshot(),
+        'route_cache': route_cache.STATS.snapshot(),
+        'logging': {'dropped': dropped_records()},
+    })
@@ -5,12 +5,42 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Профиль ASGI
+------------
+Асинхронные эндпоинты (/api/async/..., см. map/async_views.py) не
+занимают поток на время медленного соединения: под ASGI один воркер
+держит сотни одновременных клиентов. Запуск:
+
+    uvicorn maps_project.asgi:application --workers 2
+    gunicorn maps_project.asgi:application -k uvicorn.workers.UvicornWorker -w 2
+
+* SQLITE_PROFILE=concurrent (включается явно) — WAL и busy_timeout: запросы
+  из пула потоков sync_to_async и нескольких воркеров не получают
+  «database is locked»;
+* постоянные соединения БД отключены (DB_CONN_MAX_AGE=0): синхронный код
+  каждого запроса выполняется в своём потоке, и соединение, оставленное
+  открытым, больше не использовалось бы;
+* при нескольких воркерах кэш маршрутов должен быть общим: ROUTES_CACHE_DIR,
+  а события /api/events/ — идти через БД: ROUTE_EVENTS_BACKEND=database;
+* ASGI_BODY_MEMORY_SIZE — сколько тела запроса держать в памяти, дальше
+  оно пишется во временный файл вне цикла событий (map/asgi.py);
+* синхронные эндпоинты DRF выполняются и под ASGI, но каждый занимает
+  поток из пула (ASGI_THREADS) на всё время обработки, и выигрыша по
+  соединениям у них нет;
+* потоковый ответ с синхронным итератором Django под ASGI собирает в память
+  целиком; выгрузка /api/routes/export/ поэтому отдаёт асинхронный
+  итератор (map/asgi.py, iterate_in_thread), а новые потоковые ответы
+  синхронных представлений должны делать так же.
+
+Сравнение с WSGI: manage.py bench_concurrency.
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'maps_project.settings')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+from map.asgi import get_asgi_application  # noqa: E402
 
 application = get_asgi_application()
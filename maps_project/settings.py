@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'map.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -46,6 +47,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Доля запросов, для которых собираются метрики SQL/сериализации/рендеринга
+# (0 — выключено, 1 — все), и отдавать ли их в заголовке Server-Timing
+# (см. map/instrumentation.py, /api/metrics/requests/). Заголовок раскрывает
+# число SQL-запросов, поэтому даже включённый получают только сотрудники (is_staff)
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', '0.1'))
+REQUEST_METRICS_HEADER = os.environ.get('REQUEST_METRICS_HEADER', '0') == '1'
+
 ROOT_URLCONF = 'maps_project.urls'
 
 TEMPLATES = [
@@ -74,6 +82,45 @@ DATABASES = {
     }
 }
 
+# Профиль SQLite для конкурентной нагрузки включается явно:
+#
+#     SQLITE_PROFILE=concurrent uvicorn maps_project.asgi:application
+#
+# WAL — читатели не ждут писателей; busy_timeout — ожидание блокировки вместо
+# мгновенного «database is locked»; BEGIN IMMEDIATE — транзакция сразу берёт
+# блокировку записи, а не повышает её посреди транзакции (что в WAL приводит
+# к SQLITE_BUSY без ожидания); постоянные соединения с проверкой перед запросом.
+# Цена IMMEDIATE: блокировку записи берёт любой atomic(), даже только читающий,
+# и держит её до конца блока. Такие блоки выполняются строго по одному, и
+# очередь к ним растёт вместе с числом писателей: stress_sqlite с 4 процессами
+# записи на 1 CPU давал p95 записи около 10 с (обработчик busy опрашивает
+# блокировку, и ожидающие писатели голодают). Поэтому чтения в atomic() не
+# оборачиваются, ATOMIC_REQUESTS не включается, а в atomic() остаётся только
+# путь записи.
+# По умолчанию (SQLITE_PROFILE=default) настройки SQLite не меняются: иначе
+# любой запуск manage.py (check, makemigrations --check) переводил бы файл БД
+# в WAL. Проверка профиля: manage.py stress_sqlite и SQLiteConcurrencyTests
+# (без ошибок «database is locked»)
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,         # мс
+    'synchronous': 'NORMAL',       # в режиме WAL безопасно: теряются только последние транзакции при сбое ОС
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,          # отрицательное значение — в КиБ (~20 МБ на соединение)
+    'temp_store': 'MEMORY',
+}
+SQLITE_CONCURRENT_SETTINGS = {
+    'OPTIONS': {
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        'transaction_mode': 'IMMEDIATE',
+    },
+    'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+    'CONN_HEALTH_CHECKS': True,
+}
+if SQLITE_PROFILE == 'concurrent':
+    DATABASES['default'].update(SQLITE_CONCURRENT_SETTINGS)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -148,14 +195,23 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'map.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'map.renderers.FastJSONParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
 }
 
 
+# JSON API через orjson (map/renderers.py); без orjson или при False —
+# стандартные JSONRenderer/JSONParser DRF
+API_FAST_JSON = True
+
+
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'
 USE_I18N = True
@@ -170,18 +226,92 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Сырые файлы фоновых загрузок до обработки (см. map/image_jobs.py)
+IMAGE_JOBS_STAGING_ROOT = BASE_DIR / 'upload_jobs'
+# Задача в статусе processing без движения столько секунд считается брошенной
+# (обработчик упал) и возвращается в очередь; после IMAGE_JOBS_MAX_ATTEMPTS захватов — failed
+IMAGE_JOBS_STALE_TIMEOUT = 600
+IMAGE_JOBS_MAX_ATTEMPTS = 3
+
+# Хранить изображения точек по хешу содержимого: одинаковые файлы
+# сохраняются один раз и делятся между точками (см. map/blobs.py).
+# Включается явно (POINT_IMAGE_CONTENT_ADDRESSED=1): меняется место хранения
+# новых файлов. Уже загруженные файлы переносятся командой
+# manage.py dedupe_point_images (сначала с --dry-run)
+POINT_IMAGE_CONTENT_ADDRESSED = os.environ.get('POINT_IMAGE_CONTENT_ADDRESSED', '0') == '1'
+
+# Отдавать маршруты в list/retrieve через values() без ModelSerializer
+# (см. map/route_reader.py); False — прежний путь через RouteSerializer
+ROUTES_FAST_READ = True
+
+# Кэш ответов list/retrieve маршрутов с версией на пользователя (map/route_cache.py).
+# По умолчанию — память процесса; если воркеров несколько, кэш должен быть общим:
+# ROUTES_CACHE_DIR включает файловый кэш в этом каталоге
+ROUTES_RESPONSE_CACHE = os.environ.get('ROUTES_RESPONSE_CACHE', '1') == '1'
+ROUTES_CACHE_ALIAS = 'routes'
+ROUTES_CACHE_TIMEOUT = int(os.environ.get('ROUTES_CACHE_TIMEOUT', '300'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'routes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'routes',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+if os.environ.get('ROUTES_CACHE_DIR'):
+    CACHES['routes'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['ROUTES_CACHE_DIR'],
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+
+# Поток событий изменений маршрутов /api/events/ (map/route_events.py):
+# memory — в пределах процесса (один воркер ASGI); database — через таблицу
+# RouteEvent для нескольких воркеров, с опросом раз в ROUTE_EVENTS_POLL_INTERVAL с
+ROUTE_EVENTS_BACKEND = os.environ.get('ROUTE_EVENTS_BACKEND', 'memory')
+ROUTE_EVENTS_POLL_INTERVAL = float(os.environ.get('ROUTE_EVENTS_POLL_INTERVAL', '0.5'))
+ROUTE_EVENTS_RETENTION = 3600
+ROUTE_EVENTS_HEARTBEAT = 15
+
 FILE_UPLOAD_MAX_MEMORY_SIZE = 30 * 1024 * 1024
 DATA_UPLOAD_MAX_MEMORY_SIZE = 30 * 1024 * 1024
 FILE_UPLOAD_PERMISSIONS = 0o644
 
+# Под ASGI: сколько тела запроса держать в памяти, остальное — во временном
+# файле, запись в который идёт вне цикла событий (map/asgi.py)
+ASGI_BODY_MEMORY_SIZE = int(os.environ.get('ASGI_BODY_MEMORY_SIZE', 256 * 1024))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Логи пишутся через очередь в фоновом потоке (map/log_handlers.py).
+# MAP_LOG_LEVEL=DEBUG включает подробности загрузки изображений;
+# MAP_LOG_SAMPLE_RATE < 1 оставляет долю записей DEBUG/INFO логгеров map.*
+# (WARNING и выше не отбрасываются)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            '()': 'map.log_handlers.StructuredFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+        },
+    },
+    'filters': {
+        'map_sampling': {
+            '()': 'map.log_handlers.SamplingFilter',
+            'rate': float(os.environ.get('MAP_LOG_SAMPLE_RATE', '1.0')),
+            'max_level': 'INFO',
+            'loggers': ['map'],
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'map.log_handlers.BackgroundQueueHandler',
+            'formatter': 'structured',
+            'filters': ['map_sampling'],
         },
     },
     'root': {
@@ -194,9 +324,15 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'map': {
+            'handlers': ['console'],
+            'level': os.environ.get('MAP_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
     },
 }
 
 os.makedirs(STATIC_ROOT, exist_ok=True)
 os.makedirs(MEDIA_ROOT, exist_ok=True)
+os.makedirs(IMAGE_JOBS_STAGING_ROOT, exist_ok=True)
 os.makedirs(BASE_DIR / 'static', exist_ok=True)
\ No newline at end of file
@@ -3,11 +3,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
-from map.api_views import RouteViewSet, PointViewSet
+from map.api_views import RouteViewSet, PointViewSet, ImageUploadJobViewSet
 
 router = DefaultRouter()
 router.register(r'routes', RouteViewSet)
 router.register(r'points', PointViewSet)
+router.register(r'image-jobs', ImageUploadJobViewSet, basename='image-job')
 
 urlpatterns = [
     path('admin/', admin.site.urls),